@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark reading the space group of structure factor CIF files.
+
+Compare the streaming mmCIF reader with the previous path (cif2mtz, then
+reading the space group from the converted MTZ file). The previous path is
+only measured when CCP4 is configured.
+
+Run from an environment where contaminer is installed, or from the
+repository root with PYTHONPATH=.:
+    python benchmarks/bench_cif_symmetry.py [--reflections 100000 1000000]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from contaminer.ccp4 import Cif2Mtz
+from contaminer.mmcif import read_symmetry
+from contaminer.mtz import MtzFile
+
+HEADER = """data_rbenchsf
+#
+_cell.entry_id      bench
+_cell.length_a      34.520
+_cell.length_b      45.100
+_cell.length_c      56.700
+_cell.angle_alpha   90.000
+_cell.angle_beta    101.20
+_cell.angle_gamma   90.000
+#
+_symmetry.entry_id               bench
+_symmetry.space_group_name_H-M   'P 1 21 1'
+_symmetry.Int_Tables_number      4
+#
+loop_
+_refln.crystal_id
+_refln.wavelength_id
+_refln.scale_group_code
+_refln.index_h
+_refln.index_k
+_refln.index_l
+_refln.status
+_refln.F_meas_au
+_refln.F_meas_sigma_au
+"""
+
+
+def write_cif(file_path, nb_reflections):
+    """Write a structure factor CIF file with nb_reflections."""
+    rand = random.Random(0)
+    with open(file_path, 'w') as cif_file:
+        cif_file.write(HEADER)
+        for index in range(nb_reflections):
+            cif_file.write("1 1 1 %d %d %d o %.1f %.1f\n" % (
+                index % 40 - 20, index // 40 % 40, index // 1600,
+                rand.uniform(10, 500), rand.uniform(1, 10)))
+
+
+def time_streaming(cif_path):
+    """Return the time to read the space group with the mmCIF reader."""
+    start = time.perf_counter()
+    space_group = read_symmetry(cif_path).space_group
+    duration = time.perf_counter() - start
+    assert space_group == "P 1 21 1"
+    return duration
+
+
+def time_cif2mtz(cif_path):
+    """Return the time of cif2mtz and MTZ reading, or None without CCP4."""
+    start = time.perf_counter()
+    try:
+        cif2mtz = Cif2Mtz(cif_path)
+        cif2mtz.run()
+    except RuntimeError:
+        return None
+    MtzFile(cif2mtz.get_output_file()).space_group
+    return time.perf_counter() - start
+
+
+def main():
+    """Run the benchmark and print a table of timings."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--reflections', type=int, nargs='+',
+                        default=[10000, 100000, 1000000])
+    options = parser.parse_args()
+
+    print("%12s %10s %14s %14s" % ("reflections", "size (MB)",
+                                   "streaming (s)", "cif2mtz (s)"))
+    for nb_reflections in options.reflections:
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cif_path = os.path.join(temp_dir, "bench-sf.cif")
+            write_cif(cif_path, nb_reflections)
+            size = os.path.getsize(cif_path) / 1e6
+            streaming = time_streaming(cif_path)
+            cif2mtz = time_cif2mtz(cif_path)
+        finally:
+            shutil.rmtree(temp_dir)
+        print("%12s %10.1f %14.5f %14s" % (
+            nb_reflections, size, streaming,
+            "%.3f" % cif2mtz if cif2mtz is not None else "n/a"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark TasksManager.compile_results against the number of jobs.
+
+A fake prep directory is filled with copies of the morda_solve results from
+the test data, then the results are compiled with a single process and with
+a pool of workers.
+
+Run from an environment where contaminer is installed, or from the
+repository root with PYTHONPATH=.:
+    python benchmarks/bench_compile_results.py [--jobs 100 1000 10000]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from contaminer import args_manager
+from contaminer.runner import available_cpus
+
+TEST_DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    "contaminer", "tests", "data")
+
+
+def make_prep_dir(nb_jobs):
+    """
+    Create a prep directory with nb_jobs complete tasks.
+
+    Return
+    ------
+    string
+        Path to the created directory.
+
+    list(dict)
+        The jobs for the TasksManager.
+
+    """
+    prep_dir = tempfile.mkdtemp()
+    source = os.path.join(TEST_DATA_DIR, "B4SL31_1_P-1-21-1",
+                          "morda_solve.xml")
+    jobs = []
+    for pack_number in range(1, nb_jobs + 1):
+        res_dir = os.path.join(prep_dir, "B4SL31_%s_P-1-21-1" % pack_number)
+        os.mkdir(res_dir)
+        shutil.copyfile(source, os.path.join(res_dir, "morda_solve.xml"))
+        jobs.append({
+            'infos': {
+                'model_name': 'B4SL31',
+                'is_AF_model': False,
+                'is_custom_model': False
+            },
+            'args': {
+                'input_file': 'input.mtz',
+                'model_dir': 'B4SL31/models',
+                'pack_number': pack_number,
+                'space_group': 'P 1 21 1'
+            },
+            'results': None,
+            'status': 'new'
+        })
+    return prep_dir, jobs
+
+
+def time_compile(jobs, max_workers):
+    """Return the time to compile the given jobs with max_workers."""
+    manager = args_manager.TasksManager()
+    manager.jobs = [dict(job) for job in jobs]
+    start = time.perf_counter()
+    manager.compile_results(max_workers=max_workers)
+    duration = time.perf_counter() - start
+    assert manager.complete
+    return duration
+
+
+def main():
+    """Run the benchmark and print a table of timings."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--jobs', type=int, nargs='+',
+                        default=[100, 1000, 5000, 20000])
+    parser.add_argument('--workers', type=int, default=available_cpus())
+    options = parser.parse_args()
+
+    orig_dir = os.getcwd()
+    print("%8s %12s %12s %8s" % ("jobs", "serial (s)",
+                                 "%s workers (s)" % options.workers,
+                                 "speedup"))
+    for nb_jobs in options.jobs:
+        prep_dir, jobs = make_prep_dir(nb_jobs)
+        os.chdir(prep_dir)
+        try:
+            serial = time_compile(jobs, 1)
+            parallel = time_compile(jobs, options.workers)
+        finally:
+            os.chdir(orig_dir)
+            shutil.rmtree(prep_dir)
+        print("%8s %12.3f %12.3f %8.2f" % (nb_jobs, serial, parallel,
+                                           serial / parallel))
+
+
+if __name__ == "__main__":
+    main()
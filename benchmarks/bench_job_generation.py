@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark the generation of the jobs of a solve on the whole ContaBase.
+
+A ContaBase is faked in a temporary directory (an nbpacks file for each
+model). The generation used before the ContaBase index (contabase.yaml parsed
+at each call, contaminants found with a linear search, one nbpacks file read
+per model) is compared with TasksManager._generate_jobs, with the index.
+
+Run from an environment where contaminer is installed, or from the
+repository root with PYTHONPATH=.:
+    python benchmarks/bench_job_generation.py [--repeat 20]
+"""
+
+import argparse
+from importlib import resources
+import os
+import tempfile
+import time
+from unittest import mock
+import yaml
+
+from contaminer import config
+from contaminer import data as contaminer_data
+from contaminer.args_manager import TasksManager
+from contaminer.hit_rates import HitRates
+from contaminer.hit_rates import sort_jobs
+
+SPACE_GROUPS = ["P 1 21 1", "P 1 1 21", "P 21 1 1", "P 1 2 1"]
+
+
+def make_contabase(contabase_dir):
+    """Write an nbpacks file for each model, and return the uniprot IDs."""
+    contabase_yaml = yaml.safe_load(
+        resources.read_text(contaminer_data, "contabase.yaml"))['contabase']
+    models = []
+    for category in contabase_yaml:
+        for contaminant in category['contaminants']:
+            models.append(contaminant['uniprot_id'])
+            model_names = [contaminant['uniprot_id']]
+            if contaminant['alpha_fold']:
+                model_names.append("AF_" + contaminant['uniprot_id'])
+            for model_name in model_names:
+                model_dir = os.path.join(contabase_dir, model_name)
+                os.makedirs(model_dir, exist_ok=True)
+                with open(os.path.join(model_dir, "nbpacks"), 'w') \
+                        as pack_file:
+                    pack_file.write("4\n")
+    return models
+
+
+def yaml_generate(models):
+    """The job generation as done before the ContaBase index."""
+    contabase_yaml = yaml.safe_load(
+        resources.read_text(contaminer_data, "contabase.yaml"))['contabase']
+    contaminants = []
+    for category in contabase_yaml:
+        contaminants.extend(category['contaminants'])
+
+    jobs = []
+    for model in models:
+        contaminant = [item for item in contaminants
+                       if item['uniprot_id'] == model][0]
+        pack_path = os.path.join(config.CONTABASE_DIR, model, 'nbpacks')
+        with open(pack_path) as pack_file:
+            nb_packs = int(pack_file.read())
+        for pack_number in range(1, nb_packs + 1):
+            for space_group in SPACE_GROUPS:
+                jobs.append({
+                    'infos': {'model_name': model, 'is_AF_model': False,
+                              'is_custom_model': False},
+                    'args': {
+                        'input_file': "input.mtz",
+                        'model_dir': os.path.join(
+                            config.CONTABASE_DIR, model, 'models'),
+                        'pack_number': pack_number,
+                        'space_group': space_group},
+                    'results': None,
+                    'status': 'new'})
+        if contaminant['alpha_fold']:
+            for space_group in SPACE_GROUPS:
+                jobs.append({
+                    'infos': {'model_name': model, 'is_AF_model': True,
+                              'is_custom_model': False},
+                    'args': {
+                        'input_file': "input.mtz",
+                        'model_dir': os.path.join(
+                            config.CONTABASE_DIR, "AF_" + model, 'models'),
+                        'pack_number': 1,
+                        'space_group': space_group},
+                    'results': None,
+                    'status': 'new'})
+
+    hit_rates = HitRates()
+    hit_rates.load(config.HIT_RATES_PATH)
+    return sort_jobs(jobs, contaminants, hit_rates)
+
+
+def index_generate(models):
+    """The job generation of TasksManager, with the ContaBase index."""
+    manager = TasksManager()
+    manager._generate_jobs("input.mtz", models, SPACE_GROUPS)
+    return manager.jobs
+
+
+def time_calls(function, models, repeat):
+    """Return the mean duration of a call, in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(models)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    """Run the benchmark and print a table of timings."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as contabase_dir, \
+            mock.patch.object(config, 'CONTABASE_DIR', contabase_dir), \
+            mock.patch.object(config, 'HIT_RATES_PATH', os.path.join(
+                contabase_dir, "hit_rates.json")):
+        all_models = make_contabase(contabase_dir)
+        assert yaml_generate(all_models) == index_generate(all_models)
+
+        print("%8s %8s %12s %12s" % ("models", "jobs", "yaml (ms)",
+                                     "index (ms)"))
+        for models in [all_models[:1], all_models]:
+            print("%8d %8d %12.2f %12.2f" % (
+                len(models), len(index_generate(models)),
+                time_calls(yaml_generate, models, options.repeat),
+                time_calls(index_generate, models, options.repeat)))
+
+
+if __name__ == "__main__":
+    main()
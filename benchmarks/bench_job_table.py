@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark the memory and load time of the tasks of large jobs.
+
+A tasks.json file with N synthetic jobs (spread over the ContaBase models,
+packs and space groups, 1% of them complete) is loaded as a list of dicts
+(TasksManager.load) and as a JobTable (TasksManager.load(compact=True)). The
+memory is the size of the loaded jobs, measured with tracemalloc, and the
+peak includes the parsing.
+
+Run from an environment where contaminer is installed, or from the
+repository root with PYTHONPATH=.:
+    python benchmarks/bench_job_table.py [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from contaminer.args_manager import TasksManager
+
+SPACE_GROUPS = ["P 1 21 1", "P 1", "P 2 2 2", "P 21 21 21", "C 1 2 1",
+                "P 31 2 1", "P 32 2 1", "P 41 21 2"]
+
+
+def write_tasks(file_path, nb_jobs):
+    """Write a tasks.json file with nb_jobs synthetic jobs."""
+    nb_models = max(1, nb_jobs // (4 * len(SPACE_GROUPS)))
+
+    def get_job(rank):
+        model = rank // (4 * len(SPACE_GROUPS)) % nb_models
+        complete = rank % 100 == 0
+        return {
+            'infos': {
+                'model_name': "P%05d" % model,
+                'is_AF_model': rank % 5 == 0,
+                'is_custom_model': False
+            },
+            'args': {
+                'input_file': "dataset.mtz",
+                'model_dir': "/data/contabase/P%05d/models" % model,
+                'pack_number': rank // len(SPACE_GROUPS) % 4 + 1,
+                'space_group': SPACE_GROUPS[rank % len(SPACE_GROUPS)]
+            },
+            'results': {
+                'q_factor': 0.5, 'percent': 10.0, 'Z_score': 1.0,
+                'r_init': 0.5, 'rf_init': 0.5, 'r_fin': 0.5, 'rf_fin': 0.5,
+                'available_final': False
+            } if complete else None,
+            'status': "complete" if complete else "new"
+        }
+
+    with open(file_path, 'w') as tasks_file:
+        tasks_file.write('{"jobs": [')
+        tasks_file.write(", ".join(json.dumps(get_job(rank))
+                                   for rank in range(nb_jobs)))
+        tasks_file.write(']}')
+
+
+def measure(file_path, compact):
+    """Return the load time, memory and peak memory (MiB) of a load."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    manager = TasksManager()
+    manager.load(file_path, compact=compact)
+    duration = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del manager
+    return duration, current / 1024**2, peak / 1024**2
+
+
+def main():
+    """Run the benchmark and print a table of timings and memory."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 1000000])
+    options = parser.parse_args()
+
+    print("%9s %7s %10s %12s %12s" % ("jobs", "layout", "load (s)",
+                                      "memory (MiB)", "peak (MiB)"))
+    for nb_jobs in options.sizes:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "tasks.json")
+            write_tasks(file_path, nb_jobs)
+            for layout, compact in [("dicts", False), ("table", True)]:
+                duration, memory, peak = measure(file_path, compact)
+                print("%9d %7s %10.3f %12.1f %12.1f" % (
+                    nb_jobs, layout, duration, memory, peak))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark the map engines against the number of reflections.
+
+A final.mtz file with random map coefficients in P 1 21 1 is converted with
+the NumPy engine (FftMtz2Map) and with sftools (Mtz2Map). sftools is only
+measured when CCP4 is configured; both maps are then compared on the same
+grid, or by their RMS if the grids differ.
+
+Run from an environment where contaminer is installed, or from the
+repository root with PYTHONPATH=.:
+    python benchmarks/bench_map_engine.py [--resolutions 3.0 2.0 1.5]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy
+
+from contaminer.ccp4 import Mtz2Map
+from contaminer.density import FftMtz2Map
+from contaminer.density import read_ccp4_map
+from contaminer.tests.test_mtz import write_mtz
+
+CELL = (60.0, 70.0, 80.0, 90.0, 100.0, 90.0)
+OPERATORS = ("X,Y,Z", "-X,Y+1/2,-Z")
+COLUMNS = [('H', 'H'), ('K', 'H'), ('L', 'H'),
+           ('FWT', 'F'), ('PHWT', 'P'), ('DELFWT', 'F'), ('PHDELWT', 'P')]
+
+
+def write_final_mtz(file_path, resolution):
+    """
+    Write a final.mtz with the P 1 21 1 reflections up to resolution.
+
+    Return
+    ------
+    integer
+        Number of reflections.
+
+    """
+    max_indices = [int(length / resolution) + 1 for length in CELL[:3]]
+    hkl = numpy.stack(numpy.meshgrid(
+        *[numpy.arange(-index, index + 1) for index in max_indices],
+        indexing='ij'), axis=-1).reshape(-1, 3)
+    h, k, l = hkl.T
+    # Asymmetric unit of P 1 21 1 with its Friedel mates.
+    hkl = hkl[(k >= 0) & ((l > 0) | ((l == 0) & (h >= 0)))]
+
+    a, b, c, _, beta, _ = CELL
+    beta = numpy.radians(beta)
+    h, k, l = hkl.T.astype(float)
+    inv_d2 = (h**2 / a**2 + l**2 / c**2
+              - 2 * h * l * numpy.cos(beta) / (a * c)) \
+        / numpy.sin(beta)**2 + k**2 / b**2
+    hkl = hkl[(inv_d2 > 0) & (inv_d2 <= 1 / resolution**2)]
+
+    rand = numpy.random.RandomState(0)
+    nb_reflections = len(hkl)
+    phases = rand.uniform(0, 360, (2, nb_reflections))
+    # Reflections of the h0l plane are centric.
+    centric = hkl[:, 1] == 0
+    phases[:, centric] = 180 * rand.randint(0, 2, (2, centric.sum()))
+    data = numpy.column_stack([
+        hkl,
+        rand.exponential(100, nb_reflections), phases[0],
+        rand.exponential(20, nb_reflections), phases[1],
+    ])
+    write_mtz(file_path, COLUMNS, data, cell=CELL,
+              symmetry_operators=OPERATORS)
+    return nb_reflections
+
+
+def time_engine(engine, mtz_path):
+    """Return the time of the conversion and the maps, or None on failure."""
+    start = time.perf_counter()
+    try:
+        converter = engine(mtz_path)
+        converter.run()
+    except RuntimeError:
+        return None, None
+    duration = time.perf_counter() - start
+    maps = [read_ccp4_map(path)[0] for path in converter.get_output_files()]
+    for path in converter.get_output_files():
+        os.rename(path, path + "." + engine.__name__)
+    return duration, maps
+
+
+def compare(numpy_maps, sftools_maps):
+    """Return a short comparison of the maps of both engines."""
+    if sftools_maps is None:
+        return "n/a"
+    comparisons = []
+    for numpy_map, sftools_map in zip(numpy_maps, sftools_maps):
+        if numpy_map.shape == sftools_map.shape:
+            correlation = numpy.corrcoef(numpy_map.ravel(),
+                                         sftools_map.ravel())[0, 1]
+            comparisons.append("cc %.5f" % correlation)
+        else:
+            comparisons.append("rms ratio %.3f" % (
+                numpy_map.std() / sftools_map.std()))
+    return ", ".join(comparisons)
+
+
+def main():
+    """Run the benchmark and print a table of timings."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--resolutions', type=float, nargs='+',
+                        default=[3.0, 2.0, 1.5])
+    options = parser.parse_args()
+
+    print("%10s %12s %10s %12s  %s" % ("resol (A)", "reflections",
+                                      "numpy (s)", "sftools (s)",
+                                      "map, diff map"))
+    for resolution in options.resolutions:
+        temp_dir = tempfile.mkdtemp()
+        try:
+            mtz_path = os.path.join(temp_dir, "final.mtz")
+            nb_reflections = write_final_mtz(mtz_path, resolution)
+            numpy_time, numpy_maps = time_engine(FftMtz2Map, mtz_path)
+            sftools_time, sftools_maps = time_engine(Mtz2Map, mtz_path)
+        finally:
+            shutil.rmtree(temp_dir)
+        print("%10.2f %12d %10.3f %12s  %s" % (
+            resolution, nb_reflections, numpy_time,
+            "%.3f" % sftools_time if sftools_time is not None else "n/a",
+            compare(numpy_maps, sftools_maps)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark the startup of the solving tasks.
+
+Each element of the scheduler array starts a Python process. The import time
+of the modules, given by `python -X importtime`, and the wall time of the
+process are measured for the full command line (argh and contaminer.
+contaminer, as used before contaminer.worker) and for the worker entry point.
+The heavy optional modules imported by each of them are listed.
+
+Run from an environment where contaminer is installed, or from the
+repository root with PYTHONPATH=.:
+    python benchmarks/bench_startup.py [--repeat 10]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ENTRY_POINTS = [
+    ("cli", "import argh; import contaminer.contaminer"),
+    ("worker", "import contaminer.worker"),
+]
+HEAVY_MODULES = ("argh", "Bio", "numpy", "yaml")
+
+
+def measure(statement, home_dir):
+    """Return the import time and wall time (ms) of a new process."""
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        stderr=subprocess.PIPE, check=True, universal_newlines=True,
+        env=dict(os.environ, HOME=home_dir))
+    wall_time = (time.perf_counter() - start) * 1000
+
+    # Lines are "import time: self | cumulative | name", with the name
+    # indented by its depth. Top level imports are not indented.
+    import_time = 0
+    for line in process.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and not fields[2].startswith("  ") \
+                and fields[1].strip().isdigit():
+            import_time += int(fields[1])
+    return import_time / 1000, wall_time
+
+
+def get_heavy_modules(statement, home_dir):
+    """Return the heavy modules imported by a statement."""
+    process = subprocess.run(
+        [sys.executable, "-c",
+         statement + "; import sys; print(' '.join(sorted(set("
+         "name.split('.')[0] for name in sys.modules))))"],
+        stdout=subprocess.PIPE, check=True, universal_newlines=True,
+        env=dict(os.environ, HOME=home_dir))
+    return [name for name in process.stdout.split()
+            if name in HEAVY_MODULES]
+
+
+def main():
+    """Run the benchmark and print a table of timings."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=10)
+    options = parser.parse_args()
+
+    print("%8s %12s %12s  %s" % ("entry", "import (ms)", "wall (ms)",
+                                 "heavy modules"))
+    with tempfile.TemporaryDirectory() as home_dir:
+        for name, statement in ENTRY_POINTS:
+            # Warm up the bytecode cache.
+            measure(statement, home_dir)
+            timings = [measure(statement, home_dir)
+                       for _ in range(options.repeat)]
+            print("%8s %12.1f %12.1f  %s" % (
+                name,
+                statistics.median(timing[0] for timing in timings),
+                statistics.median(timing[1] for timing in timings),
+                " ".join(get_heavy_modules(statement, home_dir)) or "-"))
+
+
+if __name__ == "__main__":
+    main()
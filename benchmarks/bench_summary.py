@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark show-job --summary on synthetic result sets.
+
+The per-model rescan used by show-job before (a pass over all the jobs for
+each contaminant, and a pairwise comparison of the tasks) is compared with
+contaminer.summary.summarize_jobs, on jobs as list of dicts and as JobTable.
+
+Run from an environment where contaminer is installed, or from the
+repository root with PYTHONPATH=.:
+    python benchmarks/bench_summary.py [--jobs 100000] [--models 50 500]
+"""
+
+import argparse
+import random
+import time
+
+from contaminer.job_table import JobTable
+from contaminer.summary import summarize_jobs
+
+
+def make_jobs(nb_jobs, nb_models, seed=0):
+    """Return synthetic jobs, 80% complete."""
+    rand = random.Random(seed)
+    jobs = []
+    for rank in range(nb_jobs):
+        complete = rand.random() < 0.8
+        jobs.append({
+            'infos': {
+                'model_name': "P%05d" % (rank * nb_models // nb_jobs),
+                'is_AF_model': False,
+                'is_custom_model': False
+            },
+            'args': {
+                'input_file': "dataset.mtz",
+                'model_dir': "/data/contabase/models",
+                'pack_number': 1,
+                'space_group': "P 1"
+            },
+            'results': {
+                'percent': float(rand.randrange(100)),
+                'q_factor': rand.random()
+            } if complete else None,
+            'status': "complete" if complete else "new"
+        })
+    return jobs
+
+
+def rescan_summary(jobs):
+    """The summary as computed by show-job before summarize_jobs."""
+    summary = []
+    model_names = list(set(job['infos']['model_name'] for job in jobs))
+    for model_name in model_names:
+        tasks = [job for job in jobs
+                 if job['infos']['model_name'] == model_name]
+        best_task = None
+        for task in tasks:
+            if task['status'] != 'complete':
+                continue
+            if best_task is None:
+                best_task = task
+            elif task['results']['percent'] > best_task['results']['percent']:
+                best_task = task
+            elif task['results']['percent'] \
+                    == best_task['results']['percent'] \
+                    and task['results']['q_factor'] \
+                    > best_task['results']['q_factor']:
+                best_task = task
+        summary.append(best_task)
+    return summary
+
+
+def time_call(function, *args):
+    """Return the duration of a call, in seconds."""
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    """Run the benchmark and print a table of timings."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--jobs', type=int, default=100000)
+    parser.add_argument('--models', type=int, nargs='+', default=[50, 500])
+    options = parser.parse_args()
+
+    print("%8s %8s %12s %12s %12s" % ("jobs", "models", "rescan (s)",
+                                      "dicts (s)", "table (s)"))
+    for nb_models in options.models:
+        jobs = make_jobs(options.jobs, nb_models)
+        table = JobTable.from_jobs(jobs)
+        print("%8d %8d %12.3f %12.3f %12.3f" % (
+            options.jobs, nb_models,
+            time_call(rescan_summary, jobs),
+            time_call(summarize_jobs, jobs),
+            time_call(summarize_jobs, table)))
+
+
+if __name__ == "__main__":
+    main()
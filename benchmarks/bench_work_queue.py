@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark the makespan of static ranks against the work queue.
+
+Tasks sleep for skewed durations: most tasks are short, and a few (like the
+P 1 tasks of large contaminants) are much longer. The same tasks run on the
+same number of workers:
+- static: worker w runs the ranks w, w + N, w + 2N... as fixed chunks do;
+- queue: workers claim the next task from a contaminer.work_queue.WorkQueue.
+
+Run from an environment where contaminer is installed, or from the
+repository root with PYTHONPATH=.:
+    python benchmarks/bench_work_queue.py [--tasks 120] [--workers 4 8]
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import shutil
+import tempfile
+import time
+
+import numpy
+
+from contaminer.work_queue import WorkQueue
+
+
+def get_durations(nb_tasks, scale, seed=0):
+    """Return skewed task durations, in seconds."""
+    rand = numpy.random.RandomState(seed)
+    durations = rand.lognormal(0, 0.5, nb_tasks)
+    # One task in ten is ten times longer.
+    durations[rand.rand(nb_tasks) < 0.1] *= 10
+    return durations * scale
+
+
+def _run_static(durations, worker, nb_workers):
+    """Run the ranks of a worker, as with static chunks."""
+    for rank in range(worker, len(durations), nb_workers):
+        time.sleep(durations[rank])
+
+
+def _run_queue(durations, prep_dir):
+    """Run the tasks claimed from the queue until it is empty."""
+    WorkQueue(prep_dir).work(lambda rank: time.sleep(durations[rank]))
+
+
+def time_static(durations, nb_workers):
+    """Return the makespan with static ranks."""
+    start = time.perf_counter()
+    with ProcessPoolExecutor(nb_workers) as executor:
+        list(executor.map(_run_static, [durations] * nb_workers,
+                          range(nb_workers), [nb_workers] * nb_workers))
+    return time.perf_counter() - start
+
+
+def time_queue(durations, nb_workers):
+    """Return the makespan with the work queue."""
+    prep_dir = tempfile.mkdtemp()
+    try:
+        WorkQueue(prep_dir).populate(range(len(durations)))
+        start = time.perf_counter()
+        with ProcessPoolExecutor(nb_workers) as executor:
+            list(executor.map(_run_queue, [durations] * nb_workers,
+                              [prep_dir] * nb_workers))
+        return time.perf_counter() - start
+    finally:
+        shutil.rmtree(prep_dir)
+
+
+def main():
+    """Run the benchmark and print a table of makespans."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=120)
+    parser.add_argument('--workers', type=int, nargs='+', default=[4, 8])
+    parser.add_argument('--scale', type=float, default=0.02,
+                        help="Median task duration, in seconds.")
+    options = parser.parse_args()
+
+    durations = get_durations(options.tasks, options.scale)
+    print("%8s %10s %10s %10s %8s" % ("workers", "bound (s)", "static (s)",
+                                      "queue (s)", "speedup"))
+    for nb_workers in options.workers:
+        bound = max(durations.sum() / nb_workers, durations.max())
+        static = time_static(durations, nb_workers)
+        queue = time_queue(durations, nb_workers)
+        print("%8d %10.3f %10.3f %10.3f %8.2f" % (
+            nb_workers, bound, static, queue, static / queue))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Cache the analysis of diffraction files between submissions.
+
+The same dataset is often submitted several times with different
+contaminants. The analysis of the input file (space group, cell and
+alternative space groups) is stored in a cache shared by all the prep
+directories, keyed by the SHA-256 of the file content.
+
+The cache is a directory with one small JSON file per dataset. The least
+recently used entries are removed when the cache grows over its size limit.
+
+Classes
+-------
+AnalysisCache
+    On-disk cache of dataset analyses.
+
+Functions
+---------
+hash_file
+    Return the SHA-256 hex digest of a file.
+
+get_analysis_cache
+    Return the analysis cache configured by the user.
+
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+from contaminer import config
+
+LOG = logging.getLogger(__name__)
+
+
+def hash_file(file_path):
+    """Return the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as hashed_file:
+        for block in iter(lambda: hashed_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class AnalysisCache():
+    """
+    On-disk cache of dataset analyses, with LRU eviction.
+
+    The modification time of an entry is updated each time it is read, and
+    used as last access time for eviction.
+
+    Attributes
+    ----------
+    cache_dir: string
+        Directory holding the entries.
+
+    max_size: integer
+        Maximum total size of the entries, in bytes.
+
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _get_entry_path(self, file_hash):
+        """Return the path to the entry for file_hash."""
+        return os.path.join(self.cache_dir, file_hash + ".json")
+
+    def get(self, file_hash):
+        """
+        Return the cached analysis for a file.
+
+        Parameters
+        ----------
+        file_hash: string
+            SHA-256 of the diffraction file.
+
+        Return
+        ------
+        dict
+            The analysis, or None if the file is not in the cache.
+
+        """
+        entry_path = self._get_entry_path(file_hash)
+        try:
+            with open(entry_path, 'r') as entry_file:
+                analysis = json.loads(entry_file.read())
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            return None
+
+        LOG.debug("Analysis of %s found in cache.", file_hash)
+        return analysis
+
+    def put(self, file_hash, analysis):
+        """
+        Store the analysis of a file, and evict old entries if needed.
+
+        Failing to write the cache is not an error, as it only makes the next
+        submission slower.
+
+        """
+        entry_path = self._get_entry_path(file_hash)
+        temp_path = "%s.%s.tmp" % (entry_path, os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, 'w') as entry_file:
+                entry_file.write(json.dumps(analysis))
+            os.replace(temp_path, entry_path)
+        except OSError as err:
+            LOG.warning("Cannot write analysis cache %s: %s.",
+                        entry_path, err)
+            return
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries over the size limit."""
+        entries = []
+        total_size = 0
+        with os.scandir(self.cache_dir) as scanned:
+            for entry in scanned:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # Evicted by another process.
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            LOG.debug("Evict %s from analysis cache.", path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+
+def get_analysis_cache():
+    """Return the analysis cache configured by the user."""
+    return AnalysisCache(config.ANALYSIS_CACHE_DIR,
+                         config.ANALYSIS_CACHE_SIZE_MB * 1024 * 1024)
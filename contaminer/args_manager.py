@@ -7,28 +7,355 @@ TasksManager
     Use this class to create the list of arguments, get the parameters for
     a job, ...
 
+CompileState
+    Remember which result directories have already been read.
+
 """
 
+# The process pool is only loaded by the commands using it.
+import concurrent.futures
 import copy
-from importlib import resources
 import json
 import logging
 import os
-import yaml
-
-from Bio import SeqIO
+import time
 
 from contaminer import config
-from contaminer import data as contaminer_data
 from contaminer.ccp4 import AltSgList
-from contaminer.ccp4 import Cif2Mtz
 from contaminer.ccp4 import MordaPrep
 from contaminer.ccp4 import MordaSolve
-from contaminer.ccp4 import Mtz2Map
-from contaminer.ccp4 import MtzDmp
+from contaminer.early_stop import SCOPE_OFF
+from contaminer.early_stop import EarlyStop
+from contaminer.early_stop import get_early_stop
+from contaminer.environment import get_tool_environment
+from contaminer.job_table import JobTable
+from contaminer.runner import ToolError
+from contaminer.runner import available_cpus
+from contaminer.runner import get_default_runner
 
 LOG = logging.getLogger(__name__)
 
+# Below this number of jobs to compile, starting a pool costs more than it
+# saves.
+MIN_JOBS_PER_WORKER = 64
+# Number of jobs compiled before they are given by TasksManager.iter_compiled.
+COMPILE_BATCH = 4096
+# Statuses of the jobs which are done.
+FINAL_STATUSES = ("complete", "skipped", "failed")
+# Layouts of the ranks in the chunks of TasksManager.run_chunk.
+CHUNK_CONTIGUOUS = "contiguous"
+CHUNK_STRIDED = "strided"
+# Written in the result directory when a job ends. See TasksManager.run.
+RESULT_SIDECAR = "result.json"
+# Characters read at once by _iter_json_jobs.
+READ_BUFFER_SIZE = 65536
+
+
+def _add_final_paths(results, res_dir):
+    """Add the availability and location of final.mtz to the results."""
+    results['available_final'] = False
+    final_mtz_path = os.path.join(res_dir, "final.mtz")
+    if os.path.exists(final_mtz_path):
+        results['available_final'] = True
+        results['final_dir'] = os.path.abspath(res_dir)
+    return results
+
+
+def write_result_sidecar(res_dir, sidecar):
+    """
+    Write the result sidecar of a job, atomically.
+
+    Parameters
+    ----------
+    res_dir: string
+        The result directory of the job.
+
+    sidecar: dict
+        status ("complete" or "failed"), exit_status, error, start, duration
+        and results of the job.
+
+    """
+    os.makedirs(res_dir, exist_ok=True)
+    sidecar_path = os.path.join(res_dir, RESULT_SIDECAR)
+    temp_path = "%s.%s.tmp" % (sidecar_path, os.getpid())
+    with open(temp_path, 'w') as sidecar_file:
+        sidecar_file.write(json.dumps(sidecar))
+    os.replace(temp_path, sidecar_path)
+
+
+def read_result_sidecar(res_dir):
+    """Return the result sidecar of a job, or None if there is none."""
+    try:
+        with open(os.path.join(res_dir, RESULT_SIDECAR), 'r') as sidecar_file:
+            return json.loads(sidecar_file.read())
+    except FileNotFoundError:
+        return None
+
+
+def _update_stored_job(tasks_path, rank, sidecar):
+    """
+    Update the row of a job from its result sidecar, in a JobStore.
+
+    Rows of a JobStore can be updated concurrently by the tasks. A failed job
+    gets its exit status and error as results, as in _compile_job. Nothing
+    is done for tasks.json, which is only updated by the compilation.
+
+    """
+    from contaminer.job_store import JobStore
+    from contaminer.job_store import is_store_path
+
+    if not is_store_path(tasks_path):
+        return
+
+    if sidecar['status'] == "complete":
+        results = sidecar['results']
+    else:
+        results = {
+            'exit_status': sidecar['exit_status'],
+            'error': sidecar['error'],
+        }
+    with JobStore(tasks_path) as store:
+        store.update_job(rank, sidecar['status'], results)
+
+
+def _compile_job(args):
+    """
+    Read the results of a single job.
+
+    The result sidecar written by the task is used when available, and
+    morda_solve.xml is parsed otherwise (jobs run by older versions, or
+    failed tasks). A failed task without morda_solve.xml is failed, with the
+    exit status and error of its sidecar as results.
+
+    This function runs in the worker processes of
+    TasksManager.compile_results, so it must stay at module level.
+
+    Parameters
+    ----------
+    args: dict
+        The arguments of the job, as given to MordaSolve.
+
+    Return
+    ------
+    string
+        The new status of the job.
+
+    dict
+        The results of the job, or None if the job is not complete.
+
+    """
+    mrds = MordaSolve(**args)
+    sidecar = read_result_sidecar(mrds.res_dir)
+    if sidecar is not None and sidecar['status'] == "complete":
+        return "complete", sidecar['results']
+
+    try:
+        results = mrds.get_results()
+    except FileNotFoundError:
+        if sidecar is not None and sidecar['status'] == "failed":
+            return "failed", {
+                'exit_status': sidecar['exit_status'],
+                'error': sidecar['error'],
+            }
+        return "running", None
+    finally:
+        mrds.cleanup()
+
+    return "complete", _add_final_paths(results, mrds.res_dir)
+
+
+def get_tasks_path(prep_dir):
+    """
+    Return the path to the tasks file of a prep directory.
+
+    The JobStore is used if the prep directory has one, tasks.json otherwise.
+
+    """
+    store_path = os.path.join(prep_dir, config.JOB_STORE_FILENAME)
+    if os.path.exists(store_path):
+        return store_path
+    return os.path.join(prep_dir, config.ARGS_FILENAME)
+
+
+def _iter_json_jobs(file_path):
+    """
+    Yield the jobs of a tasks.json file, parsed one at a time.
+
+    Only a job and a read buffer are in memory, whatever the size of the
+    file.
+
+    Raises
+    ------
+    RuntimeError
+        If the file is not a tasks.json document.
+
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r') as tasks_file:
+        buffer = ""
+        while "[" not in buffer:
+            data = tasks_file.read(READ_BUFFER_SIZE)
+            if not data:
+                raise RuntimeError("No jobs in %s." % file_path)
+            buffer += data
+        position = buffer.index("[") + 1
+
+        while True:
+            while position < len(buffer) and buffer[position] in ", \n\t\r":
+                position += 1
+            if position == len(buffer) or buffer[position] == "{":
+                # A job is only decoded once it is fully in the buffer.
+                try:
+                    job, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    data = tasks_file.read(READ_BUFFER_SIZE)
+                    if not data:
+                        raise RuntimeError("Truncated %s." % file_path)
+                    buffer = buffer[position:] + data
+                    position = 0
+                    continue
+                yield job
+            elif buffer[position] == "]":
+                return
+            else:
+                raise RuntimeError("Unexpected content in %s." % file_path)
+
+
+def get_chunk_ranks(nb_jobs, chunk, chunk_size, layout=CHUNK_STRIDED):
+    """
+    Return the ranks of the jobs run by an array element.
+
+    Parameters
+    ----------
+    nb_jobs: integer
+        Total number of jobs.
+
+    chunk: integer
+        Index of the array element.
+
+    chunk_size: integer
+        Maximum number of jobs per array element.
+
+    layout: string
+        CHUNK_CONTIGUOUS gives consecutive ranks to each element.
+        CHUNK_STRIDED gives every nb_chunks-th rank, so each element starts
+        with the most probable contaminants.
+
+    Return
+    ------
+    list(integer)
+        The ranks of the jobs.
+
+    """
+    nb_chunks = get_nb_chunks(nb_jobs, chunk_size)
+    if layout == CHUNK_CONTIGUOUS:
+        return list(range(chunk * chunk_size,
+                          min((chunk + 1) * chunk_size, nb_jobs)))
+    if layout == CHUNK_STRIDED:
+        return list(range(chunk, nb_jobs, nb_chunks))
+    raise ValueError("Unknown chunk layout: %s." % layout)
+
+
+def get_nb_chunks(nb_jobs, chunk_size):
+    """Return the number of array elements to run nb_jobs."""
+    return -(-nb_jobs // chunk_size)
+
+
+def _run_job(prep_dir, rank):
+    """
+    Run a single job.
+
+    This function runs in the worker processes of TasksManager.run_chunk, so
+    it must stay at module level.
+
+    """
+    TasksManager().run(prep_dir, rank)
+
+
+class CompileState():
+    """
+    Remember the state of the result directories at the last compilation.
+
+    For each result directory, the state contains a fingerprint (modification
+    time of the directory, modification time and size of morda_solve.xml) and
+    the status found when the directory was last read. A job whose directory
+    did not change since then does not need to be read again.
+
+    Attributes
+    ----------
+    entries: dict
+        Fingerprint and status for each result directory.
+
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    @staticmethod
+    def get_fingerprint(res_dir):
+        """
+        Return the fingerprint of a result directory.
+
+        Parameters
+        ----------
+        res_dir: string
+            Path to the result directory of a job.
+
+        Return
+        ------
+        list
+            The fingerprint, or None if the directory does not exist.
+
+        """
+        try:
+            dir_stat = os.stat(res_dir)
+        except FileNotFoundError:
+            return None
+
+        try:
+            xml_stat = os.stat(os.path.join(res_dir, "morda_solve.xml"))
+        except FileNotFoundError:
+            return [dir_stat.st_mtime_ns, None, None]
+
+        return [dir_stat.st_mtime_ns, xml_stat.st_mtime_ns, xml_stat.st_size]
+
+    def is_unchanged(self, res_dir, fingerprint):
+        """Return True if res_dir has the same fingerprint as last time."""
+        entry = self.entries.get(res_dir)
+        return entry is not None and entry['fingerprint'] == fingerprint
+
+    def update(self, res_dir, fingerprint, status):
+        """Store the fingerprint of res_dir and the status found in it."""
+        self.entries[res_dir] = {
+            'fingerprint': fingerprint,
+            'status': status
+        }
+
+    def save(self, save_filepath):
+        """
+        Save the state in a file.
+
+        Warning
+        -------
+        This method is NOT thread-safe.
+
+        """
+        LOG.debug("Save compile state to %s.", save_filepath)
+        with open(save_filepath, 'w') as save_file:
+            save_file.write(json.dumps({'entries': self.entries}))
+
+    def load(self, save_filepath):
+        """Load the state from a file. A missing file gives an empty state."""
+        LOG.debug("Load compile state from %s.", save_filepath)
+        try:
+            with open(save_filepath, 'r') as save_file:
+                data = json.loads(save_file.read())
+        except FileNotFoundError:
+            self.entries = {}
+            return
+
+        self.entries = data['entries']
+
 
 class TasksManager():
     """
@@ -39,6 +366,10 @@ class TasksManager():
     complete: boolean
         True if all tasks are all complete.
 
+    changed_ranks: set(integer)
+        Ranks of the jobs whose status changed since they were loaded or
+        saved. Only these jobs are written by TasksManager.save_changed.
+
     Warning
     -------
     TasksManager.save is NOT thread-safe. It should be used only in the master
@@ -53,36 +384,16 @@ class TasksManager():
         #   * is_AF_model: true if the task uses an AlphaFold model
         # * args: arguments to give as is to MordaSolve
         # * results: Dictionnary of results from MordaSolve (None is no result
-        # is available.
-        # * status: can be new, running or complete.
+        # is available. For failed tasks, the exit_status and error of the
+        # task.
+        # * status: can be new, running, complete, failed or skipped (stopped
+        # after a contaminant has been identified, see
+        # contaminer.early_stop).
         self.jobs = []
+        self.changed_ranks = set()
 
     @staticmethod
-    def _get_nb_packs(model):
-        """
-        Get the number of packs available for the model.
-
-        Parameters
-        ----------
-        model: string
-            The PDB ID of the prepared model.
-
-        Return
-        ------
-        int
-            The number of packs available for this model.
-
-        """
-        pack_file_path = os.path.join(config.CONTABASE_DIR, model, 'nbpacks')
-        with open(pack_file_path) as pack_file:
-            str_nb_packs = pack_file.read()
-
-        nb_packs = int(str_nb_packs)
-        LOG.debug("Get %s packs for model %s.", nb_packs, model)
-        return nb_packs
-
-    @staticmethod
-    def _prepare_custom_dir(parent_dir, custom_file):
+    def _create_custom_dir(parent_dir, custom_file):
         """
         Create the directory to use a user-provided PDB model.
 
@@ -96,10 +407,17 @@ class TasksManager():
 
         Return
         ------
+        MordaPrep
+            The morda_prep task to run to fill in the directory.
+
         string
-            The absolute path to the created model directory.
+            The absolute path to the models directory.
 
         """
+        # Biopython takes longer to import than a solve-task to start, and is
+        # only needed for custom models.
+        from Bio import SeqIO
+
         custom_name = os.path.splitext(os.path.basename(custom_file))[0]
         # Extract sequence
         with open(custom_file, 'r') as pdb_file:
@@ -114,15 +432,57 @@ class TasksManager():
         model_dir = os.path.join(parent_dir, custom_name)
         os.mkdir(model_dir)
 
-        # Launch morda_prep
+        # Prepare morda_prep
         morda_prep = MordaPrep(
             custom_fasta,
             model_dir,
             1,
             custom_file)
-        morda_prep.run()
 
-        return os.path.join(model_dir, "models")
+        return morda_prep, os.path.join(model_dir, "models")
+
+    @staticmethod
+    def _prepare_custom_dirs(parent_dir, custom_files):
+        """
+        Create the directories to use user-provided PDB models.
+
+        morda_prep is run concurrently for all the models.
+
+        Parameters
+        ----------
+        parent_dir: string
+            Absolute path to the working directory.
+
+        custom_files: list(string)
+            Absolute paths to the user-provided PDB models.
+
+        Return
+        ------
+        dict
+            The absolute path to the models directory for each custom file.
+
+        """
+        morda_preps = []
+        model_dirs = {}
+        for custom_file in custom_files:
+            if not os.path.isfile(custom_file):
+                raise FileNotFoundError(custom_file)
+            morda_prep, model_dirs[custom_file] = \
+                TasksManager._create_custom_dir(parent_dir, custom_file)
+            morda_preps.append(morda_prep)
+
+        runner = get_default_runner()
+        outcomes = runner.run_many([
+            morda_prep.run_async(runner)
+            for morda_prep in morda_preps
+        ])
+        for morda_prep in morda_preps:
+            morda_prep.cleanup()
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                raise outcome
+
+        return model_dirs
 
     def create(self, input_file, models=None):
         """
@@ -140,33 +500,111 @@ class TasksManager():
 
         """
         LOG.info("Create arguments for %s, %s.", input_file, models)
-        # Have an MTZ file to get the space group. If the input_file is already
-        # in MTZ format, this step does nothing.
-        cif2mtz_task = Cif2Mtz(input_file)
-        cif2mtz_task.run()
-        mtz_file = cif2mtz_task.get_output_file()
-        LOG.debug("mtz_file: %s.", mtz_file)
-
-        # Get space group.
-        mtz_dmp_task = MtzDmp(mtz_file)
-        mtz_dmp_task.run()
-        input_space_group = mtz_dmp_task.get_space_group()
-        LOG.debug("Input space group: %s.", input_space_group)
-
-        # Get alternate space groups.
-        alt_sg_task = AltSgList(input_space_group)
-        alt_sg_task.run()
-        alt_space_groups = alt_sg_task.get_alt_space_groups()
-        LOG.debug("Alt space groups: %s.", alt_space_groups)
-
-        self._generate_jobs(input_file, models, alt_space_groups)
+        analysis = self._analyse(input_file)
+        LOG.debug("Input space group: %s.", analysis['space_group'])
+        LOG.debug("Alt space groups: %s.", analysis['alt_space_groups'])
+
+        self._generate_jobs(input_file, models, analysis['alt_space_groups'])
+
+    def _analyse(self, input_file):
+        """
+        Return the analysis of the input file, from the cache if possible.
+
+        Parameters
+        ----------
+        input_file: string
+            Path to the MTZ or mmCIF file.
+
+        Return
+        ------
+        dict
+            space_group, cell and alt_space_groups of the input file.
+
+        """
+        # The job generation helpers are only needed by solve, not by the
+        # tasks: see contaminer.worker.
+        from contaminer.analysis_cache import get_analysis_cache
+        from contaminer.analysis_cache import hash_file
+        from contaminer.space_groups import get_alt_space_groups
+
+        cache = get_analysis_cache()
+        file_hash = hash_file(input_file)
+        analysis = cache.get(file_hash)
+        if analysis is not None:
+            LOG.info("Analysis of %s found in cache.", input_file)
+            return analysis
+
+        space_group, cell = self._read_symmetry(input_file)
+        try:
+            alt_space_groups = get_alt_space_groups(space_group)
+        except ValueError:
+            # The table only has the standard settings (and a few common
+            # ones): alt_sg_list knows the others, like I 1 2 1.
+            LOG.info("%s is not in the space group table, use alt_sg_list.",
+                     space_group)
+            alt_space_groups = self._run_alt_sg_list(space_group)
+        analysis = {
+            'space_group': space_group,
+            'cell': list(cell) if cell else None,
+            'alt_space_groups': alt_space_groups,
+        }
+        cache.put(file_hash, analysis)
+        return analysis
+
+    @staticmethod
+    def _run_alt_sg_list(space_group):
+        """Return the alternative space groups given by alt_sg_list."""
+        alt_sg_task = AltSgList(space_group)
+        try:
+            alt_sg_task.run()
+            return alt_sg_task.get_alt_space_groups()
+        finally:
+            alt_sg_task.cleanup()
+
+    @staticmethod
+    def _read_symmetry(input_file):
+        """
+        Return the space group and cell of an MTZ or mmCIF file.
+
+        Parameters
+        ----------
+        input_file: string
+            Path to the MTZ or mmCIF file.
+
+        Return
+        ------
+        string
+            The space group, space " " separated.
+
+        tuple(float)
+            The cell, or None if the file does not define it.
+
+        """
+        _, ext = os.path.splitext(input_file)
+        if ext.lower() == ".mtz":
+            # Imported here, as NumPy is not needed to run the tasks.
+            from contaminer.mtz import MtzFile
+            mtz_file = MtzFile(input_file)
+            return mtz_file.space_group, mtz_file.cell
+
+        from contaminer.mmcif import read_symmetry
+        from contaminer.space_groups import normalize_space_group
+
+        symmetry = read_symmetry(input_file)
+        if symmetry.space_group:
+            return symmetry.space_group, symmetry.cell
+        if symmetry.space_group_number:
+            return (normalize_space_group(symmetry.space_group_number),
+                    symmetry.cell)
+        raise RuntimeError("No space group found in %s." % input_file)
 
     def _generate_jobs(self, input_file, models, alt_space_groups):
         """
         Generate job items for given parameters and store them in self.jobs.
 
         This method does the same thing as TasksManager.create, but takes the
-        list of alternative space groups as additional argument.
+        list of alternative space groups as additional argument. The jobs are
+        ordered by probability of success, see contaminer.hit_rates.
 
         input_file: string
             The path to the input file to give as is to morda_solve.
@@ -181,13 +619,16 @@ class TasksManager():
             from the input_file.
 
         """
-        # Load ContaBase as flat list of contaminants.
-        contabase_yaml = yaml.safe_load(
-            resources.read_text(contaminer_data, "contabase.yaml")
-        )['contabase']
-        contaminants = []
-        for category in contabase_yaml:
-            contaminants.extend(category['contaminants'])
+        from contaminer.contabase_index import get_contabase_index
+        from contaminer.hit_rates import HitRates
+        from contaminer.hit_rates import sort_jobs
+
+        contabase_index = get_contabase_index()
+
+        # Prepare all custom models at once.
+        custom_model_dirs = self._prepare_custom_dirs(
+            os.getcwd(),
+            [model for model in models if ".pdb" in model])
 
         # Build arguments list.
         self.jobs = []
@@ -196,24 +637,25 @@ class TasksManager():
                 self._generate_args_for_custom(
                     input_file,
                     model,
-                    alt_space_groups
+                    alt_space_groups,
+                    custom_model_dirs[model]
                 )
             else:
-                # Get contaminant information from ContaBase.
-                contaminant = [
-                    item
-                    for item in contaminants
-                    if item['uniprot_id'] == model
-                ][0]
-
                 self._generate_jobs_for_contaminant(
                     input_file,
-                    contaminant,
+                    contabase_index,
+                    model,
                     alt_space_groups,
                 )
 
+        # Run the most probable contaminants first.
+        hit_rates = HitRates()
+        hit_rates.load(config.HIT_RATES_PATH)
+        self.jobs = sort_jobs(self.jobs, contabase_index.get_contaminants(),
+                              hit_rates)
+
     def _generate_jobs_for_contaminant(
-            self, input_file, contaminant, alt_space_groups):
+            self, input_file, contabase_index, uniprot_id, alt_space_groups):
         """
         Generate job items for a single contaminant.
 
@@ -221,22 +663,20 @@ class TasksManager():
         generates the items only for a single contaminant.
 
         """
-        # Get number of packs
-        nb_packs = self._get_nb_packs(contaminant['uniprot_id'])
+        entry = contabase_index.get(uniprot_id)
+        nb_packs = contabase_index.get_nb_packs(uniprot_id)
+        LOG.debug("Get %s packs for model %s.", nb_packs, uniprot_id)
         for pack_number in range(1, nb_packs+1):
             for alt_sg in alt_space_groups:
                 self.jobs.append({
                     'infos': {
-                        'model_name': contaminant['uniprot_id'],
+                        'model_name': uniprot_id,
                         'is_AF_model': False,
                         'is_custom_model': False
                     },
                     'args': {
                         'input_file': input_file,
-                        'model_dir': os.path.join(
-                            config.CONTABASE_DIR,
-                            contaminant['uniprot_id'],
-                            'models'),
+                        'model_dir': entry['model_dir'],
                         'pack_number': pack_number,
                         'space_group': alt_sg
                     },
@@ -245,21 +685,18 @@ class TasksManager():
                 })
 
         # If AlphaFold is available, add this as well.
-        if contaminant['alpha_fold']:
-            LOG.debug("Add AlphaFold model for %s.", contaminant['uniprot_id'])
+        if entry['alpha_fold']:
+            LOG.debug("Add AlphaFold model for %s.", uniprot_id)
             for alt_sg in alt_space_groups:
                 self.jobs.append({
                     'infos': {
-                        'model_name': contaminant['uniprot_id'],
+                        'model_name': uniprot_id,
                         'is_AF_model': True,
                         'is_custom_model': False
                     },
                     'args': {
                         'input_file': input_file,
-                        'model_dir': os.path.join(
-                            config.CONTABASE_DIR,
-                            "AF_" + contaminant['uniprot_id'],
-                            'models'),
+                        'model_dir': entry['af_model_dir'],
                         'pack_number': 1,
                         'space_group': alt_sg
                     },
@@ -267,19 +704,16 @@ class TasksManager():
                     'status': 'new'
                 })
 
-    def _generate_args_for_custom(self, input_file, model, alt_space_groups):
+    def _generate_args_for_custom(
+            self, input_file, model, alt_space_groups, model_dir):
         """
         Generate arguments for a single custom model.
 
         This method does the same thing as TasksManager._generate_args, but
-        generates the arguments only for a single custom model.
+        generates the arguments only for a single custom model, already
+        prepared in model_dir.
 
         """
-        if not os.path.isfile(model):
-            raise FileNotFoundError(model)
-
-        # Custom model
-        model_dir = self._prepare_custom_dir(os.getcwd(), model)
         for alt_sg in alt_space_groups:
             self.jobs.append({
                 'infos': {
@@ -314,6 +748,8 @@ class TasksManager():
             The list of arguments for morda_solve.
 
         """
+        if isinstance(self.jobs, JobTable):
+            return self.jobs.get_arguments(rank)
         return copy.deepcopy(self.jobs[rank]['args'])
 
     def save(self, save_filepath):
@@ -333,13 +769,63 @@ class TasksManager():
         writing the save file.
 
         """
+        from contaminer.job_store import JobStore
+        from contaminer.job_store import is_store_path
+
         LOG.debug("Save arguments to %s.", save_filepath)
+        if is_store_path(save_filepath):
+            with JobStore(save_filepath) as store:
+                store.write_jobs(self.jobs)
+            return
+
+        if isinstance(self.jobs, JobTable):
+            self.jobs.save(save_filepath)
+            return
 
         data = {'jobs': self.jobs}
         with open(save_filepath, 'w') as save_file:
             save_file.write(json.dumps(data))
 
-    def load(self, save_filepath):
+    def save_changed(self, save_filepath):
+        """
+        Save the jobs whose status changed since they were loaded or saved.
+
+        A JobStore only updates the rows of these jobs, and never changes a
+        row which is already complete: its task may have updated it since the
+        jobs were loaded. The JSON file is fully rewritten, if at least one job
+        changed.
+
+        """
+        from contaminer.job_store import JobStore
+        from contaminer.job_store import is_store_path
+
+        if self.changed_ranks and is_store_path(save_filepath):
+            LOG.debug("Save %s changed jobs to %s.",
+                      len(self.changed_ranks), save_filepath)
+            with JobStore(save_filepath) as store:
+                store.write_jobs(self.jobs, sorted(self.changed_ranks))
+        elif self.changed_ranks:
+            self.save(save_filepath)
+        self.changed_ranks = set()
+
+    def save_job(self, save_filepath, rank):
+        """
+        Save a single job.
+
+        A JobStore only updates the row of the job, the JSON file is fully
+        rewritten.
+
+        """
+        from contaminer.job_store import JobStore
+        from contaminer.job_store import is_store_path
+
+        if is_store_path(save_filepath):
+            with JobStore(save_filepath) as store:
+                store.write_jobs(self.jobs, [rank])
+        else:
+            self.save(save_filepath)
+
+    def load(self, save_filepath, compact=False):
         """
         Load a list of arguments from a save file.
 
@@ -348,13 +834,137 @@ class TasksManager():
         save_filepath: string
             Path to the save file to load.
 
+        compact: boolean
+            Store the jobs in a JobTable instead of a list of dicts. Use it
+            for large jobs. See contaminer.job_table.
+
         """
+        from contaminer.job_store import JobStore
+        from contaminer.job_store import is_store_path
+
         LOG.debug("Load arguments from %s.", save_filepath)
+        self.changed_ranks = set()
+        if is_store_path(save_filepath):
+            with JobStore(save_filepath) as store:
+                self.jobs = store.read_jobs()
+            if compact:
+                self.jobs = JobTable.from_jobs(self.jobs)
+            return
+
+        if compact:
+            self.jobs = JobTable.load(save_filepath)
+            return
+
         with open(save_filepath, 'r') as save_file:
             data = json.loads(save_file.read())
 
         self.jobs = data['jobs']
 
+    @staticmethod
+    def load_job(save_filepath, rank):
+        """
+        Return a single job from a save file.
+
+        A JobStore only reads the row of the job.
+
+        """
+        from contaminer.job_store import JobStore
+        from contaminer.job_store import is_store_path
+
+        if is_store_path(save_filepath):
+            with JobStore(save_filepath) as store:
+                return store.read_job(rank)
+
+        return JobTable.load(save_filepath).get_job(rank)
+
+    @staticmethod
+    def iter_jobs(save_filepath):
+        """
+        Yield the rank and job of each job of a save file, one at a time.
+
+        Unlike load, the jobs are never all in memory.
+
+        """
+        from contaminer.job_store import JobStore
+        from contaminer.job_store import is_store_path
+
+        if is_store_path(save_filepath):
+            with JobStore(save_filepath) as store:
+                yield from store.iter_jobs()
+            return
+
+        yield from enumerate(_iter_json_jobs(save_filepath))
+
+    @staticmethod
+    def stream_compiled(save_filepath):
+        """
+        Compile the jobs of a save file, and yield them one at a time.
+
+        Same as iter_compiled, in constant memory: the jobs are read with
+        iter_jobs and compiled one at a time in this process, without the
+        compile state. The changed jobs are saved as they are compiled: a
+        JobStore gets their rows by batches of COMPILE_BATCH, and the JSON
+        file is replaced once all the jobs have been yielded (if at least one
+        job changed).
+
+        Yields
+        ------
+        integer
+            The rank of the job.
+
+        dict
+            The compiled job.
+
+        """
+        from contaminer.job_store import JobStore
+        from contaminer.job_store import is_store_path
+
+        if is_store_path(save_filepath):
+            changed = {}
+            with JobStore(save_filepath) as store:
+                try:
+                    for rank, job in TasksManager.iter_jobs(save_filepath):
+                        if TasksManager._compile_saved_job(job):
+                            changed[rank] = job
+                        yield rank, job
+                        if len(changed) >= COMPILE_BATCH:
+                            store.write_jobs(changed, list(changed))
+                            changed = {}
+                finally:
+                    store.write_jobs(changed, list(changed))
+            return
+
+        temp_path = "%s.%s.tmp" % (save_filepath, os.getpid())
+        is_changed = False
+        try:
+            with open(temp_path, 'w') as temp_file:
+                # Same document as save.
+                temp_file.write('{"jobs": [')
+                for rank, job in TasksManager.iter_jobs(save_filepath):
+                    if TasksManager._compile_saved_job(job):
+                        is_changed = True
+                    temp_file.write((", " if rank else "") + json.dumps(job))
+                    yield rank, job
+                temp_file.write("]}")
+            if is_changed:
+                os.replace(temp_path, save_filepath)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def _compile_saved_job(job):
+        """Compile a job in place, and return True if its status changed."""
+        if job['status'] == "complete":
+            return False
+
+        status = job['status']
+        job['status'], results = _compile_job(job['args'])
+        if results is not None:
+            job['results'] = results
+        TasksManager._skip_stopped_jobs([job])
+        return job['status'] != status
+
     def run(self, prep_dir, rank):
         """
         Start the process of given rank.
@@ -371,56 +981,317 @@ class TasksManager():
         os.chdir(prep_dir)
 
         # Load args.
-        tasks_manager = TasksManager()
-        tasks_manager.load(config.ARGS_FILENAME)
+        tasks_path = get_tasks_path(".")
+        job = self.load_job(tasks_path, rank)
+        arguments = copy.deepcopy(job['args'])
+        model_name = job['infos']['model_name']
 
-        arguments = tasks_manager.get_arguments(rank)
+        early_stop = get_early_stop(prep_dir)
+        if early_stop.is_stopped(model_name):
+            LOG.info("%s already identified. Skip task %s.", model_name, rank)
+            return
 
         mrds = MordaSolve(**arguments)
-        mrds.run()
+        sidecar = {
+            'rank': rank,
+            'model_name': model_name,
+            'status': "failed",
+            'exit_status': 0,
+            'error': None,
+            'start': time.time(),
+            'results': None,
+        }
+        start = time.perf_counter()
+        try:
+            if early_stop.scope == SCOPE_OFF:
+                mrds.run()
+            elif not early_stop.run(mrds, model_name):
+                return
+        except ToolError as err:
+            sidecar['exit_status'] = err.returncode
+            sidecar['error'] = str(err)
+            sidecar['duration'] = time.perf_counter() - start
+            write_result_sidecar(mrds.res_dir, sidecar)
+            _update_stored_job(tasks_path, rank, sidecar)
+            raise
+        finally:
+            mrds.cleanup()
+        sidecar['duration'] = time.perf_counter() - start
+
+        # Parse the results while they are in the cache of this node, so the
+        # compilation only gathers the sidecars.
+        try:
+            results = mrds.get_results()
+        except (OSError, RuntimeError) as err:
+            LOG.warning("No results for %s: %s", mrds.res_dir, err)
+            sidecar['error'] = str(err)
+            write_result_sidecar(mrds.res_dir, sidecar)
+            _update_stored_job(tasks_path, rank, sidecar)
+            return
+        sidecar['status'] = "complete"
+        sidecar['results'] = _add_final_paths(results, mrds.res_dir)
+        write_result_sidecar(mrds.res_dir, sidecar)
+
+        # Stop the other tasks before generating the maps.
+        hit = early_stop.record_hit(model_name, rank, results['percent'],
+                                    cancel=False)
+
+        # Maps are only worth generating in advance for likely hits. The
+        # other ones are generated on demand.
+        final_mtz_path = os.path.join(mrds.res_dir, "final.mtz")
+        if os.path.exists(final_mtz_path) \
+                and results['percent'] >= config.MAP_PERCENT_THRESHOLD:
+            # Imported here, as most tasks do not need NumPy.
+            from contaminer.maps import make_maps
+            make_maps(final_mtz_path)
+
+        _update_stored_job(tasks_path, rank, sidecar)
+
+        # Last, as the cancel command may also cancel this task.
+        if hit:
+            early_stop.cancel()
+
+    def run_chunk(self, prep_dir, ranks, max_workers=None):
+        """
+        Run several jobs in a pool of local processes.
+
+        Used to run a chunk of jobs in each element of the scheduler array,
+        instead of a single one.
+
+        Parameters
+        ----------
+        prep_dir: string
+            Path to the directory generated during the prepare step.
+
+        ranks: list(integer)
+            The ranks of the jobs to run.
+
+        max_workers: integer
+            Number of jobs running at the same time. Defaults to the number of
+            available CPUs.
 
-    def compile_results(self):
+        Raises
+        ------
+        RuntimeError
+            If at least one job failed. The other jobs run anyway.
+
+        """
+        if max_workers is None:
+            max_workers = available_cpus()
+        max_workers = max(1, min(max_workers, len(ranks)))
+        LOG.info("Run %s jobs with %s workers.", len(ranks), max_workers)
+
+        # Load the tool environment once, before the workers are forked.
+        get_tool_environment()
+
+        failed = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+            futures = {
+                rank: executor.submit(_run_job, prep_dir, rank)
+                for rank in ranks
+            }
+            for rank, future in futures.items():
+                try:
+                    future.result()
+                except Exception as err:  # pylint: disable=broad-except
+                    LOG.error("Job %s failed: %s", rank, err)
+                    failed.append(rank)
+
+        if failed:
+            raise RuntimeError("%s of %s jobs failed: %s."
+                               % (len(failed), len(ranks), failed))
+
+    def compile_results(self, max_workers=None, state_filepath=None):
         """
         Read results of all task instances, and compile the complete ones.
 
+        The results are read in a pool of worker processes, and merged back
+        into self.jobs in the order of the jobs.
+
+        Parameters
+        ----------
+        max_workers: integer
+            Number of worker processes. Defaults to compile_workers in the
+            user configuration, or to the number of available CPUs.
+
+        state_filepath: string
+            Path to the compile state file. If given, jobs whose result
+            directory did not change since the last compilation are skipped,
+            and the state file is updated.
+
         Warning
         -------
         This method is NOT thread-safe.
 
         """
-        for job in self.jobs:
-            if not job['status'] == "complete":
-                mrds = MordaSolve(**job['args'])
-                try:
-                    results = mrds.get_results()
-                except FileNotFoundError:
-                    job['status'] = "running"
-                    continue
-                finally:
-                    mrds.cleanup()
+        for _ in self.iter_compiled(max_workers, state_filepath):
+            pass
+
+    def iter_compiled(self, max_workers=None, state_filepath=None):
+        """
+        Compile the results, and yield the jobs as soon as they are compiled.
 
-                results['available_final'] = False
-                final_mtz_path = os.path.join(mrds.res_dir, "final.mtz")
-                if os.path.exists(final_mtz_path):
-                    map_converter = Mtz2Map(final_mtz_path)
-                    map_converter.run()
-                    results['available_final'] = True
-                    results['final_dir'] = os.path.abspath(mrds.res_dir)
+        The jobs are compiled by batches of COMPILE_BATCH, so the first jobs
+        are available before the whole job is compiled. Take the same
+        parameters as compile_results. The compile state file is only updated
+        once all the jobs have been yielded.
 
+        Yields
+        ------
+        integer
+            The rank of the job.
+
+        dict
+            The compiled job.
+
+        """
+        if max_workers is None:
+            max_workers = config.COMPILE_WORKERS or available_cpus()
+
+        state = None
+        if state_filepath:
+            state = CompileState()
+            state.load(state_filepath)
+
+        executor = None
+        try:
+            for start in range(0, len(self.jobs), COMPILE_BATCH):
+                ranks = range(start, min(start + COMPILE_BATCH,
+                                         len(self.jobs)))
+                executor = self._compile_batch(ranks, state, max_workers,
+                                               executor)
+                for rank in ranks:
+                    yield rank, self.jobs[rank]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if state:
+            state.save(state_filepath)
+
+    def _compile_batch(self, ranks, state, max_workers, executor):
+        """
+        Compile the jobs of ranks.
+
+        The pool is started on the first batch with enough jobs to compile,
+        and given back to be used for the next batches.
+
+        Return
+        ------
+        concurrent.futures.ProcessPoolExecutor
+            The pool of workers, or None if it has not been started yet.
+
+        """
+        pending = []
+        fingerprints = []
+        statuses = {}
+        for index in ranks:
+            job = self.jobs[index]
+            if job['status'] == "complete":
+                continue
+            statuses[index] = job['status']
+
+            if state:
+                res_dir = MordaSolve(**job['args']).res_dir
+                fingerprint = CompileState.get_fingerprint(res_dir)
+                if state.is_unchanged(res_dir, fingerprint):
+                    continue
+                fingerprints.append((res_dir, fingerprint))
+
+            pending.append(index)
+        pending_args = [self.jobs[index]['args'] for index in pending]
+        LOG.debug("%s jobs to compile.", len(pending))
+
+        # Do not start more workers than useful.
+        nb_workers = min(max_workers, len(pending) // MIN_JOBS_PER_WORKER)
+        if executor is None and nb_workers > 1:
+            LOG.debug("Compile with %s workers.", nb_workers)
+            executor = concurrent.futures.ProcessPoolExecutor(nb_workers)
+        if executor is not None and len(pending) >= MIN_JOBS_PER_WORKER:
+            chunksize = max(1, len(pending) // (max_workers * 4))
+            compiled = list(executor.map(
+                _compile_job, pending_args, chunksize=chunksize))
+        else:
+            compiled = [_compile_job(args) for args in pending_args]
+
+        for index, (status, results) in zip(pending, compiled):
+            job = self.jobs[index]
+            job['status'] = status
+            if results is not None:
                 job['results'] = results
-                job['status'] = "complete"
+
+        self._skip_stopped_jobs(self.jobs[index] for index in ranks)
+        self.changed_ranks.update(
+            index for index, status in statuses.items()
+            if self.jobs[index]['status'] != status)
+
+        if state:
+            for (res_dir, fingerprint), (status, _) in zip(
+                    fingerprints, compiled):
+                state.update(res_dir, fingerprint, status)
+
+        return executor
+
+    def update_job(self, rank):
+        """
+        Read the results of a single job.
+
+        Used to update a job as soon as it ends, without compiling all the
+        results.
+
+        Parameters
+        ----------
+        rank: integer
+            The rank of the job.
+
+        """
+        job = self.jobs[rank]
+        job['status'], results = _compile_job(job['args'])
+        if results is not None:
+            job['results'] = results
+        self._skip_stopped_jobs([job])
+
+    @staticmethod
+    def _skip_stopped_jobs(jobs):
+        """
+        Give the skipped status to the stopped jobs without results.
+
+        Tasks stopped after a contaminant has been identified will never have
+        results.
+
+        """
+        early_stop = EarlyStop(".")
+        for job in jobs:
+            if job['status'] in ("new", "running") \
+                    and early_stop.is_stopped(job['infos']['model_name']):
+                job['status'] = "skipped"
 
     @property
     def complete(self):
-        """Return True if all Tasks are complete. False otherwise."""
-        return all([job['status'] == "complete" for job in self.jobs])
+        """Return True if all Tasks are complete, skipped or failed."""
+        return all([job['status'] in FINAL_STATUSES for job in self.jobs])
+
+    @property
+    def nb_skipped(self):
+        """Return the number of tasks skipped after an early stop."""
+        return len([job for job in self.jobs if job['status'] == "skipped"])
+
+    def get_failed(self):
+        """Return the rank and results of the failed tasks."""
+        return [(rank, job['results'])
+                for rank, job in enumerate(self.jobs)
+                if job['status'] == "failed"]
 
     def display_progress(self):
         """Print the task progress."""
         total = len(self.jobs)
-        done = len([job for job in self.jobs if job['status'] == "complete"])
+        done = len([job for job in self.jobs
+                    if job['status'] in FINAL_STATUSES])
 
-        print("%s/%s" % (done, total))
+        if self.nb_skipped:
+            print("%s/%s (%s skipped)" % (done, total, self.nb_skipped))
+        else:
+            print("%s/%s" % (done, total))
 
     @property
     def nb_jobs(self):
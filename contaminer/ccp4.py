@@ -1,31 +1,100 @@
 """
 Provide wrappers for CCP4 tools and MoRDa.
 
+All wrappers start their tool through a contaminer.runner.ToolRunner. Use
+run for a blocking call, or run_async to start many tools at once.
+
 Classes
 -------
+Tool
 Morda
 MordaPrep
 MordaSolve
+MtzDmp
+AltSgList
+Cif2Mtz
+Mtz2Map
 
 """
 
+import asyncio
 import logging
 import os
 import pathlib
 import re
-import shlex
 import shutil
-import subprocess
-import sys
 import tempfile
 from xml.etree import ElementTree
 
-from contaminer.config import CONFIG
+from contaminer.environment import get_tool_environment
+from contaminer.runner import CAPTURE_PIPE
+from contaminer.runner import get_default_runner
 
 LOG = logging.getLogger(__name__)
 
 
-class Morda():
+class Tool():
+    """
+    Base class for the wrappers of CCP4 and MoRDa tools.
+
+    Subclasses build the command line, and optionally the text to give on the
+    standard input, and process the result of the call.
+
+    Attributes
+    ----------
+    capture: string
+        Capture mode for the output of the tool. See contaminer.runner.
+
+    output: string
+        The raw output of the tool, once run.
+
+    """
+
+    capture = CAPTURE_PIPE
+
+    def _build_command(self):
+        """Return the command line to run the tool."""
+        raise NotImplementedError
+
+    def _get_input(self):
+        """Return the text to give on the standard input, or None."""
+        return None
+
+    def _process_result(self, result):
+        """Store the output of a successful call."""
+        self.output = result.stdout
+
+    async def run_async(self, runner=None):
+        """
+        Run the tool from a coroutine.
+
+        Parameters
+        ----------
+        runner: contaminer.runner.ToolRunner
+            The runner to use. Defaults to the runner shared by the process.
+
+        Raises
+        ------
+        contaminer.runner.ToolError
+            If the tool cannot be found, or fails.
+
+        """
+        if runner is None:
+            runner = get_default_runner()
+
+        result = await runner.run_async(
+            self._build_command(),
+            stdin=self._get_input(),
+            env=get_tool_environment(),
+            capture=self.capture)
+        self._process_result(result)
+
+    def run(self, runner=None):
+        """Run the tool and block until its completion."""
+        asyncio.run(self.run_async(runner))
+
+
+class Morda(Tool):
     """
     Wrapper to execute MoRDa tools.
 
@@ -56,63 +125,23 @@ class Morda():
             raise ValueError("tool can be \"solve\" or \"prep\".")
 
         self.tool = tool
-        self.args = map(str, args)
+        self.args = list(map(str, args))
         self.output = None
 
-    def run(self):
-        """Build command line and launch MoRDa with the args from init."""
-        # Build command line
-        command_line = self._build_command()
-
-        # Run MoRDa
-        LOG.debug("Run line: %s", command_line)
-        try:
-            popen = subprocess.Popen(command_line,
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE)
-        except FileNotFoundError:
-            print("Please source morda_env_sh before using ContaMiner.",
-                  file=sys.stderr)
-            raise RuntimeError("MoRDa tools cannot be found.")
-
-        stdout, stderr = popen.communicate()
-
-        LOG.debug("Return code: %s.", popen.returncode)
-        if popen.returncode != 0:
-            print("Call to morda_%s failed." % self.tool,
-                  file=sys.stderr)
-            print("-" * 50,
-                  file=sys.stderr)
-            print("Output: \n%s" % stdout.decode('UTF-8'),
-                  file=sys.stderr)
-            print("-" * 50,
-                  file=sys.stderr)
-            print("Error: \n%s" % stderr.decode('UTF-8'),
-                  file=sys.stderr)
-            print("-" * 50,
-                  file=sys.stderr)
-            raise RuntimeError("Call to morda_%s failed." % self.tool)
-
-        self.output = stdout.decode('UTF-8')
-
     def _build_command(self):
         """
-        Build command line according to config and given args.
+        Build command line according to given args.
+
+        The tool is executed directly. The CCP4 and MoRDa environment is
+        given by contaminer.environment.get_tool_environment.
 
         Return
         ------
         list(string)
-            The full command to give to the shell to run the tool.
+            The full command to run the tool.
 
         """
-        args_string = '"' + '" "'.join(self.args) + '"'
-        command_line_string = "sh -c '. %s && . %s && morda_%s %s'" % (
-            CONFIG['PATH']['ccp4'],
-            CONFIG['PATH']['morda'],
-            self.tool,
-            args_string
-        )
-        command_line = shlex.split(command_line_string)
+        command_line = ["morda_%s" % self.tool] + self.args
         LOG.debug("Command built: %s.", command_line)
         return command_line
 
@@ -176,6 +205,10 @@ class MordaSolve(Morda):
     Interface which calls the Morda wrapper with the proper arguments for
     morda_solve.
 
+    The temporary output and scratch directories are only created when the
+    command is built, so reading the results of a previous run does not touch
+    the filesystem.
+
     """
 
     def __init__(self, input_file, model_dir, pack_number, space_group):
@@ -190,12 +223,21 @@ class MordaSolve(Morda):
 
         args.extend(['-r', self.res_dir])
 
-        self._temp_dir = tempfile.mkdtemp()
-        args.extend(['-po', os.path.join(self._temp_dir, "out_dir")])
-        args.extend(['-ps', os.path.join(self._temp_dir, "scr_dir")])
+        self._temp_dir = None
 
         super().__init__("solve", *args)
 
+    def _build_command(self):
+        """Create the temporary directories, and build the command line."""
+        if self._temp_dir is None:
+            self._temp_dir = tempfile.mkdtemp()
+            self.args.extend(
+                ['-po', os.path.join(self._temp_dir, "out_dir")])
+            self.args.extend(
+                ['-ps', os.path.join(self._temp_dir, "scr_dir")])
+
+        return super()._build_command()
+
     def get_results(self):
         """
         Return the results from morda_solve.
@@ -254,12 +296,16 @@ class MordaSolve(Morda):
         return results
 
     def cleanup(self):
-        """Remove temporary directory."""
+        """Remove temporary directory, if any."""
+        if self._temp_dir is None:
+            return
+
         LOG.debug("Remove %s.", self._temp_dir)
         shutil.rmtree(self._temp_dir)
+        self._temp_dir = None
 
 
-class MtzDmp():
+class MtzDmp(Tool):
     """
     Wrapper for mtzdmp tool.
 
@@ -284,43 +330,9 @@ class MtzDmp():
         self.file_path = file_path
         self.output = None
 
-    def run(self):
-        """Run mtzdmp on an MTZ file."""
-        command_line_string = "sh -c '. %s && mtzdmp \"%s\"'" % (
-            CONFIG['PATH']['ccp4'],
-            self.file_path,
-        )
-        command_line = shlex.split(command_line_string)
-        LOG.debug("Run %s.", command_line)
-
-        try:
-            popen = subprocess.Popen(command_line,
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE)
-        except FileNotFoundError:
-            LOG.error("mtzdmp not found.")
-            print(("Please make CCP4 available in your $PATH before using "
-                   "ContaMiner."),
-                  file=sys.stderr)
-            raise RuntimeError("mtzdmp cannot be found.")
-
-        stdout, stderr = popen.communicate()
-
-        LOG.debug("Return code: %s.", popen.returncode)
-        if popen.returncode != 0:
-            print("Call to mtzdmp failed.",
-                  file=sys.stderr)
-            print("-" * 50,
-                  file=sys.stderr)
-            print("Output: \n%s" % stdout.decode('UTF-8'),
-                  file=sys.stderr)
-            print("Error: \n%s" % stderr.decode('UTF-8'),
-                  file=sys.stderr)
-            print("-" * 50,
-                  file=sys.stderr)
-            raise RuntimeError("Call to mtzdmp failed.")
-
-        self.output = stdout.decode('UTF-8')
+    def _build_command(self):
+        """Return the command to run mtzdmp on an MTZ file."""
+        return ["mtzdmp", self.file_path]
 
     def get_space_group(self):
         """
@@ -344,7 +356,7 @@ class MtzDmp():
         raise RuntimeError("No space group found in mtzdmp output.")
 
 
-class AltSgList():
+class AltSgList(Tool):
     """
     Wrapper for alt_sg_list.
 
@@ -368,52 +380,15 @@ class AltSgList():
         self.output = None
         self._temp_dir = tempfile.mkdtemp()
 
-    def run(self):
-        """Run alt_sg_list."""
+    def _build_command(self):
+        """Return the command to run alt_sg_list."""
         # Use alt_sg_list from MoRDa (CCP4 provides another version).
-        args = [
+        return [
+            "alt_sg_list",
             "-sg", self.space_group,
             "-po", self._temp_dir,
             "-ps", self._temp_dir
         ]
-        args_string = '"' + '" "'.join(args) + '"'
-
-        command_line_string = \
-            "sh -c '. %s && alt_sg_list %s'" % (
-                CONFIG['PATH']['morda'],
-                args_string,
-            )
-        command_line = shlex.split(command_line_string)
-        LOG.debug("Run %s.", command_line)
-
-        try:
-            popen = subprocess.Popen(command_line,
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE)
-        except FileNotFoundError:
-            LOG.error("alt_sg_list not found.")
-            print(("Please make CCP4 available in your $PATH before using "
-                   "ContaMiner."),
-                  file=sys.stderr)
-            raise RuntimeError("alt_sg_list cannot be found.")
-
-        stdout, stderr = popen.communicate()
-
-        LOG.debug("Return code: %s.", popen.returncode)
-        if popen.returncode != 0:
-            print("Call to alt_sg_list failed.",
-                  file=sys.stderr)
-            print("-" * 50,
-                  file=sys.stderr)
-            print("Output: \n%s" % stdout.decode('UTF-8'),
-                  file=sys.stderr)
-            print("Error: \n%s" % stderr.decode('UTF-8'),
-                  file=sys.stderr)
-            print("-" * 50,
-                  file=sys.stderr)
-            raise RuntimeError("Call to alt_sg_list failed.")
-
-        self.output = stdout.decode('UTF-8')
 
     def get_alt_space_groups(self):
         """
@@ -442,7 +417,7 @@ class AltSgList():
         shutil.rmtree(self._temp_dir)
 
 
-class Cif2Mtz():
+class Cif2Mtz(Tool):
     """
     Wrapper for cif2mtz.
 
@@ -472,8 +447,9 @@ class Cif2Mtz():
     def __init__(self, input_file):
         self.input_file = input_file
         self.output_file = None
+        self.output = None
 
-    def run(self):
+    async def run_async(self, runner=None):
         """Run cif2mtz if input file is not yet MTZ."""
         filename, ext = os.path.splitext(self.input_file)
 
@@ -483,53 +459,26 @@ class Cif2Mtz():
             return
 
         self.output_file = filename + '.mtz'
+        await super().run_async(runner)
 
-        args = [
+    def _build_command(self):
+        """Return the command to run cif2mtz."""
+        return [
+            "cif2mtz",
             "HKLIN", self.input_file,
             "HKLOUT", self.output_file
         ]
-        args_string = '"' + '" "'.join(args) + '"'
-        command_line_string = "sh -c '. %s && cif2mtz %s'" % (
-            CONFIG['PATH']['ccp4'],
-            args_string
-        )
-        command_line = shlex.split(command_line_string)
-        LOG.debug("Run %s.", command_line)
 
-        try:
-            popen = subprocess.Popen(command_line,
-                                     stdin=subprocess.PIPE,
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE)
-        except FileNotFoundError:
-            LOG.error("cif2mtz not found.")
-            print(("Please make CCP4 available in your $PATH before using "
-                   "ContaMiner."),
-                  file=sys.stderr)
-            raise RuntimeError("cif2mtz cannot be found.")
-
-        (stdout, stderr) = popen.communicate(input=b"END\n")
-
-        LOG.debug("Return code: %s.", popen.returncode)
-        if popen.returncode != 0:
-            print("Call to cif2mtz failed.",
-                  file=sys.stderr)
-            print("-" * 50,
-                  file=sys.stderr)
-            print("Output: \n%s" % stdout.decode('UTF-8'),
-                  file=sys.stderr)
-            print("Error: \n%s" % stderr.decode('UTF-8'),
-                  file=sys.stderr)
-            print("-" * 50,
-                  file=sys.stderr)
-            raise RuntimeError("Call to cif2mtz failed.")
+    def _get_input(self):
+        """Return the keywords for cif2mtz."""
+        return "END\n"
 
     def get_output_file(self):
         """Return the path to the converted file."""
         return self.output_file
 
 
-class Mtz2Map():
+class Mtz2Map(Tool):
     """
     Wrapper for sftools to convert a MTZ file into 2 MAP files.
 
@@ -556,51 +505,25 @@ class Mtz2Map():
         self.input_file = input_file
         self.output_map_file = None
         self.output_diff_file = None
+        self.output = None
 
-    def run(self):
-        """Run sftools and give the proper commands to convert to MAP."""
-        filename, ext = os.path.splitext(self.input_file)
+    def _build_command(self):
+        """Return the command to run sftools."""
+        filename, _ = os.path.splitext(self.input_file)
         self.output_map_file = filename + '.map'
         self.output_diff_file = filename + '_diff.map'
 
-        command_line_string = "sh -c '. %s && sftools'" % CONFIG['PATH']['ccp4']
-        command_line = shlex.split(command_line_string)
+        return ["sftools"]
 
+    def _get_input(self):
+        """Return the sftools commands to convert the file to MAP."""
         input_command = "read %s\n" % (self.input_file)
         input_command += "fft col FWT PHWT\n"
         input_command += "mapout %s\n" % (self.output_map_file)
         input_command += "delete map\n"
         input_command += "fft col DELFWT PHDELWT\n"
         input_command += "mapout %s\n" % (self.output_diff_file)
-
-        try:
-            popen = subprocess.Popen(command_line,
-                                     stdin=subprocess.PIPE,
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE)
-        except FileNotFoundError:
-            LOG.error("sftools not found.")
-            print(("Please make CCP4 available in your $PATH before using "
-                   "ContaMiner."),
-                  file=sys.stderr)
-            raise RuntimeError("sftools cannot be found.")
-
-        (stdout, stderr) = popen.communicate(
-            input=bytes(input_command, 'UTF-8'))
-
-        LOG.debug("Return code: %s.", popen.returncode)
-        if popen.returncode != 0:
-            print("Call to sftools failed.",
-                  file=sys.stderr)
-            print("-" * 50,
-                  file=sys.stderr)
-            print("Output: \n%s" % stdout.decode('UTF-8'),
-                  file=sys.stderr)
-            print("Error: \n%s" % stderr.decode('UTF-8'),
-                  file=sys.stderr)
-            print("-" * 50,
-                  file=sys.stderr)
-            raise RuntimeError("Call to sftools failed.")
+        return input_command
 
     def get_output_files(self):
         """
@@ -2,11 +2,8 @@
 
 import configparser
 import errno
-from importlib import resources
 import os
 
-from contaminer import data as contaminer_data
-
 
 class UserConfig():
     """
@@ -66,6 +63,10 @@ class UserConfig():
         values.
 
         """
+        # Only needed on the first run.
+        from importlib import resources
+        from contaminer import data as contaminer_data
+
         # Create directory
         try:
             os.makedirs(os.path.dirname(self.config_path))
@@ -84,6 +85,33 @@ class UserConfig():
         config['PATH']['scheduler_command'] = "bash"
         config['PATH']['contabase_dir'] = os.path.expanduser(
             "~/.contaminer/ContaBase")
+        config['PATH']['env_cache'] = os.path.expanduser(
+            "~/.contaminer/env_cache.json")
+        config['PATH']['analysis_cache_dir'] = os.path.expanduser(
+            "~/.contaminer/analysis_cache")
+        config['PATH']['cancel_command'] = ""
+        config['PATH']['hit_rates'] = os.path.expanduser(
+            "~/.contaminer/hit_rates.json")
+        config['PATH']['fetch_mirror'] = os.path.expanduser(
+            "~/.contaminer/mirror")
+        config.add_section('OPTIONS')
+        config['OPTIONS']['max_concurrent_tools'] = str(os.cpu_count() or 1)
+        config['OPTIONS']['compile_workers'] = "0"
+        config['OPTIONS']['map_percent_threshold'] = "90"
+        config['OPTIONS']['analysis_cache_size_mb'] = "16"
+        config['OPTIONS']['map_engine'] = "sftools"
+        config['OPTIONS']['early_stop'] = "off"
+        config['OPTIONS']['early_stop_percent'] = "90"
+        config['OPTIONS']['chunk_size'] = "0"
+        config['OPTIONS']['chunk_layout'] = "strided"
+        config['OPTIONS']['cpus_per_task'] = "0"
+        config['OPTIONS']['threads_per_task'] = "1"
+        config['OPTIONS']['memory_per_task_mb'] = "2048"
+        config['OPTIONS']['queue_workers'] = "0"
+        config['OPTIONS']['claim_timeout'] = "600"
+        config['OPTIONS']['job_store'] = "json"
+        config['OPTIONS']['fetch_workers'] = "8"
+        config['OPTIONS']['fetch_retries'] = "3"
 
         # Write file
         with open(self.config_path, 'w') as config_file:
@@ -95,11 +123,113 @@ class UserConfig():
               + "update the missing values.")
 
 
-CONFIG = UserConfig().load()
-ARGS_FILENAME = CONFIG['PATH']['args_filename']
-JOB_TEMPLATE_PATH = CONFIG['PATH']['job_template_path']
-SCHEDULER_COMMAND = CONFIG['PATH']['scheduler_command']
-CONTABASE_DIR = CONFIG['PATH']['contabase_dir']
+def _load_settings():
+    """Return the settings of the user config file, by name."""
+    config = UserConfig().load()
+    settings = {'CONFIG': config}
+    settings['ARGS_FILENAME'] = config['PATH']['args_filename']
+    settings['JOB_TEMPLATE_PATH'] = config['PATH']['job_template_path']
+    settings['SCHEDULER_COMMAND'] = config['PATH']['scheduler_command']
+    settings['CONTABASE_DIR'] = config['PATH']['contabase_dir']
+    # Added after the first release. Existing config files may not define it.
+    settings['ENV_CACHE_PATH'] = config['PATH'].get(
+        'env_cache',
+        os.path.expanduser("~/.contaminer/env_cache.json"))
+    settings['MAX_CONCURRENT_TOOLS'] = config.getint(
+        'OPTIONS', 'max_concurrent_tools',
+        fallback=os.cpu_count() or 1)
+    # Number of processes to compile the results. 0 means all available CPUs.
+    settings['COMPILE_WORKERS'] = config.getint(
+        'OPTIONS', 'compile_workers', fallback=0)
+    # Maps are generated right after morda_solve for tasks with at least this
+    # percent. Other maps are generated on demand.
+    settings['MAP_PERCENT_THRESHOLD'] = config.getfloat(
+        'OPTIONS', 'map_percent_threshold', fallback=90)
+    # Compute maps with "sftools", or in-process with "numpy".
+    settings['MAP_ENGINE'] = config.get(
+        'OPTIONS', 'map_engine', fallback="sftools")
+    # Analysis of the input files, shared by all the prep directories.
+    settings['ANALYSIS_CACHE_DIR'] = config['PATH'].get(
+        'analysis_cache_dir',
+        os.path.expanduser("~/.contaminer/analysis_cache"))
+    settings['ANALYSIS_CACHE_SIZE_MB'] = config.getint(
+        'OPTIONS', 'analysis_cache_size_mb', fallback=16)
+    # Stop the remaining tasks once a contaminant is identified: "off", "job"
+    # or "contaminant". See contaminer.early_stop.
+    settings['EARLY_STOP'] = config.get(
+        'OPTIONS', 'early_stop', fallback="off")
+    settings['EARLY_STOP_PERCENT'] = config.getfloat(
+        'OPTIONS', 'early_stop_percent', fallback=90)
+    # Command to cancel the tasks of a job, with %PREP_NAME% and %PREP_DIR%.
+    settings['CANCEL_COMMAND'] = config['PATH'].get('cancel_command', "")
+    # Number of morda_solve tasks per element of the scheduler array. 0 runs a
+    # single task per element.
+    settings['CHUNK_SIZE'] = config.getint(
+        'OPTIONS', 'chunk_size', fallback=0)
+    # "strided" or "contiguous" ranks in each chunk.
+    settings['CHUNK_LAYOUT'] = config.get(
+        'OPTIONS', 'chunk_layout', fallback="strided")
+    # CPUs allocated to each element of the array, given to the job template.
+    # 0 means 1 without chunks, and chunk_size with chunks.
+    settings['CPUS_PER_TASK'] = config.getint(
+        'OPTIONS', 'cpus_per_task', fallback=0)
+    # Threads of the tools in each task of solve --local, and memory reserved
+    # for each task when adapting the number of workers. 0 disables the memory
+    # limit.
+    settings['THREADS_PER_TASK'] = max(
+        1, config.getint('OPTIONS', 'threads_per_task', fallback=1))
+    settings['MEMORY_PER_TASK_MB'] = config.getint(
+        'OPTIONS', 'memory_per_task_mb', fallback=2048)
+    # Number of workers claiming the tasks from a queue, instead of one element
+    # of the array per task. 0 uses static ranks. See contaminer.work_queue.
+    settings['QUEUE_WORKERS'] = config.getint(
+        'OPTIONS', 'queue_workers', fallback=0)
+    # Seconds without heartbeat after which a claimed task is run again.
+    settings['CLAIM_TIMEOUT'] = config.getfloat(
+        'OPTIONS', 'claim_timeout', fallback=600)
+    # Store the tasks of new jobs in "json" (tasks.json) or "sqlite". See
+    # contaminer.job_store.
+    settings['JOB_STORE'] = config.get(
+        'OPTIONS', 'job_store', fallback="json")
+    # Hit rates of the contaminants, learnt from the complete jobs.
+    settings['HIT_RATES_PATH'] = config['PATH'].get(
+        'hit_rates',
+        os.path.expanduser("~/.contaminer/hit_rates.json"))
+    # Downloads of init are looked up in this directory first, and kept
+    # there. Empty to disable. See contaminer.fetcher.
+    settings['FETCH_MIRROR_DIR'] = config['PATH'].get(
+        'fetch_mirror',
+        os.path.expanduser("~/.contaminer/mirror"))
+    settings['FETCH_WORKERS'] = max(
+        1, config.getint('OPTIONS', 'fetch_workers', fallback=8))
+    # Attempts after the first one, for network errors and server errors.
+    settings['FETCH_RETRIES'] = config.getint(
+        'OPTIONS', 'fetch_retries', fallback=3)
+    return settings
+
+
+def __getattr__(name):
+    """
+    Load the user config file on the first access to a setting.
+
+    Importing this module has no side effect: the config file is only read
+    (or written, if it does not exist) when a setting is needed, so commands
+    which do not need it start faster. The settings are then set as module
+    attributes, like the constants below.
+
+    """
+    if name.isupper() and 'CONFIG' not in globals():
+        globals().update(_load_settings())
+        if name in globals():
+            return globals()[name]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
 
 # No need to move that to user config, as it's only used internally
 JOB_SCRIPT = "job.sh"
+COMPILE_STATE_FILENAME = "compile_state.json"
+JOB_STORE_FILENAME = "tasks.sqlite"
+CONTABASE_INDEX_FILENAME = "index.json"
+CONTABASE_MANIFEST_FILENAME = "manifest.json"
+CONTABASE_UPDATE_FILENAME = "update.json"
+CONTABASE_RETIRED_DIR = "retired"
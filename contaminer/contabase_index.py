@@ -0,0 +1,285 @@
+"""
+Compiled index of the ContaBase.
+
+contabase.yaml is slow to parse, and the number of packs of each model is
+stored in a separate nbpacks file. The index gathers, for each contaminant
+(keyed by uniprot ID), its category, the contaminant as in contabase.yaml,
+and the directory and number of packs of its models. It is stored as JSON in
+the ContaBase directory, and loaded in a single read.
+
+The index is rebuilt when contabase.yaml changes (its hash is stored in the
+index) or when the ContaBase directory moves. Models not prepared yet have no
+number of packs: their nbpacks files are read again at each load, until the
+ContaBase is complete. `contaminer init-task` removes the index after
+preparing a model, so a model prepared again is seen by the next load.
+
+Classes
+-------
+ContaBaseIndex
+    Contaminants and models of the ContaBase, by uniprot ID.
+
+Functions
+---------
+get_yaml_hash
+    Return the SHA-256 of the contabase.yaml of this version.
+
+get_contabase_index
+    Return the index of the ContaBase, rebuilt if needed.
+
+remove_contabase_index
+    Remove the index of the ContaBase, so that it is rebuilt.
+
+"""
+
+import hashlib
+from importlib import resources
+import json
+import logging
+import os
+
+from contaminer import config
+from contaminer import data as contaminer_data
+
+LOG = logging.getLogger(__name__)
+
+# Increase when the layout of the index changes.
+INDEX_VERSION = 1
+
+
+def _read_nb_packs(model_dir):
+    """Return the number of packs of a model, or None if not prepared."""
+    try:
+        with open(os.path.join(model_dir, "nbpacks"), 'r') as pack_file:
+            return int(pack_file.read())
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        # Being written by init-task.
+        LOG.debug("Cannot read the number of packs in %s.", model_dir)
+        return None
+
+
+class ContaBaseIndex():
+    """
+    Contaminants and models of the ContaBase, by uniprot ID.
+
+    Attributes
+    ----------
+    contabase_dir: string
+        The ContaBase directory.
+
+    yaml_hash: string
+        The SHA-256 of the contabase.yaml the index is built from.
+
+    contaminants: dict
+        For each uniprot ID, in the order of contabase.yaml:
+        * category_id, category_name: the category of the contaminant
+        * contaminant: the contaminant, as in contabase.yaml
+        * alpha_fold: True if an AlphaFold model is available
+        * model_dir, nb_packs: the prepared model directory and its number of
+        packs (None if not prepared yet)
+        * af_model_dir, af_nb_packs: the same for the AlphaFold model, or
+        None
+
+    """
+
+    def __init__(self, contabase_dir, yaml_hash):
+        self.contabase_dir = contabase_dir
+        self.yaml_hash = yaml_hash
+        self.contaminants = {}
+
+    @classmethod
+    def build(cls, contabase_dir, contabase_text):
+        """Return the index of a ContaBase, from contabase.yaml content."""
+        # Slow to import, and only needed when the index is rebuilt.
+        import yaml
+
+        LOG.debug("Build ContaBase index for %s.", contabase_dir)
+        index = cls(contabase_dir, _hash_text(contabase_text))
+        for category in yaml.safe_load(contabase_text)['contabase']:
+            for contaminant in category['contaminants']:
+                uniprot_id = contaminant['uniprot_id']
+                model_dir = os.path.join(contabase_dir, uniprot_id)
+                entry = {
+                    'category_id': category['id'],
+                    'category_name': category['name'],
+                    'contaminant': contaminant,
+                    'alpha_fold': bool(contaminant['alpha_fold']),
+                    'model_dir': os.path.join(model_dir, 'models'),
+                    'nb_packs': _read_nb_packs(model_dir),
+                    'af_model_dir': None,
+                    'af_nb_packs': None,
+                }
+                if entry['alpha_fold']:
+                    af_model_dir = os.path.join(contabase_dir,
+                                                "AF_" + uniprot_id)
+                    entry['af_model_dir'] = os.path.join(af_model_dir,
+                                                         'models')
+                    entry['af_nb_packs'] = _read_nb_packs(af_model_dir)
+                index.contaminants[uniprot_id] = entry
+        return index
+
+    @classmethod
+    def load(cls, file_path):
+        """Return the index saved in a file, or None if it is not usable."""
+        try:
+            with open(file_path, 'r') as index_file:
+                data = json.loads(index_file.read())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            LOG.warning("Ignore corrupted ContaBase index %s.", file_path)
+            return None
+        if data.get('version') != INDEX_VERSION:
+            return None
+
+        index = cls(data['contabase_dir'], data['yaml_hash'])
+        index.contaminants = data['contaminants']
+        return index
+
+    def save(self, file_path):
+        """Save the index in a file, atomically."""
+        LOG.debug("Save ContaBase index to %s.", file_path)
+        temp_path = "%s.%s.tmp" % (file_path, os.getpid())
+        with open(temp_path, 'w') as index_file:
+            index_file.write(json.dumps({
+                'version': INDEX_VERSION,
+                'contabase_dir': self.contabase_dir,
+                'yaml_hash': self.yaml_hash,
+                'contaminants': self.contaminants
+            }))
+        os.replace(temp_path, file_path)
+
+    def refresh(self):
+        """
+        Read the nbpacks files of the models not prepared in the index.
+
+        Return
+        ------
+        boolean
+            True if the index changed.
+
+        """
+        changed = False
+        for entry in self.contaminants.values():
+            if entry['nb_packs'] is None:
+                entry['nb_packs'] = _read_nb_packs(
+                    os.path.dirname(entry['model_dir']))
+                changed |= entry['nb_packs'] is not None
+            if entry['alpha_fold'] and entry['af_nb_packs'] is None:
+                entry['af_nb_packs'] = _read_nb_packs(
+                    os.path.dirname(entry['af_model_dir']))
+                changed |= entry['af_nb_packs'] is not None
+        return changed
+
+    def is_complete(self):
+        """Return True if all the models are prepared."""
+        return all(
+            entry['nb_packs'] is not None
+            and (not entry['alpha_fold'] or entry['af_nb_packs'] is not None)
+            for entry in self.contaminants.values())
+
+    def get(self, uniprot_id):
+        """Return the entry of a contaminant."""
+        try:
+            return self.contaminants[uniprot_id]
+        except KeyError:
+            raise RuntimeError(
+                "Contaminant %s is not in the ContaBase." % uniprot_id)
+
+    def get_contaminants(self):
+        """Return the contaminants, as in contabase.yaml, as a flat list."""
+        return [entry['contaminant'] for entry in self.contaminants.values()]
+
+    def get_model_names(self):
+        """
+        Return the names of the model directories, in the order of init-task.
+
+        The AlphaFold model of a contaminant follows its prepared model.
+
+        """
+        model_names = []
+        for uniprot_id, entry in self.contaminants.items():
+            model_names.append(uniprot_id)
+            if entry['alpha_fold']:
+                model_names.append("AF_" + uniprot_id)
+        return model_names
+
+    def get_nb_packs(self, uniprot_id):
+        """Return the number of packs of a contaminant."""
+        nb_packs = self.get(uniprot_id)['nb_packs']
+        if nb_packs is None:
+            raise RuntimeError(
+                "Model %s is not prepared. Check `contaminer init-status`."
+                % uniprot_id)
+        return nb_packs
+
+
+def _hash_text(text):
+    """Return the SHA-256 of a text."""
+    return hashlib.sha256(text.encode('UTF-8')).hexdigest()
+
+
+def _get_index_path(contabase_dir):
+    """Return the path of the index of a ContaBase."""
+    return os.path.join(contabase_dir, config.CONTABASE_INDEX_FILENAME)
+
+
+def get_yaml_hash():
+    """Return the SHA-256 of the contabase.yaml of this version."""
+    return _hash_text(resources.files(contaminer_data).joinpath(
+        "contabase.yaml").read_text())
+
+
+def get_contabase_index(contabase_dir=None):
+    """
+    Return the index of the ContaBase, rebuilt if needed.
+
+    The index is saved in the ContaBase directory when it is rebuilt or
+    refreshed, if the directory exists and is writable.
+
+    Parameters
+    ----------
+    contabase_dir: string
+        The ContaBase directory. Default is config.CONTABASE_DIR.
+
+    Return
+    ------
+    ContaBaseIndex
+        The index of the ContaBase.
+
+    """
+    if contabase_dir is None:
+        contabase_dir = config.CONTABASE_DIR
+    contabase_text = resources.files(contaminer_data).joinpath(
+        "contabase.yaml").read_text()
+    index_path = _get_index_path(contabase_dir)
+
+    index = ContaBaseIndex.load(index_path)
+    if index is None \
+            or index.yaml_hash != _hash_text(contabase_text) \
+            or index.contabase_dir != contabase_dir:
+        index = ContaBaseIndex.build(contabase_dir, contabase_text)
+        changed = True
+    else:
+        changed = index.refresh()
+
+    if changed and os.path.isdir(contabase_dir):
+        try:
+            index.save(index_path)
+        except OSError as error:
+            # A shared ContaBase may be read-only.
+            LOG.debug("Cannot save ContaBase index: %s", error)
+
+    LOG.debug("%s contaminants in ContaBase index.", len(index.contaminants))
+    return index
+
+
+def remove_contabase_index(contabase_dir=None):
+    """Remove the index of the ContaBase, so that it is rebuilt."""
+    if contabase_dir is None:
+        contabase_dir = config.CONTABASE_DIR
+    try:
+        os.remove(_get_index_path(contabase_dir))
+    except FileNotFoundError:
+        pass
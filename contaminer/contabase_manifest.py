@@ -0,0 +1,266 @@
+"""
+Manifest of the prepared ContaBase, and verification of its integrity.
+
+Each init-task writes the manifest of its model, in the model directory: the
+number of packs, and the size and SHA-256 of each file. The init-task which
+prepares the last model gathers them in the manifest of the ContaBase, with
+the hash of contabase.yaml. The ContaBase is ready when its manifest exists
+for the current contabase.yaml, which is checked with a single read.
+
+`contaminer init-status --verify` checksums all the files of the ContaBase in
+a thread pool (hashlib releases the GIL on large files), and compares them
+with the manifest to find the corrupted models.
+
+Functions
+---------
+write_model_manifest
+    Write the manifest of a prepared model.
+
+gather_manifest
+    Write the manifest of the ContaBase, if all the models are prepared.
+
+read_model_manifest
+    Return the manifest of a prepared model, or None.
+
+read_manifest
+    Return the manifest of the ContaBase, or None.
+
+remove_manifest
+    Remove the manifest of the ContaBase, before preparing models again.
+
+is_manifest_ready
+    Return True if the ContaBase has a manifest for this version.
+
+verify_contabase
+    Checksum the ContaBase, and return the problems of each corrupted model.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+
+from contaminer import config
+from contaminer.analysis_cache import hash_file
+from contaminer.contabase_index import get_contabase_index
+from contaminer.contabase_index import get_yaml_hash
+
+LOG = logging.getLogger(__name__)
+
+# Increase when the layout of the manifest changes.
+MANIFEST_VERSION = 1
+
+
+def _read_json(file_path):
+    """Return the content of a JSON file, or None if it does not exist."""
+    try:
+        with open(file_path, 'r') as json_file:
+            return json.loads(json_file.read())
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(file_path, content):
+    """Write a JSON file, atomically."""
+    temp_path = "%s.%s.tmp" % (file_path, os.getpid())
+    with open(temp_path, 'w') as json_file:
+        json_file.write(json.dumps(content))
+    os.replace(temp_path, file_path)
+
+
+def _list_files(model_dir):
+    """Return the paths of the files of a model, relative to model_dir."""
+    file_paths = []
+    for dir_path, _, file_names in os.walk(model_dir):
+        for file_name in file_names:
+            file_path = os.path.relpath(os.path.join(dir_path, file_name),
+                                        model_dir)
+            if file_path != config.CONTABASE_MANIFEST_FILENAME \
+                    and not file_path.endswith(".tmp"):
+                file_paths.append(file_path)
+    return sorted(file_paths)
+
+
+def write_model_manifest(model_dir, nb_packs, source=None):
+    """
+    Write the manifest of a prepared model.
+
+    Parameters
+    ----------
+    model_dir: string
+        The directory of the model in the ContaBase.
+
+    nb_packs: integer
+        The number of packs prepared by morda_prep.
+
+    source: string
+        The hash of the description of the model in contabase.yaml, used by
+        `contaminer update` to find the changed models. None if unknown.
+
+    """
+    files = {}
+    for file_path in _list_files(model_dir):
+        full_path = os.path.join(model_dir, file_path)
+        files[file_path] = {
+            'size': os.path.getsize(full_path),
+            'sha256': hash_file(full_path),
+        }
+    LOG.debug("Write manifest of %s files in %s.", len(files), model_dir)
+    _write_json(
+        os.path.join(model_dir, config.CONTABASE_MANIFEST_FILENAME),
+        {'nb_packs': nb_packs, 'source': source, 'files': files})
+
+
+def read_model_manifest(model_dir):
+    """Return the manifest of a prepared model, or None if there is none."""
+    return _read_json(
+        os.path.join(model_dir, config.CONTABASE_MANIFEST_FILENAME))
+
+
+def gather_manifest(contabase_dir=None):
+    """
+    Write the manifest of the ContaBase, if all the models are prepared.
+
+    Parameters
+    ----------
+    contabase_dir: string
+        The ContaBase directory. Default is config.CONTABASE_DIR.
+
+    Return
+    ------
+    dict
+        The manifest, or None if a model has no manifest yet.
+
+    """
+    if contabase_dir is None:
+        contabase_dir = config.CONTABASE_DIR
+    model_names = get_contabase_index(contabase_dir).get_model_names()
+    model_paths = [
+        os.path.join(contabase_dir, model_name,
+                     config.CONTABASE_MANIFEST_FILENAME)
+        for model_name in model_names
+    ]
+    # Cheap check, done by each init-task, before reading the manifests.
+    if not all(os.path.isfile(model_path) for model_path in model_paths):
+        return None
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'yaml_hash': get_yaml_hash(),
+        'models': {},
+    }
+    for model_name, model_path in zip(model_names, model_paths):
+        model_manifest = _read_json(model_path)
+        if model_manifest is None:
+            return None
+        manifest['models'][model_name] = model_manifest
+
+    LOG.info("All %s models are prepared. Write ContaBase manifest.",
+             len(model_names))
+    _write_json(
+        os.path.join(contabase_dir, config.CONTABASE_MANIFEST_FILENAME),
+        manifest)
+    return manifest
+
+
+def read_manifest(contabase_dir=None):
+    """Return the manifest of the ContaBase, or None if there is none."""
+    if contabase_dir is None:
+        contabase_dir = config.CONTABASE_DIR
+    manifest = _read_json(
+        os.path.join(contabase_dir, config.CONTABASE_MANIFEST_FILENAME))
+    if manifest is None or manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def remove_manifest(contabase_dir=None):
+    """Remove the manifest of the ContaBase, before preparing models again."""
+    if contabase_dir is None:
+        contabase_dir = config.CONTABASE_DIR
+    try:
+        os.remove(
+            os.path.join(contabase_dir, config.CONTABASE_MANIFEST_FILENAME))
+    except FileNotFoundError:
+        pass
+
+
+def is_manifest_ready(contabase_dir=None):
+    """Return True if the ContaBase has a manifest for this version."""
+    manifest = read_manifest(contabase_dir)
+    return manifest is not None and manifest['yaml_hash'] == get_yaml_hash()
+
+
+def _verify_file(file_path, expected):
+    """Return the problem of a file of the manifest, or None if intact."""
+    try:
+        if os.path.getsize(file_path) != expected['size']:
+            return "size differs"
+        if hash_file(file_path) != expected['sha256']:
+            return "checksum differs"
+    except FileNotFoundError:
+        return "missing"
+    except OSError as error:
+        return "unreadable (%s)" % error
+    return None
+
+
+def verify_contabase(contabase_dir=None, max_workers=None):
+    """
+    Checksum the ContaBase, and return the problems of each corrupted model.
+
+    Parameters
+    ----------
+    contabase_dir: string
+        The ContaBase directory. Default is config.CONTABASE_DIR.
+
+    max_workers: integer
+        Number of threads checksumming the files. Default is the default of
+        concurrent.futures.ThreadPoolExecutor.
+
+    Return
+    ------
+    dict
+        For each corrupted model, the list of its problems, as strings like
+        "models/pack1.pdb: checksum differs". Empty if the ContaBase is
+        intact.
+
+    Raises
+    ------
+    RuntimeError
+        If the ContaBase has no manifest.
+
+    """
+    if contabase_dir is None:
+        contabase_dir = config.CONTABASE_DIR
+    manifest = read_manifest(contabase_dir)
+    if manifest is None:
+        raise RuntimeError("ContaBase %s has no manifest." % contabase_dir)
+
+    # Largest files first, so a large file does not end the verification
+    # alone in a thread.
+    files = []
+    for model_name, model_manifest in manifest['models'].items():
+        for file_path, expected in model_manifest['files'].items():
+            files.append((model_name, file_path, expected))
+    files.sort(key=lambda item: -item[2]['size'])
+    LOG.info("Verify %s files of %s models.",
+             len(files), len(manifest['models']))
+
+    problems = {}
+    with ThreadPoolExecutor(max_workers) as executor:
+        results = executor.map(
+            lambda item: _verify_file(
+                os.path.join(contabase_dir, item[0], item[1]), item[2]),
+            files)
+        for (model_name, file_path, _), problem in zip(files, results):
+            if problem is not None:
+                problems.setdefault(model_name, []).append(
+                    "%s: %s" % (file_path, problem))
+
+    return {
+        model_name: sorted(problems[model_name])
+        for model_name in manifest['models']
+        if model_name in problems
+    }
@@ -1,18 +1,47 @@
 """Provide entry point commands for ContaMiner."""
 
+import hashlib
 from importlib import resources
 import json
 import logging
 import os
 import shutil
 import subprocess
-from urllib.request import urlretrieve
-import yaml
 
+from contaminer.args_manager import FINAL_STATUSES
 from contaminer.args_manager import TasksManager
+from contaminer.args_manager import get_nb_chunks
+from contaminer.args_manager import get_tasks_path
 from contaminer import config
 from contaminer import data as contaminer_data
+from contaminer.ccp4 import AltSgList
 from contaminer.ccp4 import MordaPrep
+from contaminer.contabase_index import get_contabase_index
+from contaminer.contabase_index import remove_contabase_index
+from contaminer.contabase_manifest import gather_manifest
+from contaminer.contabase_manifest import is_manifest_ready
+from contaminer.contabase_manifest import read_manifest
+from contaminer.contabase_manifest import read_model_manifest
+from contaminer.contabase_manifest import remove_manifest
+from contaminer.contabase_manifest import verify_contabase
+from contaminer.contabase_manifest import write_model_manifest
+from contaminer.fetcher import ALPHAFOLD_URL
+from contaminer.fetcher import UNIPROT_URL
+from contaminer.fetcher import Fetcher
+from contaminer.hit_rates import record_job
+from contaminer.job_store import JobStore
+from contaminer.job_store import is_store_path
+from contaminer.job_store import migrate_prep_dir
+from contaminer.local_executor import LocalExecutor
+from contaminer.maps import make_job_maps
+from contaminer.runner import get_default_runner
+from contaminer.summary import TOP_K
+from contaminer.summary import summarize_jobs
+from contaminer.space_groups import get_alt_space_groups
+from contaminer.space_groups import get_space_group_names
+from contaminer.space_groups import normalize_space_group
+from contaminer.work_queue import QUEUE_DIR
+from contaminer.work_queue import WorkQueue
 
 
 LOG = logging.getLogger(__name__)
@@ -26,11 +55,7 @@ def _get_all_contaminants():
     in the list contains details about the contaminant.
 
     """
-    contabase_text = resources.read_text(contaminer_data, "contabase.yaml")
-    contabase_yaml = yaml.safe_load(contabase_text)['contabase']
-    contaminants = []
-    for category in contabase_yaml:
-        contaminants.extend(category['contaminants'])
+    contaminants = get_contabase_index().get_contaminants()
 
     LOG.debug("%s contaminants found.", len(contaminants))
     return contaminants
@@ -57,30 +82,28 @@ def init():
                      contabase_dir)
         raise
 
+    downloads = []
     for contaminant in contaminants:
         LOG.info("Creating model directory for contaminant %s.",
                  contaminant['uniprot_id'])
-        _create_model_dir(contaminant)
+        downloads.extend(_create_model_dir(contaminant))
 
         # For some models, add AlphaFold model.
         if contaminant['alpha_fold']:
-            _create_model_dir(contaminant, alpha_model=True)
+            downloads.extend(
+                _create_model_dir(contaminant, alpha_model=True))
+
+    LOG.info("Fetching %s sequences and models.", len(downloads))
+    Fetcher().fetch_all(downloads)
+
+    # Index the new ContaBase.
+    get_contabase_index()
 
     # Prepare job script
-    _create_prepare_job_script(contaminants)
+    _create_prepare_job_script(len(_get_models(contaminants)))
 
     # Submit newly written script
-    LOG.info("Starting preparation job.")
-    job_script_path = os.path.join(
-        config.CONTABASE_DIR,
-        config.JOB_SCRIPT)
-    command = [config.SCHEDULER_COMMAND, job_script_path]
-    popen = subprocess.Popen(command,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-    stdout, stderr = popen.communicate()
-    if stdout:
-        LOG.info(stdout.decode('UTF-8'))
+    _submit_prepare_job()
     LOG.info(("Depending on your job template, the ContaBase may still be "
               "initializing. Please check check the initialization status "
               "with `contaminer status` before submitting a solve task."))
@@ -90,8 +113,15 @@ def _create_model_dir(contaminant, alpha_model=False):
     """
     Create the directory where the information for a contaminants are stored.
 
-    Create the directory itself, write or download the sequence, and
-    if required, download the PDB file from AlphaFold.
+    Create the directory itself, and write the sequence if it is given in
+    the ContaBase. The sequence to download from UniProt, and the PDB file to
+    download from AlphaFold if required, are returned to be fetched with the
+    other models, see contaminer.fetcher.
+
+    Return
+    ------
+    list(tuple(string, string))
+        The URL and destination of the files to download.
 
     """
     contabase_dir = config.CONTABASE_DIR
@@ -106,107 +136,182 @@ def _create_model_dir(contaminant, alpha_model=False):
     os.mkdir(model_dir)
 
     # Download or create fasta file
+    downloads = []
     sequence_file_path = os.path.join(model_dir, "sequence.fasta")
     if sequence:
         with open(sequence_file_path, 'w') as sequence_file:
             sequence_file.write('>lcl|%s' % uniprot_id)
             sequence_file.write(sequence)
     else:
-        fasta_url = "http://www.uniprot.org/uniprot/%s.fasta" % uniprot_id
-        urlretrieve(fasta_url, sequence_file_path)
+        downloads.append((UNIPROT_URL % uniprot_id, sequence_file_path))
 
     if alpha_model:
-        model_url = "https://alphafold.ebi.ac.uk/files/AF-%s-F1-model_v2.pdb" \
-            % uniprot_id
         model_file_path = os.path.join(model_dir, "AF_model.pdb")
-        urlretrieve(model_url, model_file_path)
+        downloads.append((ALPHAFOLD_URL % uniprot_id, model_file_path))
+    return downloads
 
 
-def _create_prepare_job_script(contaminants):
+def _create_prepare_job_script(nb_procs, command="init-task",
+                               prep_name="ContaBase_init"):
     """
     Render a job template to submit preparation tasks to a scheduler.
 
     Read the job template, replace patterns with generated values, and
     write the resulting script.
 
+    Parameters
+    ----------
+    nb_procs: integer
+        Number of models to prepare.
+
+    command: string
+        The command run by each element of the job array.
+
+    prep_name: string
+        The name of the job.
+
     """
-    nb_procs = len(contaminants)
-    nb_procs += len([contaminant
-                     for contaminant in contaminants
-                     if contaminant['alpha_fold']])
+    job_script_path = os.path.join(
+        config.CONTABASE_DIR,
+        config.JOB_SCRIPT)
+    _write_job_script(job_script_path, nb_procs, prep_name, command)
+
+
+def _write_job_script(job_script_path, nb_array, prep_name, command,
+                      chunk_size=1, cpus_per_task=None):
+    """
+    Fill in the job template, and write the resulting script.
+
+    Every pattern of the templates is replaced, so the preparation and
+    solving jobs can share the same template.
+
+    Parameters
+    ----------
+    job_script_path: string
+        Path to the script to write.
+
+    nb_array: integer
+        Number of elements of the job array.
+
+    prep_name: string
+        The name of the job.
+
+    command: string
+        The command run by each element of the job array.
 
+    chunk_size: integer
+        Number of tasks run by each element of the job array.
+
+    cpus_per_task: integer
+        Number of cores of each element of the job array. Use the
+        cpus_per_task option, or 1, if None.
+
+    """
     with open(config.JOB_TEMPLATE_PATH, 'r') as template_file:
         script_content = template_file.read()
+
     replacement_patterns = {
-        "%NB_PROCS%": str(nb_procs),
-        "%MIN_ARRAY%": str(0),
-        "%MAX_ARRAY%": str(nb_procs-1),
-        "%PREP_NAME%": "ContaBase_init",
+        "%NB_PROCS%": str(nb_array),
+        "%PREP_NAME%": prep_name,
         "%PREP_DIR%": "",
-        "%COMMAND%": "init-task",
+        "%MIN_ARRAY%": str(0),
+        "%MAX_ARRAY%": str(nb_array-1),
+        "%COMMAND%": command,
+        "%CHUNK_SIZE%": str(chunk_size),
+        "%CPUS_PER_TASK%": str(cpus_per_task or config.CPUS_PER_TASK or 1),
     }
+
     for pattern, value in replacement_patterns.items():
         script_content = script_content.replace(pattern, value)
+
+    with open(job_script_path, 'w') as job_script:
+        job_script.write(script_content)
+
+
+def _submit_prepare_job():
+    """Submit the job script of the ContaBase to the scheduler."""
+    LOG.info("Starting preparation job.")
     job_script_path = os.path.join(
         config.CONTABASE_DIR,
         config.JOB_SCRIPT)
-    with open(job_script_path, 'w') as job_script:
-        job_script.write(script_content)
+    command = [config.SCHEDULER_COMMAND, job_script_path]
+    popen = subprocess.Popen(command,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+    stdout, stderr = popen.communicate()
+    if stdout:
+        LOG.info(stdout.decode('UTF-8'))
 
 
-def init_task(rank):
+def _get_models(contaminants):
     """
-    Run the morda_prep process for the given rank.
+    Return the models to prepare, in the order of init-task.
 
-    Parameters
-    ----------
-    rank: integer
-        Rank of the process to run.
+    Each model gives its name (also the name of its directory), the uniprot
+    ID of its contaminant, the number of homologous structures, the sequence
+    given in the ContaBase if any, and the PDB model for AlphaFold models.
 
     """
-    # Parse data file,
-    LOG.info("Reading ContaBase.")
-    contaminants = _get_all_contaminants()
-
-    # Flatten models list.
     models = []
     for contaminant in contaminants:
         models.append(
             {
                 'model_name': contaminant['uniprot_id'],
-                'nb_homologous': 1 if contaminant['exact_model'] else 3
+                'uniprot_id': contaminant['uniprot_id'],
+                'nb_homologous': 1 if contaminant['exact_model'] else 3,
+                'sequence': contaminant.get('sequence'),
             }
         )
         if contaminant['alpha_fold']:
             models.append(
                 {
                     'model_name': "AF_" + contaminant['uniprot_id'],
+                    'uniprot_id': contaminant['uniprot_id'],
                     'nb_homologous': 1,
-                    'pdb_model': "AF_model.pdb"
+                    'sequence': contaminant.get('sequence'),
+                    'pdb_model': "AF_model.pdb",
+                    'pdb_url': ALPHAFOLD_URL % contaminant['uniprot_id'],
                 }
             )
     LOG.debug("Found %s models.", len(models))
+    return models
 
-    current_model = models[rank]
+
+def _get_model_source(model):
+    """Return the hash of everything morda_prep uses to prepare a model."""
+    return hashlib.sha256(
+        json.dumps(model, sort_keys=True).encode('UTF-8')).hexdigest()
+
+
+def _prepare_model(model):
+    """
+    Run morda_prep for a model, and write its number of packs and manifest.
+
+    Parameters
+    ----------
+    model: dict
+        The model to prepare, as returned by _get_models.
+
+    """
     destination = os.path.join(
         config.CONTABASE_DIR,
-        current_model['model_name'])
+        model['model_name'])
     fasta_path = os.path.join(destination, "sequence.fasta")
 
-    LOG.info("Running morda_prep for model %s.", current_model['model_name'])
-    if "pdb_model" in current_model:
-        pdb_path = os.path.join(destination, current_model['pdb_model'])
+    LOG.info("Running morda_prep for model %s.", model['model_name'])
+    if "pdb_model" in model:
+        pdb_path = os.path.join(destination, model['pdb_model'])
         morda_prep = MordaPrep(
             fasta_path,
             destination,
-            current_model['nb_homologous'],
+            model['nb_homologous'],
             pdb_path)
         morda_prep.run()
     else:
         morda_prep = MordaPrep(
             fasta_path,
             destination,
-            current_model['nb_homologous'])
+            model['nb_homologous'])
         morda_prep.run()
 
     # Save number of packs
@@ -216,10 +321,200 @@ def init_task(rank):
     LOG.debug("nbpacks path: %s", nbpacks_path)
     with open(nbpacks_path, 'w') as nbpacks_file:
         nbpacks_file.write("%s\n" % str(nbpacks))
+    remove_contabase_index()
 
     # Remove temporary directories
     morda_prep.cleanup()
 
+    # The last task to end writes the manifest of the ContaBase.
+    write_model_manifest(destination, nbpacks, _get_model_source(model))
+    gather_manifest()
+
+
+def init_task(rank):
+    """
+    Run the morda_prep process for the given rank.
+
+    Parameters
+    ----------
+    rank: integer
+        Rank of the process to run.
+
+    """
+    # Parse data file,
+    LOG.info("Reading ContaBase.")
+    models = _get_models(_get_all_contaminants())
+    _prepare_model(models[rank])
+
+
+def _plan_update(models):
+    """
+    Compare the models of contabase.yaml with the prepared ContaBase.
+
+    A model is new if it has no directory, incomplete if morda_prep did not
+    end, and changed if its manifest was written for another description in
+    contabase.yaml. Models prepared by older versions have no description in
+    their manifest, and are considered unchanged. Model directories of the
+    ContaBase manifest or on disk which are not in contabase.yaml anymore are
+    removed.
+
+    Return
+    ------
+    dict
+        The names of the 'new', 'incomplete', 'changed' and 'removed'
+        models.
+
+    """
+    contabase_dir = config.CONTABASE_DIR
+    plan = {'new': [], 'incomplete': [], 'changed': [], 'removed': []}
+    for model in models:
+        model_dir = os.path.join(contabase_dir, model['model_name'])
+        if not os.path.isdir(model_dir):
+            plan['new'].append(model['model_name'])
+        elif not os.path.isfile(os.path.join(model_dir, "nbpacks")):
+            plan['incomplete'].append(model['model_name'])
+        else:
+            model_manifest = read_model_manifest(model_dir) or {}
+            if model_manifest.get('source') \
+                    not in (None, _get_model_source(model)):
+                plan['changed'].append(model['model_name'])
+
+    model_names = set(model['model_name'] for model in models)
+    previous_names = set(
+        file_name for file_name in os.listdir(contabase_dir)
+        if os.path.isfile(
+            os.path.join(contabase_dir, file_name, "sequence.fasta")))
+    manifest = read_manifest()
+    if manifest is not None:
+        previous_names.update(
+            model_name for model_name in manifest['models']
+            if os.path.isdir(os.path.join(contabase_dir, model_name)))
+    plan['removed'] = sorted(previous_names - model_names)
+    return plan
+
+
+def _retire_model(model_name):
+    """Move a model not in contabase.yaml anymore to the retired directory."""
+    retired_dir = os.path.join(config.CONTABASE_DIR,
+                               config.CONTABASE_RETIRED_DIR)
+    os.makedirs(retired_dir, exist_ok=True)
+    retired_path = os.path.join(retired_dir, model_name)
+    if os.path.isdir(retired_path):
+        shutil.rmtree(retired_path)
+    os.replace(os.path.join(config.CONTABASE_DIR, model_name), retired_path)
+
+
+def update(dry_run=False):
+    """
+    Prepare the models of the ContaBase which changed in contabase.yaml.
+
+    The new, incomplete and changed models are prepared again by a job of
+    update-task, submitted through the job template. The models not in
+    contabase.yaml anymore are moved to the retired directory of the
+    ContaBase. The other models are left untouched.
+
+    Parameters
+    ----------
+    dry_run: boolean
+        If True, only print the models to prepare and to retire.
+
+    Raises
+    ------
+    RuntimeError
+        If the ContaBase does not exist yet.
+
+    """
+    contabase_dir = config.CONTABASE_DIR
+    if not os.path.isdir(contabase_dir):
+        raise RuntimeError(
+            "ContaBase directory %s does not exist. Run `contaminer init`."
+            % contabase_dir)
+
+    LOG.info("Reading ContaBase.")
+    contaminants = _get_all_contaminants()
+    models = _get_models(contaminants)
+    plan = _plan_update(models)
+    for status in ['new', 'incomplete', 'changed', 'removed']:
+        if plan[status]:
+            print("%s models: %s" % (status.capitalize(),
+                                     " ".join(plan[status])))
+
+    to_prepare = [model for model in models
+                  if model['model_name'] in plan['new']
+                  + plan['incomplete'] + plan['changed']]
+    if not to_prepare and not plan['removed']:
+        print("ContaBase is up to date.")
+        return
+    if dry_run:
+        return
+
+    for model_name in plan['removed']:
+        LOG.info("Retiring model %s.", model_name)
+        _retire_model(model_name)
+
+    contaminants = {contaminant['uniprot_id']: contaminant
+                    for contaminant in contaminants}
+    downloads = []
+    for model in to_prepare:
+        LOG.info("Creating model directory for %s.", model['model_name'])
+        model_dir = os.path.join(contabase_dir, model['model_name'])
+        if os.path.isdir(model_dir):
+            shutil.rmtree(model_dir)
+        downloads.extend(_create_model_dir(
+            contaminants[model['uniprot_id']],
+            alpha_model="pdb_model" in model))
+    LOG.info("Fetching %s sequences and models.", len(downloads))
+    Fetcher().fetch_all(downloads)
+
+    # The ContaBase is initializing until the last update-task ends.
+    remove_manifest()
+    remove_contabase_index()
+    get_contabase_index()
+
+    if not to_prepare:
+        gather_manifest()
+        return
+    update_path = os.path.join(contabase_dir,
+                               config.CONTABASE_UPDATE_FILENAME)
+    temp_path = "%s.%s.tmp" % (update_path, os.getpid())
+    with open(temp_path, 'w') as update_file:
+        update_file.write(json.dumps(
+            [model['model_name'] for model in to_prepare]))
+    os.replace(temp_path, update_path)
+
+    _create_prepare_job_script(len(to_prepare), command="update-task",
+                               prep_name="ContaBase_update")
+    _submit_prepare_job()
+    LOG.info(("Depending on your job template, the ContaBase may still be "
+              "updating. Please check the initialization status with "
+              "`contaminer init-status` before submitting a solve task."))
+
+
+def update_task(rank):
+    """
+    Run the morda_prep process for the given rank of the last update.
+
+    Parameters
+    ----------
+    rank: integer
+        Rank of the process to run, in the models listed by update.
+
+    """
+    with open(os.path.join(config.CONTABASE_DIR,
+                           config.CONTABASE_UPDATE_FILENAME),
+              'r') as update_file:
+        model_name = json.loads(update_file.read())[rank]
+
+    LOG.info("Reading ContaBase.")
+    models = _get_models(_get_all_contaminants())
+    for model in models:
+        if model['model_name'] == model_name:
+            _prepare_model(model)
+            return
+    raise RuntimeError(
+        "Model %s is not in the ContaBase anymore. Run `contaminer update`."
+        % model_name)
+
 
 def _is_contabase_ready():
     """
@@ -233,27 +528,11 @@ def _is_contabase_ready():
     if not os.path.isdir(contabase_dir):
         return False
 
-    contaminants = _get_all_contaminants()
-    for contaminant in contaminants:
-        nbpacks_path = os.path.join(
-            contabase_dir,
-            contaminant['uniprot_id'],
-            "nbpacks")
-        if not os.path.isfile(nbpacks_path):
-            return False
+    # ContaBases prepared by older versions have no manifest.
+    return is_manifest_ready() or get_contabase_index().is_complete()
 
-        if contaminant['alpha_fold']:
-            nbpacks_path = os.path.join(
-                contabase_dir,
-                "AF_" + contaminant['uniprot_id'],
-                "nbpacks")
-            if not os.path.isfile(nbpacks_path):
-                return False
 
-    return True
-
-
-def init_status():
+def init_status(verify=False, max_workers=None):
     """
     Show the status of ContaBase initialization.
 
@@ -266,6 +545,16 @@ def init_status():
         * Corrupted: the folder is present, but the content does not seem
     correct. It's probably a good idea to remove the ContaBase and re-create it.
 
+    Parameters
+    ----------
+    verify: boolean
+        If True, checksum the files of a ready ContaBase, and list the
+        corrupted models. A ContaBase without manifest (prepared by an older
+        version) gets one, used by the next verifications.
+
+    max_workers: integer
+        Number of threads checksumming the files.
+
     """
     contabase_dir = config.CONTABASE_DIR
 
@@ -275,26 +564,30 @@ def init_status():
         return
 
     try:
-        contaminants = _get_all_contaminants()
-        for contaminant in contaminants:
-            nbpacks_path = os.path.join(
-                contabase_dir,
-                contaminant['uniprot_id'],
-                "nbpacks")
-            if not os.path.isfile(nbpacks_path):
+        if not is_manifest_ready():
+            contabase_index = get_contabase_index()
+            if not contabase_index.is_complete():
                 print("ContaBase is: Initializing.")
                 print("Please wait for the initialization to complete.")
                 return
+            if verify:
+                _write_missing_manifests(contabase_index)
+                print("ContaBase is: Ready.")
+                print("Its manifest has been written. Run `contaminer "
+                      "init-status --verify` again to verify it.")
+                return
 
-            if contaminant['alpha_fold']:
-                nbpacks_path = os.path.join(
-                    contabase_dir,
-                    "AF_" + contaminant['uniprot_id'],
-                    "nbpacks")
-                if not os.path.isfile(nbpacks_path):
-                    print("Contabase is: Initializing")
-                    print("Please wait for the initialization to complete.")
-                    return
+        if verify:
+            problems = verify_contabase(max_workers=max_workers)
+            if problems:
+                print("ContaBase is: Corrupted.")
+                for model_name, model_problems in problems.items():
+                    print("Model %s:" % model_name)
+                    for problem in model_problems:
+                        print("    %s" % problem)
+                print("Please remove the directory, and run "
+                      "`contaminer init`.")
+                return
 
     # A bit too large, but we need to capture all IO related errors.
     except OSError:
@@ -305,7 +598,21 @@ def init_status():
     print("ContaBase is: Ready.")
 
 
-def _prepare_solve(diffraction_file, models):
+def _write_missing_manifests(contabase_index):
+    """Write the manifests of a ContaBase prepared by an older version."""
+    for model_name in contabase_index.get_model_names():
+        model_dir = os.path.join(config.CONTABASE_DIR, model_name)
+        if not os.path.isfile(os.path.join(
+                model_dir, config.CONTABASE_MANIFEST_FILENAME)):
+            if model_name.startswith("AF_"):
+                nb_packs = contabase_index.get(model_name[3:])['af_nb_packs']
+            else:
+                nb_packs = contabase_index.get_nb_packs(model_name)
+            write_model_manifest(model_dir, nb_packs)
+    gather_manifest()
+
+
+def _prepare_solve(diffraction_file, models, use_store=False):
     """
     Prepare the arguments file and give the number of processes needed.
 
@@ -317,6 +624,9 @@ def _prepare_solve(diffraction_file, models):
     models: list(string)
         List of contaminants to test with diffraction file.
 
+    use_store: boolean
+        Store the tasks in a JobStore instead of tasks.json.
+
     """
     # Convert relative path to custom models in absolute
     for index in range(len(models)):
@@ -340,7 +650,10 @@ def _prepare_solve(diffraction_file, models):
 
     tasks_manager = TasksManager()
     tasks_manager.create(file_name, models)
-    tasks_manager.save(config.ARGS_FILENAME)
+    if use_store:
+        tasks_manager.save(config.JOB_STORE_FILENAME)
+    else:
+        tasks_manager.save(config.ARGS_FILENAME)
 
     # Return path of the generated directory
     return os.getcwd()
@@ -358,24 +671,33 @@ def _submit(prep_dir):
     prep_name = os.path.basename(prep_dir)
     os.chdir(prep_dir)
 
-    nb_procs = _get_number_procs(prep_dir)
-
-    with open(config.JOB_TEMPLATE_PATH, 'r') as template_file:
-        script_content = template_file.read()
+    # WAL does not work across the nodes of a cluster.
+    if is_store_path(get_tasks_path(".")):
+        raise RuntimeError("Jobs stored in SQLite can only run with "
+                           "`contaminer solve --local`.")
 
-    replacement_patterns = {
-        "%NB_PROCS%": str(nb_procs),
-        "%PREP_NAME%": prep_name,
-        "%MIN_ARRAY%": str(0),
-        "%MAX_ARRAY%": str(nb_procs-1),
-        "%COMMAND%": "solve-task " + prep_dir,
-    }
+    nb_procs = _get_number_procs(prep_dir)
 
-    for pattern, value in replacement_patterns.items():
-        script_content = script_content.replace(pattern, value)
+    # Each element of the array runs a queue worker, a chunk of tasks, or a
+    # single task.
+    chunk_size = config.CHUNK_SIZE
+    if config.QUEUE_WORKERS > 0:
+        WorkQueue(prep_dir).populate(range(nb_procs))
+        nb_array = min(config.QUEUE_WORKERS, nb_procs)
+        command = "solve-worker " + prep_dir
+        cpus_per_task = config.CPUS_PER_TASK or 1
+    elif chunk_size > 0:
+        nb_array = get_nb_chunks(nb_procs, chunk_size)
+        command = "solve-chunk -s %s -l %s %s" % (
+            chunk_size, config.CHUNK_LAYOUT, prep_dir)
+        cpus_per_task = config.CPUS_PER_TASK or chunk_size
+    else:
+        nb_array = nb_procs
+        command = "solve-task " + prep_dir
+        cpus_per_task = config.CPUS_PER_TASK or 1
 
-    with open(config.JOB_SCRIPT, 'w') as job_script:
-        job_script.write(script_content)
+    _write_job_script(config.JOB_SCRIPT, nb_array, prep_name, command,
+                      max(chunk_size, 1), cpus_per_task)
 
     # Submit newly written script
     command = [config.SCHEDULER_COMMAND, config.JOB_SCRIPT]
@@ -385,37 +707,116 @@ def _submit(prep_dir):
     stdout, stderr = popen.communicate()
 
 
-def solve(diffraction_file, models):
+def solve(diffraction_file, models, local=False, jobs=None):
     """
     Try to find a contaminant matchgin the diffraction file.
 
     Prepare the arguments file and all other files, generate the script from
     a template, and submit the job script to a scheduler.
 
+    Parameters
+    ----------
+    diffraction_file: string
+        MTZ or CIF file.
+
+    models: list(string)
+        Contaminants to test, in addition to the ContaBase.
+
+    local: boolean
+        Run the tasks on this machine instead of submitting them.
+
+    jobs: integer
+        With local, the number of tasks to run at the same time. Defaults to
+        what the CPUs and the memory allow.
+
     """
     if not _is_contabase_ready():
         raise RuntimeError("ContaBase is not ready yet.")
 
-    prep_dir = _prepare_solve(diffraction_file, models)
-    _submit(prep_dir)
+    # The JobStore needs all the tasks to run on this machine.
+    use_store = config.JOB_STORE == "sqlite"
+    if use_store and not local:
+        LOG.warning("job_store = sqlite is only used with --local. Store the "
+                    "tasks in %s instead.", config.ARGS_FILENAME)
+        use_store = False
+
+    prep_dir = _prepare_solve(diffraction_file, models, use_store)
+    if local:
+        try:
+            LocalExecutor(prep_dir, jobs).run()
+        finally:
+            _compile(prep_dir)
+    else:
+        _submit(prep_dir)
 
 
-def solve_task(prep_dir, rank):
+def _compile(prep_dir):
     """
-    Run the morda_solve processes for the given arguments file.
+    Compile the results of a job into the tasks file.
 
-    Parameters
-    ----------
-    prep_dir: string
-        Path to the directory generated during the prepare step.
+    Once the job is complete, its results are added to the hit rates of the
+    contaminants.
 
-    rank: integer
-        Rank of the process to run.
+    Return
+    ------
+    TasksManager
+        The tasks of the job, with their results.
 
     """
     task_manager = TasksManager()
-    task_manager.load(os.path.join(prep_dir, config.ARGS_FILENAME))
-    task_manager.run(prep_dir, rank)
+    for _ in _iter_compile(task_manager, prep_dir):
+        pass
+    return task_manager
+
+
+def _iter_compile(task_manager, prep_dir):
+    """
+    Compile the results of a job, and yield the jobs as they are compiled.
+
+    Same as _compile, with the jobs loaded in task_manager. The jobs whose
+    status changed are saved in the tasks file once all the jobs have been
+    yielded.
+
+    Yields
+    ------
+    integer
+        The rank of the job.
+
+    dict
+        The compiled job.
+
+    """
+    os.chdir(prep_dir)
+    tasks_path = get_tasks_path(".")
+    task_manager.load(tasks_path, compact=True)
+    yield from task_manager.iter_compiled(
+        state_filepath=config.COMPILE_STATE_FILENAME)
+    task_manager.save_changed(tasks_path)
+
+    if task_manager.complete:
+        _record_hits(os.getcwd(), task_manager.jobs)
+
+
+def _record_hits(prep_dir, jobs):
+    """Add the results of a complete job to the hit rates."""
+    record_job(config.HIT_RATES_PATH, prep_dir, jobs,
+               config.EARLY_STOP_PERCENT)
+
+
+def learn_hit_rates(prep_dirs):
+    """
+    Add the results of previous jobs to the hit rates.
+
+    The results of each job are compiled. Jobs which are not complete are
+    ignored.
+
+    """
+    orig_dir = os.getcwd()
+    for prep_dir in prep_dirs:
+        os.chdir(orig_dir)
+        task_manager = _compile(prep_dir)
+        if not task_manager.complete:
+            print("Job in folder %s is not complete, ignored." % prep_dir)
 
 
 def solve_status(prep_dir):
@@ -426,130 +827,269 @@ def solve_status(prep_dir):
     display the status of the job. Possible values are:
     * running: if at least one result is missing
     * complete: if all results are available for all combinations of pack/
-    space groups
+    space groups, except for the tasks skipped after an early stop, and the
+    failed tasks
+
+    The failed tasks are listed with their exit status and error. In queue
+    mode, the tasks of dead workers are put back in the queue.
 
     """
-    task_manager = TasksManager()
-    os.chdir(prep_dir)
-    task_manager.load(config.ARGS_FILENAME)
-    task_manager.compile_results()
-    task_manager.save(config.ARGS_FILENAME)
+    task_manager = _compile(prep_dir)
 
-    if task_manager.complete:
-        print("Job in folder %s is complete." % prep_dir)
+    tasks_path = get_tasks_path(".")
+    if is_store_path(tasks_path):
+        _print_store_status(prep_dir, tasks_path)
     else:
-        print("Job in folder %s is running." % prep_dir)
+        _print_status(prep_dir, task_manager.complete,
+                      task_manager.nb_skipped, task_manager.get_failed())
+
+    if os.path.isdir(QUEUE_DIR):
+        _recover_queue(os.getcwd())
+
 
+def _recover_queue(prep_dir):
+    """Put the claims of dead workers back in the queue of a job."""
+    nb_recovered = WorkQueue(prep_dir).recover()
+    if nb_recovered:
+        print("%s tasks of dead workers are back in the queue. Run them with "
+              "`contaminer solve-worker %s`." % (nb_recovered, prep_dir))
 
-def _get_best_task(tasks):
+
+def _print_store_status(prep_dir, store_path):
+    """Display the status of a job from the counts of its JobStore."""
+    with JobStore(store_path) as store:
+        counts = store.count_by_status()
+        failed = [(rank, job['results'])
+                  for rank, job in store.read_jobs_with_status("failed")]
+    nb_final = sum(counts.get(status, 0) for status in FINAL_STATUSES)
+    _print_status(prep_dir, nb_final == sum(counts.values()),
+                  counts.get("skipped", 0), failed)
+
+
+def _print_status(prep_dir, complete, nb_skipped, failed):
     """
-    Return the task with the best results from the tasks list.
+    Display the status of a job, and the failed tasks.
 
-    A task is considered best than another if the "percentage" in the results
-    is higher. If the percentage is equal, the task with highest Q factor is
-    considered best. If the Q factor is also equal, the first task of the list
-    with the highest percentage an Q factor is selected.
-    Tasks in running state are not eligible, since no result is available.
-    If no task is eligible, return None.
+    Parameters
+    ----------
+    prep_dir: string
+        The directory of the job.
+
+    complete: boolean
+        True if all the tasks are done.
+
+    nb_skipped: integer
+        Number of tasks skipped after an early stop.
+
+    failed: list(tuple(integer, dict))
+        The rank and results (exit_status and error) of the failed tasks.
 
     """
-    # Make sure not to work on an emtpy list.
-    if not tasks:
-        return None
+    details = []
+    if nb_skipped:
+        details.append("%s tasks skipped" % nb_skipped)
+    if failed:
+        details.append("%s tasks failed" % len(failed))
 
-    best_task = None
-    for task in tasks:
-        if task['status'] == 'complete':
-            if not best_task:  # No other data to compare.
-                best_task = task
-                continue
+    if not complete:
+        print("Job in folder %s is running." % prep_dir)
+    elif details:
+        print("Job in folder %s is complete (%s)."
+              % (prep_dir, ", ".join(details)))
+    else:
+        print("Job in folder %s is complete." % prep_dir)
 
-            # Otherwise, compare with current best task.
-            results = task['results']
-            best_results = best_task['results']
-            if results['percent'] > best_results['percent']:
-                best_task = task
-            elif results['percent'] == best_results['percent']:
-                if results['q_factor'] > best_results['q_factor']:
-                    best_task = task
+    for rank, results in failed:
+        print("Task %s failed with exit status %s: %s"
+              % (rank, results['exit_status'], results['error']))
 
-    return best_task
 
+def _match_job(job, min_percent=None, statuses=None, models=None):
+    """Return True if the job passes the filters of show_job."""
+    if statuses and job['status'] not in statuses:
+        return False
+    if models and job['infos']['model_name'] not in models:
+        return False
+    if min_percent is not None:
+        results = job['results']
+        return bool(results) and results.get('percent') is not None \
+            and results['percent'] >= min_percent
+    return True
+
+
+def _project(record, fields):
+    """
+    Return the fields of a record.
+
+    Fields are dotted paths, like results.percent. Missing fields are None.
+
+    """
+    projection = {}
+    for field in fields:
+        value = record
+        for key in field.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+
+        keys = field.split(".")
+        target = projection
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+        target[keys[-1]] = value
+    return projection
+
+
+def _stream_job(prep_dir, min_percent=None, statuses=None, models=None,
+                fields=None):
+    """
+    Print the jobs in NDJSON, as they are compiled.
+
+    Each line is a JSON object with the rank of the job, followed by its
+    infos, args, results and status. Only the jobs passing the filters are
+    printed, with the given fields only.
+
+    The jobs are read, compiled and saved one at a time (see
+    TasksManager.stream_compiled), so the memory used does not depend on the
+    size of the job, and the first lines are printed right away.
 
-def show_job(prep_dir, summary=False):
+    """
+    os.chdir(prep_dir)
+    tasks_path = get_tasks_path(".")
+    complete = True
+    for rank, job in TasksManager.stream_compiled(tasks_path):
+        complete = complete and job['status'] in FINAL_STATUSES
+        if not _match_job(job, min_percent, statuses, models):
+            continue
+
+        record = {'rank': rank}
+        record.update((key, job[key])
+                      for key in ('infos', 'args', 'results', 'status'))
+        if fields:
+            record = _project(record, fields)
+        print(json.dumps(record), flush=True)
+
+    if complete:
+        _record_hits(os.getcwd(), (
+            job for _, job in TasksManager.iter_jobs(tasks_path)))
+
+
+def show_job(prep_dir, summary=False, ndjson=False, min_percent=None,
+             statuses=None, models=None, fields=None):
     """
     Compile all results of a job into the tasks file.
 
     Consult each task, retrieve the results if available, and write all
     of them in the tasks.json file, then display the content of the file.
 
-    If summary is set to True, display only the best task per contaminant.
-    The best task is selected based on the results of MordaSolve.
+    If summary is set to True, display only the best task per contaminant,
+    with the number of tasks, the fraction of complete tasks and the top
+    tasks of the contaminant (see contaminer.summary). The best task is
+    selected based on the results of MordaSolve. The status of a contaminant
+    is "skipped" if its tasks are done, but some of them have been skipped
+    after an early stop, and "failed" if some of them failed.
 
-    """
-    task_manager = TasksManager()
-    os.chdir(prep_dir)
-    task_manager.load(config.ARGS_FILENAME)
-    task_manager.compile_results()
-    task_manager.save(config.ARGS_FILENAME)
+    If ndjson is set to True, print one line per task as soon as it is
+    compiled, instead of the content of the file. Only the tasks with at
+    least min_percent, one of the statuses and one of the models are printed,
+    with only the given fields (dotted paths, like results.percent).
 
-    if not summary:
-        with open(config.ARGS_FILENAME, 'r') as results:
+    """
+    if ndjson:
+        _stream_job(prep_dir, min_percent, statuses, models, fields)
+        return
+    if min_percent is not None or statuses or models or fields:
+        raise RuntimeError("Filters and fields are only available in NDJSON.")
+
+    task_manager = _compile(prep_dir)
+
+    tasks_path = get_tasks_path(".")
+    if is_store_path(tasks_path):
+        # The legacy JSON documents, computed by SQL queries.
+        with JobStore(tasks_path) as store:
+            if summary:
+                print(json.dumps({
+                    'tasks': store.get_summary(FINAL_STATUSES, TOP_K)}))
+            else:
+                print(store.export_json())
+    elif not summary:
+        with open(tasks_path, 'r') as results:
             print(results.read())
     else:
-        display = {
-            'tasks': []
-        }  # Dictionnary to display at the end.
-
-        model_names = list(set([
-            task['infos']['model_name']
-            for task in task_manager.jobs
-        ]))
-        for model_name in model_names:
-            # Get all tasks for this model.
-            tasks = [
-                task for task in task_manager.jobs
-                if task['infos']['model_name'] == model_name
-            ]
-
-            # Decide status for the analysis of this model.
-            if all([task['status'] == 'complete' for task in tasks]):
-                status = 'complete'
-            else:
-                status = 'running'
-
-            # Try to get a best task for this model.
-            best_task = _get_best_task(tasks)
-            if best_task:
-                display['tasks'].append({
-                    'infos': best_task['infos'],
-                    'args_for_best': best_task['args'],
-                    'results': best_task['results'],
-                    'status': status
-                })
-            else:
-                # No result found, still add the details about
-                display['tasks'].append({
-                    'infos': tasks[0]['infos'],
-                    'args_for_best': None,
-                    'results': None,
-                    'status': status
-                })
+        print(json.dumps({'tasks': summarize_jobs(task_manager.jobs)}))
+
+
+def show_maps(prep_dir, min_percent=0):
+    """
+    Print the paths to the electron density maps of the solved tasks.
 
-        print(json.dumps(display))
+    Compile the results of the job, then generate the maps of the tasks with
+    at least min_percent, unless they are already available. Print a JSON
+    document with the paths to the maps for each task.
+
+    """
+    task_manager = _compile(prep_dir)
+
+    display = {
+        'tasks': []
+    }
+    for job, (map_file, diff_map_file) in make_job_maps(
+            task_manager.jobs, min_percent):
+        display['tasks'].append({
+            'infos': job['infos'],
+            'args': job['args'],
+            'map': map_file,
+            'diff_map': diff_map_file
+        })
+
+    print(json.dumps(display))
+
+
+def migrate_store(prep_dir):
+    """
+    Move the tasks of a prep directory from tasks.json to a JobStore.
+
+    tasks.json is kept, but no longer updated. Only the jobs run with
+    `solve --local` can be migrated, once they have ended: WAL does not work
+    across the nodes of a cluster, and running tasks still use tasks.json.
+
+    Raises
+    ------
+    RuntimeError
+        If the job has been submitted to a scheduler, or is still running.
+
+    """
+    if os.path.exists(os.path.join(prep_dir, config.JOB_SCRIPT)):
+        raise RuntimeError("%s has been submitted to a scheduler, its tasks "
+                           "can only be stored in tasks.json." % prep_dir)
+
+    orig_dir = os.getcwd()
+    task_manager = _compile(prep_dir)
+    os.chdir(orig_dir)
+    if not task_manager.complete:
+        raise RuntimeError("%s is still running. Migrate it once all its "
+                           "tasks have ended." % prep_dir)
+
+    store_path = migrate_prep_dir(prep_dir)
+    print("Tasks of %s migrated to %s." % (prep_dir, store_path))
 
 
 def _get_all_models():
     """
     Return the list of all models available in the ContaBase.
 
+    The contaminants are read from the index of the ContaBase, so that the
+    other files of the ContaBase directory and the retired models are
+    ignored. Only the prepared contaminants are returned.
+
     Return
     ------
     list(string)
         List of contaminants in the ContaBase
 
     """
-    return os.listdir(config.CONTABASE_DIR)
+    contabase_index = get_contabase_index()
+    return [uniprot_id
+            for uniprot_id, entry in contabase_index.contaminants.items()
+            if entry['nb_packs'] is not None]
 
 
 def _get_number_procs(prep_dir):
@@ -565,7 +1105,7 @@ def _get_number_procs(prep_dir):
     os.chdir(prep_dir)
 
     tasks_manager = TasksManager()
-    tasks_manager.load(config.ARGS_FILENAME)
+    tasks_manager.load(get_tasks_path("."))
     return tasks_manager.nb_jobs
 
 
@@ -577,4 +1117,52 @@ def show_contabase():
     and contaminants.
 
     """
-    print(resources.read_text(contaminer_data, "contabase.yaml"))
+    print(resources.files(contaminer_data).joinpath(
+        "contabase.yaml").read_text())
+
+
+def check_space_groups():
+    """
+    Compare the built-in alternative space groups with alt_sg_list.
+
+    Run alt_sg_list from MoRDa for every space group of the table, and print
+    the space groups for which the alternatives differ.
+
+    Raises
+    ------
+    RuntimeError
+        If at least one space group differs.
+
+    """
+    names = get_space_group_names()
+    alt_sg_tasks = [AltSgList(name) for name in names]
+    runner = get_default_runner()
+    outcomes = runner.run_many([
+        alt_sg_task.run_async(runner)
+        for alt_sg_task in alt_sg_tasks
+    ])
+
+    nb_differences = 0
+    for name, alt_sg_task, outcome in zip(names, alt_sg_tasks, outcomes):
+        alt_sg_task.cleanup()
+        if isinstance(outcome, Exception):
+            print("%s: alt_sg_list failed (%s)." % (name, outcome))
+            nb_differences += 1
+            continue
+
+        expected = set()
+        for alt_sg in alt_sg_task.get_alt_space_groups():
+            try:
+                expected.add(normalize_space_group(alt_sg))
+            except ValueError:
+                expected.add(alt_sg)
+        table = set(get_alt_space_groups(name))
+        if expected != table:
+            print("%s: alt_sg_list gives %s, table gives %s." % (
+                name, sorted(expected), sorted(table)))
+            nb_differences += 1
+
+    print("%s space groups checked, %s differences." % (
+        len(names), nb_differences))
+    if nb_differences:
+        raise RuntimeError("The space group table differs from alt_sg_list.")
@@ -0,0 +1,368 @@
+"""
+Compute electron density maps from MTZ files with NumPy.
+
+In-process alternative to contaminer.ccp4.Mtz2Map, which runs sftools. The
+map (FWT, PHWT) and the difference map (DELFWT, PHDELWT) are computed in one
+pass over the reflections: the reflections are expanded once to the whole
+reciprocal space with the symmetry operators of the MTZ file, and both maps
+are transformed together.
+
+The maps cover the unit cell and are in absolute scale. F000 is not in the
+MTZ file, so the mean density of the maps is zero.
+
+Classes
+-------
+FftMtz2Map
+    Convert a MTZ file into 2 MAP files, with the interface of Mtz2Map.
+
+Functions
+---------
+parse_symmetry_operator
+    Return the rotation and translation of a symmetry operator.
+
+compute_maps
+    Compute density maps from the columns of a MTZ file.
+
+write_ccp4_map
+    Write a density map in CCP4 format.
+
+read_ccp4_map
+    Read a density map in CCP4 format.
+
+"""
+
+from fractions import Fraction
+import logging
+import math
+import os
+import re
+
+import numpy
+
+from contaminer.mtz import MtzFile
+from contaminer.runner import get_default_runner
+
+LOG = logging.getLogger(__name__)
+
+MAP_COLUMNS = (("FWT", "PHWT"), ("DELFWT", "PHDELWT"))
+# The grid spacing is at most a third of the resolution along each axis.
+GRID_SAMPLING = 3
+CCP4_HEADER_SIZE = 1024
+
+
+def parse_symmetry_operator(operator):
+    """
+    Return the rotation and translation of a symmetry operator.
+
+    Parameters
+    ----------
+    operator: string
+        The operator, like "-X,Y+1/2,-Z" or "X-Y,X,Z+2/3".
+
+    Return
+    ------
+    numpy.ndarray
+        The 3x3 integer rotation matrix, applied to column vectors.
+
+    tuple(fractions.Fraction)
+        The translation, in fractional coordinates.
+
+    Raises
+    ------
+    ValueError
+        If the operator cannot be parsed.
+
+    """
+    rows = operator.upper().replace(' ', '').split(',')
+    if len(rows) != 3:
+        raise ValueError("Invalid symmetry operator: %s." % operator)
+
+    rotation = numpy.zeros((3, 3), dtype=numpy.int64)
+    translation = [Fraction(0)] * 3
+    for row_index, row in enumerate(rows):
+        for sign, term in re.findall(r'([+-]?)([^+-]+)', row):
+            factor = -1 if sign == '-' else 1
+            try:
+                if term[-1] in "XYZ":
+                    coefficient = term[:-1].rstrip('*')
+                    rotation[row_index, "XYZ".index(term[-1])] += \
+                        factor * (int(coefficient) if coefficient else 1)
+                else:
+                    translation[row_index] += factor * Fraction(term)
+            except ValueError:
+                raise ValueError("Invalid symmetry operator: %s." % operator)
+
+    return rotation, tuple(value % 1 for value in translation)
+
+
+def _is_fft_friendly(size):
+    """Return True if size has no prime factor other than 2, 3 and 5."""
+    for prime in (2, 3, 5):
+        while size % prime == 0:
+            size //= prime
+    return size == 1
+
+
+def _get_grid(max_indices, operators):
+    """
+    Return the number of grid points along each axis.
+
+    The grid samples the maximum indices with GRID_SAMPLING points, is
+    compatible with the translations of the operators, and is the same on
+    the axes mixed by the operators (like x and y in hexagonal groups).
+
+    """
+    # Axes mixed by a rotation share their grid.
+    groups = [{axis} for axis in range(3)]
+    for rotation, _ in operators:
+        for row, column in zip(*numpy.nonzero(rotation)):
+            if groups[row] is not groups[column]:
+                merged = groups[row] | groups[column]
+                for axis in merged:
+                    groups[axis] = merged
+
+    grid = [0, 0, 0]
+    for group in {id(group): group for group in groups}.values():
+        factor = 1
+        for _, translation in operators:
+            for axis in group:
+                factor = factor * translation[axis].denominator \
+                    // math.gcd(factor, translation[axis].denominator)
+        minimum = max(GRID_SAMPLING * max_indices[axis] for axis in group)
+        size = max(factor, -(-minimum // factor) * factor)
+        while not _is_fft_friendly(size):
+            size += factor
+        for axis in group:
+            grid[axis] = size
+
+    return tuple(grid)
+
+
+def _get_cell_volume(cell):
+    """Return the volume of a unit cell."""
+    a, b, c = cell[:3]
+    cos_alpha, cos_beta, cos_gamma = numpy.cos(numpy.radians(cell[3:6]))
+    return a * b * c * math.sqrt(
+        1 - cos_alpha**2 - cos_beta**2 - cos_gamma**2
+        + 2 * cos_alpha * cos_beta * cos_gamma)
+
+
+def compute_maps(mtz_file, column_pairs=MAP_COLUMNS):
+    """
+    Compute density maps from the columns of a MTZ file.
+
+    Parameters
+    ----------
+    mtz_file: contaminer.mtz.MtzFile
+        The file holding the map coefficients.
+
+    column_pairs: list(tuple)
+        The amplitude and phase (in degrees) labels of each map.
+
+    Return
+    ------
+    list(numpy.ndarray)
+        For each map, the float32 density, indexed by x, y and z.
+
+    """
+    hkl = mtz_file.miller_indices().astype(numpy.int64)
+    valid = numpy.ones(len(hkl), dtype=bool)
+    coefficients = []
+    for amplitude_label, phase_label in column_pairs:
+        amplitudes = mtz_file.column(amplitude_label).astype(numpy.float64)
+        phases = mtz_file.column(phase_label).astype(numpy.float64)
+        valid &= numpy.isfinite(amplitudes) & numpy.isfinite(phases)
+        if not math.isnan(mtz_file.missing_value):
+            valid &= (amplitudes != mtz_file.missing_value)
+            valid &= (phases != mtz_file.missing_value)
+        coefficients.append(amplitudes * numpy.exp(1j * numpy.radians(phases)))
+    hkl = hkl[valid]
+    coefficients = numpy.stack(coefficients)[:, valid]
+
+    operators = [
+        parse_symmetry_operator(operator)
+        for operator in mtz_file.symmetry_operators
+    ] or [parse_symmetry_operator("X,Y,Z")]
+
+    # Symmetry equivalents: F(hR) = F(h) exp(-2 pi i h.t).
+    indices = []
+    values = []
+    for rotation, translation in operators:
+        shift = numpy.exp(
+            -2j * numpy.pi * (hkl @ numpy.array(translation, dtype=float)))
+        indices.append(hkl @ rotation)
+        values.append(coefficients * shift)
+    indices = numpy.concatenate(indices)
+    values = numpy.concatenate(values, axis=1)
+    # Friedel mates: F(-h) = conj(F(h)).
+    indices = numpy.concatenate([indices, -indices])
+    values = numpy.concatenate([values, values.conj()], axis=1)
+
+    max_indices = numpy.abs(indices).max(axis=0) if len(indices) else (0,) * 3
+    grid = _get_grid([int(index) for index in max_indices], operators)
+    LOG.debug("Compute %s maps on a %s grid from %s reflections.",
+              len(column_pairs), grid, len(hkl))
+
+    # rho(x) = 1/V sum F(h) exp(-2 pi i h.x) = 1/V sum conj(F(h))
+    # exp(2 pi i h.x), which is irfftn on the half grid l <= nz/2.
+    indices = indices % numpy.array(grid)
+    half = indices[:, 2] <= grid[2] // 2
+    half_grid = numpy.zeros(
+        (len(column_pairs), grid[0], grid[1], grid[2] // 2 + 1),
+        dtype=numpy.complex128)
+    half_grid[:, indices[half, 0], indices[half, 1], indices[half, 2]] = \
+        values[:, half].conj()
+
+    densities = numpy.fft.irfftn(half_grid, s=grid, axes=(1, 2, 3))
+    densities *= grid[0] * grid[1] * grid[2] / _get_cell_volume(mtz_file.cell)
+    return [density.astype(numpy.float32) for density in densities]
+
+
+def write_ccp4_map(file_path, density, cell, space_group_number=1,
+                   symmetry_operators=(), label=""):
+    """
+    Write a density map covering the unit cell in CCP4 format.
+
+    Parameters
+    ----------
+    file_path: string
+        Path to the MAP file to write.
+
+    density: numpy.ndarray
+        The density, indexed by x, y and z.
+
+    cell: tuple(float)
+        The unit cell: a, b, c, alpha, beta, gamma.
+
+    space_group_number: integer
+        The space group number.
+
+    symmetry_operators: list(string)
+        The symmetry operators, written after the header.
+
+    label: string
+        Written as first label of the map.
+
+    """
+    density = numpy.asarray(density, dtype='<f4')
+    header = numpy.zeros(CCP4_HEADER_SIZE // 4, dtype='<i4')
+    floats = header.view('<f4')
+    symmetry = b"".join(
+        operator.ljust(80).encode('ASCII') for operator in symmetry_operators)
+
+    header[0:3] = density.shape    # Columns, rows and sections.
+    header[3] = 2                  # Mode: float32.
+    header[7:10] = density.shape   # Grid of the unit cell.
+    floats[10:16] = cell
+    header[16:19] = (1, 2, 3)      # Columns along x, rows along y.
+    floats[19:22] = (density.min(), density.max(), density.mean())
+    header[22] = space_group_number
+    header[23] = len(symmetry)
+    header[27] = 20140             # MRC 2014 format.
+    floats[54] = density.std()
+    header[55] = 1                 # Number of labels.
+
+    header_bytes = bytearray(header.tobytes())
+    header_bytes[208:212] = b'MAP '
+    header_bytes[212:216] = bytes([0x44, 0x41, 0, 0])
+    header_bytes[224:304] = label[:80].ljust(80).encode('ASCII')
+
+    temp_path = "%s.%s.tmp" % (file_path, os.getpid())
+    with open(temp_path, 'wb') as map_file:
+        map_file.write(header_bytes)
+        map_file.write(symmetry)
+        # Columns (x) vary fastest in the file.
+        map_file.write(density.transpose(2, 1, 0).tobytes())
+    os.replace(temp_path, file_path)
+
+
+def read_ccp4_map(file_path):
+    """
+    Read a density map in CCP4 format.
+
+    Return
+    ------
+    numpy.ndarray
+        The float32 density, indexed by x, y and z.
+
+    tuple(float)
+        The unit cell: a, b, c, alpha, beta, gamma.
+
+    """
+    with open(file_path, 'rb') as map_file:
+        header_bytes = map_file.read(CCP4_HEADER_SIZE)
+        byte_order = '>' if header_bytes[212] >> 4 == 1 else '<'
+        header = numpy.frombuffer(header_bytes, dtype=byte_order + 'i4')
+        floats = header.view(byte_order + 'f4')
+        if header[3] != 2:
+            raise ValueError("Unsupported map mode %s in %s."
+                             % (header[3], file_path))
+        map_file.seek(CCP4_HEADER_SIZE + int(header[23]))
+        shape = tuple(int(size) for size in header[2::-1])
+        data = numpy.fromfile(map_file, dtype=byte_order + 'f4',
+                              count=shape[0] * shape[1] * shape[2])
+
+    # File axes are sections, rows and columns. Reorder them to x, y and z.
+    axes = [int(axis) - 1 for axis in header[18:15:-1]]
+    density = data.reshape(shape).transpose(numpy.argsort(axes))
+    cell = tuple(float(value) for value in floats[10:16])
+    return density.astype(numpy.float32), cell
+
+
+class FftMtz2Map():
+    """
+    Convert a MTZ file into 2 MAP files with NumPy.
+
+    Same interface and output files as contaminer.ccp4.Mtz2Map.
+
+    Attributes
+    ----------
+    input_file: string
+        The path to the MTZ file to convert to MAP.
+
+    """
+
+    def __init__(self, input_file):
+        self.input_file = input_file
+        filename, _ = os.path.splitext(input_file)
+        self.output_map_file = filename + '.map'
+        self.output_diff_file = filename + '_diff.map'
+
+    def run(self):
+        """Compute both maps and write them."""
+        mtz_file = MtzFile(self.input_file)
+        try:
+            densities = compute_maps(mtz_file)
+        except KeyError as err:
+            raise RuntimeError("Cannot compute maps of %s: %s"
+                               % (self.input_file, err))
+
+        output_files = self.get_output_files()
+        for output_file, density, columns in zip(
+                output_files, densities, MAP_COLUMNS):
+            write_ccp4_map(
+                output_file,
+                density,
+                mtz_file.cell,
+                mtz_file.space_group_number or 1,
+                mtz_file.symmetry_operators,
+                "ContaMiner FFT %s %s" % columns)
+        LOG.debug("Maps written in %s.", output_files)
+
+    async def run_async(self, runner=None):
+        """Same as run, counted as a running tool by the runner."""
+        if runner is None:
+            runner = get_default_runner()
+        await runner.call_async(self.run)
+
+    def get_output_files(self):
+        """
+        Return the path to the electronic density files.
+
+        Return
+        ------
+        2-tuple:
+            String paths to the map and difference map files.
+
+        """
+        return (self.output_map_file, self.output_diff_file)
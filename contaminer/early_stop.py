@@ -0,0 +1,225 @@
+"""
+Stop the remaining tasks of a job once a contaminant is identified.
+
+When a morda_solve task reaches early_stop_percent, it writes a stop marker
+in the prep directory. With the "job" scope, the marker stops all the tasks
+of the job. With the "contaminant" scope, it stops only the other tasks of
+the same contaminant.
+
+Tasks check the markers when they start, and are skipped if a marker
+applies to them. Running tasks check the markers periodically, and stop
+morda_solve. With the "job" scope, the configured cancel_command is also run,
+so the scheduler cancels the tasks which did not start yet.
+
+Tasks without results, stopped by a marker, get the "skipped" status when
+the results are compiled.
+
+Classes
+-------
+EarlyStop
+    Write and check the stop markers of a prep directory.
+
+Functions
+---------
+get_early_stop
+    Return the EarlyStop configured by the user for a prep directory.
+
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shlex
+import subprocess
+
+from contaminer import config
+
+LOG = logging.getLogger(__name__)
+
+SCOPE_OFF = "off"
+SCOPE_JOB = "job"
+SCOPE_CONTAMINANT = "contaminant"
+SCOPES = (SCOPE_OFF, SCOPE_JOB, SCOPE_CONTAMINANT)
+
+STOP_DIR = "stop"
+# Seconds between two checks of the markers while morda_solve runs.
+POLL_INTERVAL = 30
+
+
+class EarlyStop():
+    """
+    Write and check the stop markers of a prep directory.
+
+    Attributes
+    ----------
+    prep_dir: string
+        The directory generated during the prepare step.
+
+    scope: string
+        One of SCOPE_OFF, SCOPE_JOB or SCOPE_CONTAMINANT.
+
+    min_percent: float
+        Percent from which a contaminant is considered as identified.
+
+    cancel_command: string
+        Command to cancel the tasks of the job in the scheduler, or None.
+
+    """
+
+    def __init__(self, prep_dir, scope=SCOPE_OFF, min_percent=90,
+                 cancel_command=None):
+        if scope not in SCOPES:
+            raise ValueError("Unknown early stop scope: %s. Use one of %s."
+                             % (scope, ", ".join(SCOPES)))
+        self.prep_dir = prep_dir
+        self.scope = scope
+        self.min_percent = min_percent
+        self.cancel_command = cancel_command
+
+    def _get_marker_path(self, scope, model_name):
+        """Return the path to the stop marker of scope."""
+        if scope == SCOPE_JOB:
+            marker_name = "job.json"
+        else:
+            # Custom model names may be paths.
+            marker_name = "contaminant_%s.json" % model_name.replace(
+                os.sep, "_")
+        return os.path.join(self.prep_dir, STOP_DIR, marker_name)
+
+    def is_stopped(self, model_name):
+        """
+        Return True if the tasks of model_name must stop.
+
+        Markers are checked for both scopes, whatever the configured scope.
+
+        """
+        return any(
+            os.path.exists(self._get_marker_path(scope, model_name))
+            for scope in (SCOPE_JOB, SCOPE_CONTAMINANT)
+        )
+
+    def record_hit(self, model_name, rank, percent, cancel=True):
+        """
+        Write a stop marker if the task identified its contaminant.
+
+        Parameters
+        ----------
+        model_name: string
+            The contaminant of the task.
+
+        rank: integer
+            The rank of the task.
+
+        percent: float
+            The percent given by morda_solve.
+
+        cancel: boolean
+            If False, do not run the cancel command. The task runs it with
+            EarlyStop.cancel once its own work is saved, as the command may
+            cancel the task itself.
+
+        Return
+        ------
+        boolean
+            True if a marker has been written by this call.
+
+        """
+        if self.scope == SCOPE_OFF or percent < self.min_percent:
+            return False
+
+        marker_path = self._get_marker_path(self.scope, model_name)
+        os.makedirs(os.path.dirname(marker_path), exist_ok=True)
+        try:
+            # Only the first hit writes the marker and cancels the tasks.
+            marker_fd = os.open(
+                marker_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            return False
+        with os.fdopen(marker_fd, 'w') as marker_file:
+            marker_file.write(json.dumps({
+                'model_name': model_name,
+                'rank': rank,
+                'percent': percent
+            }))
+        LOG.info("%s identified by task %s (%s%%). Stop the %s.",
+                 model_name, rank, percent,
+                 "job" if self.scope == SCOPE_JOB else "other tasks")
+
+        if cancel:
+            self.cancel()
+        return True
+
+    def cancel(self):
+        """Run cancel_command for the prep directory, with the job scope."""
+        if self.scope != SCOPE_JOB or not self.cancel_command:
+            return
+
+        prep_dir = os.path.abspath(self.prep_dir)
+        replacement_patterns = {
+            "%PREP_NAME%": os.path.basename(prep_dir),
+            "%PREP_DIR%": prep_dir,
+        }
+        command = shlex.split(self.cancel_command)
+        for pattern, value in replacement_patterns.items():
+            command = [item.replace(pattern, value) for item in command]
+
+        LOG.info("Cancel the remaining tasks with %s.", command)
+        popen = subprocess.Popen(command,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+        _, stderr = popen.communicate()
+        if popen.returncode != 0:
+            LOG.warning("Cancel command failed: %s",
+                        stderr.decode('UTF-8', 'replace'))
+
+    async def run_async(self, tool, model_name, runner=None):
+        """
+        Run a tool, stopping it if a marker for model_name appears.
+
+        Parameters
+        ----------
+        tool: contaminer.ccp4.Tool
+            The tool to run, usually a MordaSolve.
+
+        model_name: string
+            The contaminant of the task.
+
+        runner: contaminer.runner.ToolRunner
+            The runner to use to start the tool.
+
+        Return
+        ------
+        boolean
+            True if the tool ran until its end, False if it was stopped.
+
+        """
+        task = asyncio.ensure_future(tool.run_async(runner))
+        while True:
+            done, _ = await asyncio.wait([task], timeout=POLL_INTERVAL)
+            if done:
+                task.result()
+                return True
+
+            if self.is_stopped(model_name):
+                LOG.info("%s already identified. Stop the task.",
+                         model_name)
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                return False
+
+    def run(self, tool, model_name, runner=None):
+        """Same as run_async, but block until the tool ends or is stopped."""
+        return asyncio.run(self.run_async(tool, model_name, runner))
+
+
+def get_early_stop(prep_dir):
+    """Return the EarlyStop configured by the user for prep_dir."""
+    return EarlyStop(
+        prep_dir,
+        config.EARLY_STOP,
+        config.EARLY_STOP_PERCENT,
+        config.CANCEL_COMMAND or None)
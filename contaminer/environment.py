@@ -0,0 +1,304 @@
+"""
+Provide the environment needed to run CCP4 and MoRDa tools.
+
+Sourcing ccp4.setup-sh and morda_env_sh is slow, and used to be done before
+each tool call. The environment produced by these scripts is captured once,
+stored in a cache file, and given as is to the tools afterwards.
+
+Classes
+-------
+ToolEnvironment
+    Capture, cache and apply the environment set by the setup scripts.
+
+Functions
+---------
+get_tool_environment
+    Return the environment dictionary to give to subprocess calls.
+
+"""
+
+import json
+import logging
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+from contaminer import config
+
+LOG = logging.getLogger(__name__)
+
+# Print the environment of the shell after sourcing the setup scripts.
+_DUMP_ENV_SCRIPT = "import json, os; print(json.dumps(dict(os.environ)))"
+# Increase when the layout of the cache changes.
+CACHE_VERSION = 2
+
+
+def _get_extension(inherited, value):
+    """
+    Return the prefix and suffix added to a list of paths, if any.
+
+    The values are split on os.pathsep. value extends inherited only if the
+    entries of inherited are exactly the first or the last entries of value.
+
+    Return
+    ------
+    list(string)
+        The prefix and suffix added around inherited, or None if value does
+        not extend inherited.
+
+    """
+    entries = value.split(os.pathsep)
+    inherited_entries = inherited.split(os.pathsep)
+    nb_inherited = len(inherited_entries)
+    if len(entries) <= nb_inherited:
+        return None
+    if entries[-nb_inherited:] == inherited_entries:
+        return [os.pathsep.join(entries[:-nb_inherited]) + os.pathsep, ""]
+    if entries[:nb_inherited] == inherited_entries:
+        return ["", os.pathsep + os.pathsep.join(entries[nb_inherited:])]
+    return None
+
+
+class ToolEnvironment():
+    """
+    Capture the environment set by the CCP4 and MoRDa setup scripts.
+
+    The scripts are sourced once in a shell, and the variables they set or
+    unset are stored in a cache file. The cache is keyed on the paths and
+    modification times of the scripts, so editing or moving a script
+    invalidates the cache.
+
+    Only the difference made by the scripts is stored. When the environment
+    is requested, this difference is applied on top of the current
+    environment, so scheduler variables (SLURM_*, ...) stay up to date.
+    Variables extended by the scripts (like PATH=/opt/ccp4/bin:$PATH) are
+    stored as the entries added before or after the inherited value, and
+    applied around the current value.
+
+    Attributes
+    ----------
+    setup_scripts: list(string)
+        Paths to the scripts to source, in this order.
+
+    cache_path: string
+        Path to the cache file.
+
+    source_time: float
+        Number of seconds needed to source the setup scripts. This is the time
+        saved by each tool call using the cached environment.
+
+    """
+
+    def __init__(self, setup_scripts, cache_path):
+        self.setup_scripts = list(setup_scripts)
+        self.cache_path = cache_path
+        self.source_time = None
+        self._set = None
+        self._extend = None
+        self._unset = None
+
+    def _get_cache_key(self):
+        """
+        Return the key identifying the current version of the setup scripts.
+
+        Return
+        ------
+        list(list)
+            [path, mtime] for each setup script.
+
+        """
+        key = []
+        for script in self.setup_scripts:
+            script = os.path.abspath(os.path.expanduser(script))
+            try:
+                mtime = os.stat(script).st_mtime_ns
+            except FileNotFoundError:
+                print(("Please set the paths to ccp4.setup-sh and morda_env_sh "
+                       "in %s." % config.UserConfig().config_path),
+                      file=sys.stderr)
+                raise RuntimeError("Setup script %s cannot be found." % script)
+            key.append([script, mtime])
+        return key
+
+    def _source(self):
+        """
+        Source the setup scripts and store the environment they produce.
+
+        Return
+        ------
+        dict
+            The full environment after sourcing the scripts.
+
+        """
+        sources = " && ".join([
+            ". %s" % shlex.quote(script)
+            for script in self.setup_scripts
+        ])
+        command_line = [
+            "sh", "-c",
+            "%s && %s -c %s" % (
+                sources,
+                shlex.quote(sys.executable),
+                shlex.quote(_DUMP_ENV_SCRIPT)
+            )
+        ]
+        LOG.debug("Source setup scripts: %s.", command_line)
+
+        start = time.perf_counter()
+        popen = subprocess.Popen(command_line,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+        stdout, stderr = popen.communicate()
+        self.source_time = time.perf_counter() - start
+
+        if popen.returncode != 0:
+            print("Sourcing the setup scripts failed.",
+                  file=sys.stderr)
+            print("-" * 50,
+                  file=sys.stderr)
+            print("Error: \n%s" % stderr.decode('UTF-8'),
+                  file=sys.stderr)
+            print("-" * 50,
+                  file=sys.stderr)
+            raise RuntimeError("Cannot source %s." % self.setup_scripts)
+
+        # The scripts may print messages before the environment dump.
+        sourced = json.loads(stdout.decode('UTF-8').strip().split('\n')[-1])
+        self._set = {}
+        self._extend = {}
+        for key, value in sourced.items():
+            inherited = os.environ.get(key)
+            if inherited == value:
+                continue
+            extension = _get_extension(inherited, value) if inherited \
+                else None
+            if extension is not None:
+                self._extend[key] = extension
+            else:
+                self._set[key] = value
+        self._unset = [key for key in os.environ if key not in sourced]
+        LOG.debug("Setup scripts sourced in %.3fs.", self.source_time)
+
+    def _read_cache(self, key):
+        """
+        Load the environment from the cache file.
+
+        Return
+        ------
+        boolean
+            True if a valid cache entry for key has been loaded.
+
+        """
+        try:
+            with open(self.cache_path, 'r') as cache_file:
+                cache = json.loads(cache_file.read())
+        except (OSError, ValueError):
+            return False
+
+        if cache.get('version') != CACHE_VERSION or cache.get('key') != key:
+            LOG.debug("Environment cache %s is outdated.", self.cache_path)
+            return False
+
+        self._set = cache['set']
+        self._extend = cache['extend']
+        self._unset = cache['unset']
+        self.source_time = cache['source_time']
+        return True
+
+    def _write_cache(self, key):
+        """Write the captured environment in the cache file."""
+        cache = {
+            'version': CACHE_VERSION,
+            'key': key,
+            'set': self._set,
+            'extend': self._extend,
+            'unset': self._unset,
+            'source_time': self.source_time,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = "%s.%s" % (self.cache_path, os.getpid())
+            with open(temp_path, 'w') as cache_file:
+                cache_file.write(json.dumps(cache))
+            os.replace(temp_path, self.cache_path)
+        except OSError as err:
+            # A missing cache is only slower, not an error.
+            LOG.warning("Cannot write environment cache %s: %s.",
+                        self.cache_path, err)
+
+    def load(self):
+        """
+        Load the environment from the cache, or source the setup scripts.
+
+        The cache file is (re)written if it is missing or outdated.
+
+        """
+        key = self._get_cache_key()
+        start = time.perf_counter()
+        if self._read_cache(key):
+            load_time = time.perf_counter() - start
+            LOG.info(("CCP4/MoRDa environment loaded from cache in %.3fs "
+                      "(%.3fs saved per tool call)."),
+                     load_time, self.source_time - load_time)
+            return
+
+        self._source()
+        self._write_cache(key)
+
+    def get_environ(self):
+        """
+        Return the environment to give to the tools.
+
+        Return
+        ------
+        dict
+            The current environment, updated with the variables set or
+            extended by the setup scripts.
+
+        """
+        if self._set is None:
+            self.load()
+
+        environ = dict(os.environ)
+        for key in self._unset:
+            environ.pop(key, None)
+        environ.update(self._set)
+        for key, (prefix, suffix) in self._extend.items():
+            current = environ.get(key)
+            if current:
+                environ[key] = prefix + current + suffix
+            else:
+                # No empty item in a list of paths.
+                environ[key] = (prefix.rstrip(os.pathsep)
+                                + suffix.lstrip(os.pathsep))
+        return environ
+
+
+_TOOL_ENVIRONMENT = None
+
+
+def get_tool_environment():
+    """
+    Return the environment to run CCP4 and MoRDa tools.
+
+    The setup scripts are read from the user configuration. The environment is
+    loaded only once per process.
+
+    Return
+    ------
+    dict
+        Environment to give as `env` to subprocess calls.
+
+    """
+    global _TOOL_ENVIRONMENT  # pylint: disable=global-statement
+    if _TOOL_ENVIRONMENT is None:
+        _TOOL_ENVIRONMENT = ToolEnvironment(
+            [config.CONFIG['PATH']['ccp4'], config.CONFIG['PATH']['morda']],
+            config.ENV_CACHE_PATH)
+
+    environ = _TOOL_ENVIRONMENT.get_environ()
+    LOG.debug("Use cached environment, saving %.3fs of sourcing.",
+              _TOOL_ENVIRONMENT.source_time)
+    return environ
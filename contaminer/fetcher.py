@@ -0,0 +1,282 @@
+"""
+Download the sequences and AlphaFold models of the ContaBase.
+
+`contaminer init` needs a sequence from UniProt for most contaminants, and a
+model from AlphaFold for some of them. The downloads run in a bounded thread
+pool. Each thread keeps one HTTP/1.1 connection open per host, so the
+connection (and TLS handshake) is reused by the next downloads. Network
+errors, server errors (5xx) and rate limiting (429) are retried with an
+exponential backoff; other HTTP errors fail at once.
+
+Downloaded files are kept in a local mirror directory, with the same layout
+as the URL (host, then path), and the SHA-256 of each file next to it:
+
+    <mirror>/www.uniprot.org/uniprot/P0ACJ8.fasta
+    <mirror>/www.uniprot.org/uniprot/P0ACJ8.fasta.sha256
+
+The mirror is looked up before the network, so a second init, or a node
+without network access, does not download anything. A mirror can be filled
+by copying the files of another one; files without checksum are trusted.
+Files whose checksum does not match are downloaded again.
+
+Classes
+-------
+Fetcher
+    Download files in a thread pool, through a local mirror.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import http.client
+import logging
+import os
+import shutil
+import threading
+import time
+import urllib.parse
+
+from contaminer import config
+
+LOG = logging.getLogger(__name__)
+
+UNIPROT_URL = "http://www.uniprot.org/uniprot/%s.fasta"
+ALPHAFOLD_URL = "https://alphafold.ebi.ac.uk/files/AF-%s-F1-model_v2.pdb"
+
+CHECKSUM_SUFFIX = ".sha256"
+MAX_REDIRECTS = 5
+# Statuses worth retrying: the server may answer later.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class _RetryableError(Exception):
+    """Raised for a download which may succeed if retried."""
+
+
+def _hash_bytes(content):
+    """Return the SHA-256 hex digest of bytes."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def _write_file(file_path, content):
+    """Write bytes in a file, atomically."""
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    temp_path = "%s.%s.%s.tmp" % (file_path, os.getpid(),
+                                  threading.get_ident())
+    with open(temp_path, 'wb') as written_file:
+        written_file.write(content)
+    os.replace(temp_path, file_path)
+
+
+class Fetcher():
+    """
+    Download files in a thread pool, through a local mirror.
+
+    Attributes
+    ----------
+    mirror_dir: string
+        The mirror directory, or None to always download. Default is
+        config.FETCH_MIRROR_DIR, and an empty string disables the mirror.
+
+    max_workers: integer
+        Number of downloads running at the same time.
+
+    retries: integer
+        Number of attempts after the first one.
+
+    backoff: float
+        Delay before the first retry, in seconds. Doubled at each retry.
+
+    timeout: float
+        Timeout of the network operations, in seconds.
+
+    """
+
+    def __init__(self, mirror_dir=None, max_workers=None, retries=None,
+                 backoff=1.0, timeout=60):
+        if mirror_dir is None:
+            mirror_dir = config.FETCH_MIRROR_DIR
+        self.mirror_dir = mirror_dir or None
+        self.max_workers = max_workers or config.FETCH_WORKERS
+        self.retries = config.FETCH_RETRIES if retries is None else retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _get_connection(self, scheme, netloc):
+        """Return the connection of this thread to a host."""
+        connections = self._local.__dict__.setdefault('connections', {})
+        key = (scheme, netloc)
+        if key not in connections:
+            if scheme == "https":
+                connection_class = http.client.HTTPSConnection
+            elif scheme == "http":
+                connection_class = http.client.HTTPConnection
+            else:
+                raise RuntimeError("Unsupported URL scheme: %s." % scheme)
+            connections[key] = connection_class(netloc, timeout=self.timeout)
+        return connections[key]
+
+    def _close_connection(self, scheme, netloc):
+        """Close the connection of this thread to a host, if any."""
+        connections = self._local.__dict__.get('connections', {})
+        connection = connections.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def _request(self, url):
+        """
+        Return the content of an URL, following the redirections.
+
+        Raises
+        ------
+        _RetryableError
+            For network errors, and statuses in RETRY_STATUSES.
+
+        RuntimeError
+            For the other HTTP errors.
+
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            connection = self._get_connection(parts.scheme, parts.netloc)
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                # A truncated body raises IncompleteRead.
+                content = response.read()
+            except (OSError, http.client.HTTPException) as error:
+                self._close_connection(parts.scheme, parts.netloc)
+                raise _RetryableError(str(error) or type(error).__name__)
+            if response.will_close:
+                self._close_connection(parts.scheme, parts.netloc)
+
+            if response.status in REDIRECT_STATUSES:
+                url = urllib.parse.urljoin(url, response.getheader('Location'))
+                continue
+            if response.status in RETRY_STATUSES:
+                raise _RetryableError("HTTP %s" % response.status)
+            if response.status != 200:
+                raise RuntimeError("Cannot download %s: HTTP %s."
+                                   % (url, response.status))
+            if not content:
+                raise _RetryableError("Empty content")
+            return content
+        raise RuntimeError("Too many redirections for %s." % url)
+
+    def _download(self, url):
+        """Return the content of an URL, with retries."""
+        attempt = 0
+        while True:
+            try:
+                return self._request(url)
+            except _RetryableError as error:
+                if attempt == self.retries:
+                    raise RuntimeError("Cannot download %s after %s attempts: "
+                                       "%s." % (url, attempt + 1, error))
+                delay = self.backoff * 2 ** attempt
+                LOG.info("Download of %s failed (%s). Retry in %ss.",
+                         url, error, delay)
+                time.sleep(delay)
+                attempt += 1
+
+    def get_mirror_path(self, url):
+        """Return the path of an URL in the mirror, or None without mirror."""
+        if self.mirror_dir is None:
+            return None
+        parts = urllib.parse.urlsplit(url)
+        return os.path.join(self.mirror_dir, parts.netloc,
+                            *parts.path.strip("/").split("/"))
+
+    def _read_mirror(self, mirror_path):
+        """Return the content of a mirror file, or None if not usable."""
+        try:
+            with open(mirror_path, 'rb') as mirror_file:
+                content = mirror_file.read()
+        except FileNotFoundError:
+            return None
+        try:
+            with open(mirror_path + CHECKSUM_SUFFIX, 'r') as checksum_file:
+                checksum = checksum_file.read().strip()
+        except FileNotFoundError:
+            # Copied in the mirror by hand.
+            return content
+        if _hash_bytes(content) != checksum:
+            LOG.warning("Checksum of %s does not match. Download it again.",
+                        mirror_path)
+            return None
+        return content
+
+    def fetch(self, url, destination):
+        """
+        Write the content of an URL in a file.
+
+        Parameters
+        ----------
+        url: string
+            The URL to download.
+
+        destination: string
+            The path of the file to write.
+
+        Return
+        ------
+        boolean
+            True if the file has been downloaded, False if it comes from the
+            mirror.
+
+        """
+        mirror_path = self.get_mirror_path(url)
+        if mirror_path is not None \
+                and self._read_mirror(mirror_path) is not None:
+            LOG.debug("Copy %s from mirror.", url)
+            shutil.copyfile(mirror_path, destination)
+            return False
+
+        LOG.debug("Download %s.", url)
+        content = self._download(url)
+        if mirror_path is not None:
+            _write_file(mirror_path, content)
+            _write_file(mirror_path + CHECKSUM_SUFFIX,
+                        (_hash_bytes(content) + "\n").encode('UTF-8'))
+        _write_file(destination, content)
+        return True
+
+    def fetch_all(self, downloads):
+        """
+        Write the content of several URLs in files, in a thread pool.
+
+        All the downloads are attempted, even if some of them fail.
+
+        Parameters
+        ----------
+        downloads: list(tuple(string, string))
+            The URL and destination of each file.
+
+        Raises
+        ------
+        RuntimeError
+            If at least one download failed.
+
+        """
+        errors = []
+        nb_downloaded = 0
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            futures = [executor.submit(self.fetch, url, destination)
+                       for url, destination in downloads]
+            for future in futures:
+                try:
+                    nb_downloaded += future.result()
+                except (OSError, RuntimeError) as error:
+                    LOG.error("%s", error)
+                    errors.append(str(error))
+        LOG.info("%s files downloaded, %s from mirror, %s failed.",
+                 nb_downloaded, len(downloads) - nb_downloaded - len(errors),
+                 len(errors))
+        if errors:
+            raise RuntimeError("%s downloads failed:\n%s"
+                               % (len(errors), "\n".join(errors)))
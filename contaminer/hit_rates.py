@@ -0,0 +1,236 @@
+"""
+Order the tasks of a job by the probability of finding the contaminant.
+
+The hit rate of each contaminant is learnt from the complete jobs: a
+contaminant has been tried in a job if at least one of its tasks is complete,
+and is a hit if one of its tasks reaches early_stop_percent. The table is
+stored in the user directory, and shared by all the jobs.
+
+Contaminants with few trials rely on a static prior, computed from the
+ContaBase: contaminants reported in more publications, and with an exact
+model, are more likely. The probability of a contaminant is the hit rate
+smoothed towards the prior:
+
+    (hits + PRIOR_WEIGHT * prior) / (trials + PRIOR_WEIGHT)
+
+Classes
+-------
+HitRates
+    Table of the hits and trials of each contaminant.
+
+Functions
+---------
+get_static_prior
+    Return the static prior of a ContaBase contaminant.
+
+sort_jobs
+    Return the jobs ordered by probability of success.
+
+record_job
+    Record the results of a complete job in the hit rates file.
+
+"""
+
+import fcntl
+import json
+import logging
+import os
+
+LOG = logging.getLogger(__name__)
+
+# Number of pseudo-trials given to the static prior.
+PRIOR_WEIGHT = 2
+# Prior of a contaminant without publication nor exact model.
+BASE_PRIOR = 0.01
+
+
+def get_static_prior(contaminant):
+    """
+    Return the static prior of a ContaBase contaminant.
+
+    Parameters
+    ----------
+    contaminant: dict
+        The contaminant, as in contabase.yaml.
+
+    Return
+    ------
+    float
+        Prior probability of finding the contaminant in a job.
+
+    """
+    references = contaminant.get('reference') or []
+    if isinstance(references, dict):
+        references = [references]
+
+    prior = BASE_PRIOR * (1 + len(references))
+    if contaminant.get('exact_model'):
+        prior *= 2
+    return min(prior, 0.5)
+
+
+class HitRates():
+    """
+    Table of the hits and trials of each contaminant.
+
+    Attributes
+    ----------
+    counts: dict
+        For each model name, a dict with the number of 'hits' and 'trials'.
+
+    prep_dirs: list(string)
+        The prep directories already recorded in the table.
+
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.prep_dirs = []
+
+    def load(self, save_filepath):
+        """Load the table from a file. A missing file gives an empty table."""
+        LOG.debug("Load hit rates from %s.", save_filepath)
+        try:
+            with open(save_filepath, 'r') as save_file:
+                data = json.loads(save_file.read())
+        except FileNotFoundError:
+            return
+
+        self.counts = data['counts']
+        self.prep_dirs = data['prep_dirs']
+
+    def save(self, save_filepath):
+        """Save the table in a file."""
+        LOG.debug("Save hit rates to %s.", save_filepath)
+        os.makedirs(os.path.dirname(save_filepath) or ".", exist_ok=True)
+        temp_path = "%s.%s.tmp" % (save_filepath, os.getpid())
+        with open(temp_path, 'w') as save_file:
+            save_file.write(json.dumps({
+                'counts': self.counts,
+                'prep_dirs': self.prep_dirs
+            }))
+        os.replace(temp_path, save_filepath)
+
+    def record(self, prep_dir, jobs, min_percent):
+        """
+        Record the results of a complete job.
+
+        Parameters
+        ----------
+        prep_dir: string
+            The directory of the job. A job is only recorded once.
+
+        jobs: list(dict)
+            The jobs of the TasksManager, with compiled results.
+
+        min_percent: float
+            Percent from which a task is a hit.
+
+        Return
+        ------
+        boolean
+            True if the job has been recorded, False if it already was.
+
+        """
+        prep_dir = os.path.abspath(prep_dir)
+        if prep_dir in self.prep_dirs:
+            return False
+
+        hits = {}
+        for job in jobs:
+            if job['status'] != "complete" or job['infos']['is_custom_model']:
+                continue
+            model_name = job['infos']['model_name']
+            hits[model_name] = hits.get(model_name, False) \
+                or job['results']['percent'] >= min_percent
+
+        for model_name, is_hit in hits.items():
+            count = self.counts.setdefault(model_name,
+                                           {'hits': 0, 'trials': 0})
+            count['trials'] += 1
+            count['hits'] += int(is_hit)
+
+        self.prep_dirs.append(prep_dir)
+        LOG.debug("Recorded %s contaminants from %s.", len(hits), prep_dir)
+        return True
+
+    def get_probability(self, model_name, prior):
+        """Return the smoothed probability of finding model_name."""
+        count = self.counts.get(model_name, {'hits': 0, 'trials': 0})
+        return (count['hits'] + PRIOR_WEIGHT * prior) \
+            / (count['trials'] + PRIOR_WEIGHT)
+
+
+def sort_jobs(jobs, contaminants, hit_rates):
+    """
+    Return the jobs ordered by probability of success.
+
+    Custom models come first, as the user suspects them. The ContaBase
+    contaminants follow, most probable first. The order of the tasks of a
+    contaminant (pack then space group, input space group first) is kept.
+
+    Parameters
+    ----------
+    jobs: list(dict)
+        The jobs of a TasksManager.
+
+    contaminants: list(dict)
+        The ContaBase contaminants, as in contabase.yaml.
+
+    hit_rates: HitRates
+        The hit rates learnt from previous jobs.
+
+    Return
+    ------
+    list(dict)
+        The same jobs, ordered.
+
+    """
+    priors = {
+        contaminant['uniprot_id']: get_static_prior(contaminant)
+        for contaminant in contaminants
+    }
+
+    def get_key(job):
+        infos = job['infos']
+        if infos['is_custom_model']:
+            return -1.0
+        return -hit_rates.get_probability(
+            infos['model_name'],
+            priors.get(infos['model_name'], BASE_PRIOR))
+
+    # sorted is stable, so the order of the tasks of a model is kept.
+    return sorted(jobs, key=get_key)
+
+
+def record_job(save_filepath, prep_dir, jobs, min_percent):
+    """
+    Record the results of a complete job in the hit rates file.
+
+    Several jobs can end at the same time: the file is read, updated and
+    written while holding a lock, so no job is lost. The lock is taken on a
+    separate file, as the hit rates file is replaced when it is saved.
+
+    Parameters
+    ----------
+    save_filepath: string
+        Path to the hit rates file.
+
+    prep_dir, jobs, min_percent
+        See HitRates.record.
+
+    Return
+    ------
+    boolean
+        True if the job has been recorded, False if it already was.
+
+    """
+    os.makedirs(os.path.dirname(save_filepath) or ".", exist_ok=True)
+    with open(save_filepath + ".lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        hit_rates = HitRates()
+        hit_rates.load(save_filepath)
+        if not hit_rates.record(prep_dir, jobs, min_percent):
+            return False
+        hit_rates.save(save_filepath)
+    return True
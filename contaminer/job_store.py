@@ -0,0 +1,333 @@
+"""
+Store the tasks of a job in SQLite instead of tasks.json.
+
+With job_store = sqlite in the configuration, the tasks of new jobs are
+stored in tasks.sqlite, with one indexed row per task. The database uses
+write-ahead logging, so the tasks update their own row while the status is
+read, without rewriting the whole job.
+
+The status and summary of a job are computed with SQL queries, and the legacy
+tasks.json document can still be exported. Existing prep directories keep
+their tasks.json, until they are migrated with `contaminer migrate-store`.
+
+WAL needs shared memory between the processes using the database: keep the
+prep directories on a local filesystem (e.g. with solve --local), not on NFS.
+
+Classes
+-------
+JobStore
+    SQLite database of the tasks of a job.
+
+Functions
+---------
+is_store_path
+    Return True if a tasks file is a JobStore.
+
+migrate_prep_dir
+    Copy the tasks.json of a prep directory into a JobStore.
+
+"""
+
+import json
+import logging
+import os
+
+from contaminer import config
+
+LOG = logging.getLogger(__name__)
+
+STORE_EXTENSION = ".sqlite"
+SCHEMA_VERSION = 1
+# Seconds to wait for a lock held by another process.
+BUSY_TIMEOUT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    rank INTEGER PRIMARY KEY,
+    model_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    percent REAL,
+    q_factor REAL,
+    infos TEXT NOT NULL,
+    args TEXT NOT NULL,
+    results TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS jobs_model ON jobs (model_name, percent);
+"""
+
+
+def is_store_path(tasks_path):
+    """Return True if tasks_path is a JobStore, and not a JSON file."""
+    return tasks_path.endswith(STORE_EXTENSION)
+
+
+def _to_row(rank, job):
+    """Return the row of a job."""
+    results = job['results']
+    return (
+        rank,
+        job['infos']['model_name'],
+        job['status'],
+        results.get('percent') if results else None,
+        results.get('q_factor') if results else None,
+        json.dumps(job['infos']),
+        json.dumps(job['args']),
+        json.dumps(results) if results is not None else None,
+    )
+
+
+def _to_job(row):
+    """Return the job of a (infos, args, results, status) row."""
+    infos, args, results, status = row
+    return {
+        'infos': json.loads(infos),
+        'args': json.loads(args),
+        'results': json.loads(results) if results is not None else None,
+        'status': status,
+    }
+
+
+class JobStore():
+    """
+    SQLite database of the tasks of a job.
+
+    The rank of a task is the primary key of its row. Each method runs in its
+    own transaction.
+
+    Attributes
+    ----------
+    path: string
+        Path to the database.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+
+    def _connect(self):
+        """Return the connection to the database, created if needed."""
+        if self._connection is None:
+            # Imported here, as the tasks of a job stored in tasks.json only
+            # need is_store_path.
+            import sqlite3
+            self._connection = sqlite3.connect(self.path,
+                                               timeout=BUSY_TIMEOUT)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            with self._connection:
+                self._connection.executescript(_SCHEMA)
+                self._connection.execute(
+                    "INSERT OR IGNORE INTO meta VALUES ('schema_version', ?)",
+                    (str(SCHEMA_VERSION),))
+        return self._connection
+
+    def close(self):
+        """Close the connection to the database."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_jobs(self, jobs, ranks=None):
+        """
+        Write jobs in the database.
+
+        Parameters
+        ----------
+        jobs: list(dict)
+            All the jobs of a TasksManager.
+
+        ranks: list(integer)
+            The ranks of the jobs to write. Defaults to all the jobs, and
+            removes the rows of ranks beyond the jobs. The rows of the given
+            ranks which are already complete are kept: they may have been
+            updated by their task since the jobs were read.
+
+        """
+        connection = self._connect()
+        if ranks is None:
+            with connection:
+                connection.execute("DELETE FROM jobs WHERE rank >= ?",
+                                   (len(jobs),))
+                connection.executemany(
+                    "INSERT OR REPLACE INTO jobs "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [_to_row(rank, job) for rank, job in enumerate(jobs)])
+            LOG.debug("Wrote %s jobs to %s.", len(jobs), self.path)
+            return
+
+        with connection:
+            connection.executemany(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (rank) DO UPDATE SET "
+                "status = excluded.status, percent = excluded.percent, "
+                "q_factor = excluded.q_factor, results = excluded.results "
+                "WHERE jobs.status != 'complete'",
+                [_to_row(rank, jobs[rank]) for rank in ranks])
+        LOG.debug("Wrote %s jobs to %s.", len(ranks), self.path)
+
+    def read_jobs(self):
+        """Return all the jobs, ordered by rank."""
+        cursor = self._connect().execute(
+            "SELECT infos, args, results, status FROM jobs ORDER BY rank")
+        return [_to_job(row) for row in cursor]
+
+    def iter_jobs(self):
+        """Yield the rank and job of each job, ordered by rank."""
+        cursor = self._connect().execute(
+            "SELECT rank, infos, args, results, status FROM jobs "
+            "ORDER BY rank")
+        for row in cursor:
+            yield row[0], _to_job(row[1:])
+
+    def read_job(self, rank):
+        """Return the job of a rank."""
+        row = self._connect().execute(
+            "SELECT infos, args, results, status FROM jobs WHERE rank = ?",
+            (rank,)).fetchone()
+        if row is None:
+            raise IndexError("No job with rank %s in %s." % (rank, self.path))
+        return _to_job(row)
+
+    def update_job(self, rank, status, results=None):
+        """Update the status and results of a single job."""
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, percent = ?, q_factor = ?, "
+                "results = ? WHERE rank = ?",
+                (status,
+                 results.get('percent') if results else None,
+                 results.get('q_factor') if results else None,
+                 json.dumps(results) if results is not None else None,
+                 rank))
+
+    def read_jobs_with_status(self, status):
+        """Return the rank and job of the jobs of a status, by rank."""
+        cursor = self._connect().execute(
+            "SELECT rank, infos, args, results, status FROM jobs "
+            "WHERE status = ? ORDER BY rank", (status,))
+        return [(row[0], _to_job(row[1:])) for row in cursor]
+
+    def count_by_status(self):
+        """Return the number of jobs of each status."""
+        return dict(self._connect().execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    def get_summary(self, final_statuses=("complete", "skipped", "failed"),
+                    top_k=3):
+        """
+        Return the best jobs and the status of each contaminant.
+
+        The best job has the highest percent, then the highest Q factor, then
+        the lowest rank. The status of a contaminant is "complete" if all its
+        jobs are complete, "failed" if all are in final_statuses and some
+        failed, "skipped" if all are in final_statuses, and "running"
+        otherwise.
+
+        Return
+        ------
+        list(dict)
+            For each contaminant, in the order of the jobs, the same items
+            as contaminer.summary.summarize_jobs.
+
+        """
+        placeholders = ", ".join("?" * len(final_statuses))
+        cursor = self._connect().execute(
+            """
+            WITH ranked AS (
+                SELECT model_name, status, infos, args, results,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY model_name
+                        ORDER BY status = 'complete' DESC, percent DESC,
+                            q_factor DESC, rank
+                    ) AS position,
+                    MIN(rank) OVER models AS first_rank,
+                    SUM(status = 'complete') OVER models AS nb_complete,
+                    SUM(status = 'failed') OVER models AS nb_failed,
+                    SUM(status IN (%s)) OVER models AS nb_final,
+                    COUNT(*) OVER models AS nb_jobs
+                FROM jobs
+                WINDOW models AS (PARTITION BY model_name)
+            )
+            SELECT position, infos, args, results, status = 'complete',
+                nb_complete, nb_failed, nb_final, nb_jobs
+            FROM ranked WHERE position <= MAX(?, 1)
+            ORDER BY first_rank, position
+            """ % placeholders,
+            tuple(final_statuses) + (top_k,))
+
+        summary = []
+        for (position, infos, args, results, is_complete,
+             nb_complete, nb_failed, nb_final, nb_jobs) in cursor:
+            if position == 1:
+                if nb_complete == nb_jobs:
+                    status = 'complete'
+                elif nb_final == nb_jobs and nb_failed:
+                    status = 'failed'
+                elif nb_final == nb_jobs:
+                    status = 'skipped'
+                else:
+                    status = 'running'
+                summary.append({
+                    'infos': json.loads(infos),
+                    'args_for_best': json.loads(args) if is_complete
+                    else None,
+                    'results': json.loads(results) if is_complete else None,
+                    'status': status,
+                    'nb_tasks': nb_jobs,
+                    'complete_fraction': nb_complete / nb_jobs,
+                    'top': [],
+                })
+            if is_complete and position <= top_k:
+                summary[-1]['top'].append({
+                    'args': json.loads(args),
+                    'results': json.loads(results),
+                })
+        return summary
+
+    def export_json(self):
+        """Return the jobs as the legacy tasks.json document."""
+        return json.dumps({'jobs': self.read_jobs()})
+
+
+def migrate_prep_dir(prep_dir):
+    """
+    Copy the tasks.json of a prep directory into a JobStore.
+
+    The JobStore is then used instead of tasks.json, which is kept untouched.
+
+    Return
+    ------
+    string
+        Path to the JobStore.
+
+    """
+    json_path = os.path.join(prep_dir, config.ARGS_FILENAME)
+    store_path = os.path.join(prep_dir, config.JOB_STORE_FILENAME)
+    if os.path.exists(store_path):
+        raise RuntimeError("%s is already migrated." % prep_dir)
+
+    with open(json_path, 'r') as json_file:
+        jobs = json.loads(json_file.read())['jobs']
+
+    # Write to a temporary file, so an interrupted migration leaves no store.
+    temp_path = store_path + ".tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    with JobStore(temp_path) as store:
+        store.write_jobs(jobs)
+    os.replace(temp_path, store_path)
+    LOG.info("Migrated %s jobs to %s.", len(jobs), store_path)
+    return store_path
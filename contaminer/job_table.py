@@ -0,0 +1,334 @@
+"""
+Compact in-memory representation of the tasks of a job.
+
+A job screening all the contaminants has hundreds of thousands of tasks,
+which repeat the same few input files, model directories and space groups.
+As a list of nested dicts, each task costs more than a kilobyte.
+
+A JobTable stores the tasks in columns: each string is interned once in a
+StringPool, and the columns are arrays of integer codes. The results, only
+available for the complete tasks, are kept as dicts.
+
+The dict API of TasksManager.jobs is kept: indexing or iterating a JobTable
+gives JobView objects, which can be read and updated like the job dicts:
+
+    job = table[rank]
+    job['args']['space_group']
+    job['status'] = "complete"
+
+The dicts given by a JobView are built on each access: modifying them does
+not modify the table. Assign job['infos'], job['args'], job['results'] or
+job['status'] instead.
+
+Classes
+-------
+StringPool
+    Intern strings, and give them integer codes.
+
+JobTable
+    Columnar table of jobs.
+
+JobView
+    Dict-like view of a job of a JobTable.
+
+"""
+
+from array import array
+import json
+import logging
+
+LOG = logging.getLogger(__name__)
+
+JOB_KEYS = ('infos', 'args', 'results', 'status')
+INFOS_KEYS = ('model_name', 'is_AF_model', 'is_custom_model')
+ARGS_KEYS = ('input_file', 'model_dir', 'pack_number', 'space_group')
+
+# Bits of the flags column.
+_AF_MODEL = 1
+_CUSTOM_MODEL = 2
+
+
+class StringPool():
+    """
+    Intern strings, and give them integer codes.
+
+    Attributes
+    ----------
+    strings: list(string)
+        The interned strings. The code of a string is its index.
+
+    """
+
+    def __init__(self):
+        self.strings = []
+        self._codes = {}
+
+    def encode(self, string):
+        """Return the code of a string, interned if it is new."""
+        code = self._codes.get(string)
+        if code is None:
+            code = len(self.strings)
+            self._codes[string] = code
+            self.strings.append(string)
+        return code
+
+    def decode(self, code):
+        """Return the string of a code."""
+        return self.strings[code]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class JobView():
+    """
+    Dict-like view of a job of a JobTable.
+
+    Attributes
+    ----------
+    table: JobTable
+        The table holding the job.
+
+    rank: integer
+        The rank of the job in the table.
+
+    """
+
+    __slots__ = ('table', 'rank')
+
+    def __init__(self, table, rank):
+        self.table = table
+        self.rank = rank
+
+    def __getitem__(self, key):
+        return self.table.get_field(self.rank, key)
+
+    def __setitem__(self, key, value):
+        self.table.set_field(self.rank, key, value)
+
+    def get(self, key, default=None):
+        """Return the value of a key, as dict.get."""
+        return self[key] if key in JOB_KEYS else default
+
+    def keys(self):
+        """Return the keys of the job dict."""
+        return JOB_KEYS
+
+    def __iter__(self):
+        return iter(JOB_KEYS)
+
+    def __contains__(self, key):
+        return key in JOB_KEYS
+
+    def to_dict(self):
+        """Return a copy of the job, as a dict."""
+        return self.table.get_job(self.rank)
+
+    def __eq__(self, other):
+        if isinstance(other, JobView):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return "JobView(%s)" % self.to_dict()
+
+
+class JobTable():
+    """
+    Columnar table of jobs.
+
+    Jobs which do not have the usual infos and args keys (e.g. written by a
+    modified version) are kept as dicts, so any tasks file can be loaded.
+
+    Attributes
+    ----------
+    pool: StringPool
+        The strings of all the columns.
+
+    """
+
+    def __init__(self):
+        self.pool = StringPool()
+        self._model_names = array('I')
+        self._flags = array('B')
+        self._input_files = array('I')
+        self._model_dirs = array('I')
+        self._pack_numbers = array('I')
+        self._space_groups = array('I')
+        self._statuses = array('B')
+        self._status_pool = StringPool()
+        self._results = []
+        self._overflow = {}
+
+    @classmethod
+    def from_jobs(cls, jobs):
+        """Return a table with the jobs of a list of dicts."""
+        table = cls()
+        for job in jobs:
+            table.append(job)
+        return table
+
+    def __len__(self):
+        return len(self._statuses)
+
+    def __getitem__(self, rank):
+        if isinstance(rank, slice):
+            return [JobView(self, index)
+                    for index in range(*rank.indices(len(self)))]
+        if rank < 0:
+            rank += len(self)
+        if not 0 <= rank < len(self):
+            raise IndexError("Job rank out of range: %s." % rank)
+        return JobView(self, rank)
+
+    def __iter__(self):
+        for rank in range(len(self)):
+            yield JobView(self, rank)
+
+    def __eq__(self, other):
+        return len(self) == len(other) \
+            and all(job == other_job for job, other_job in zip(self, other))
+
+    @staticmethod
+    def _is_regular(job):
+        """Return True if the job can be stored in the columns."""
+        return tuple(job) == JOB_KEYS \
+            and tuple(job['infos']) == INFOS_KEYS \
+            and tuple(job['args']) == ARGS_KEYS \
+            and isinstance(job['args']['pack_number'], int) \
+            and job['args']['pack_number'] >= 0
+
+    def append(self, job):
+        """Add a job dict (or JobView) at the end of the table."""
+        rank = len(self)
+        if isinstance(job, JobView):
+            job = job.to_dict()
+        self._model_names.append(0)
+        self._flags.append(0)
+        self._input_files.append(0)
+        self._model_dirs.append(0)
+        self._pack_numbers.append(0)
+        self._space_groups.append(0)
+        self._statuses.append(0)
+        self._results.append(None)
+        if self._is_regular(job):
+            self._set_infos(rank, job['infos'])
+            self._set_args(rank, job['args'])
+            self.set_field(rank, 'results', job['results'])
+            self.set_field(rank, 'status', job['status'])
+        else:
+            self._overflow[rank] = job
+
+    def extend(self, jobs):
+        """Add several jobs at the end of the table."""
+        for job in jobs:
+            self.append(job)
+
+    def _set_infos(self, rank, infos):
+        self._model_names[rank] = self.pool.encode(infos['model_name'])
+        self._flags[rank] = \
+            (_AF_MODEL if infos['is_AF_model'] else 0) \
+            | (_CUSTOM_MODEL if infos['is_custom_model'] else 0)
+
+    def _set_args(self, rank, args):
+        self._input_files[rank] = self.pool.encode(args['input_file'])
+        self._model_dirs[rank] = self.pool.encode(args['model_dir'])
+        self._pack_numbers[rank] = args['pack_number']
+        self._space_groups[rank] = self.pool.encode(args['space_group'])
+
+    def get_field(self, rank, key):
+        """Return a field of a job, built from the columns."""
+        if rank in self._overflow:
+            return self._overflow[rank][key]
+
+        if key == 'status':
+            return self._status_pool.decode(self._statuses[rank])
+        if key == 'results':
+            return self._results[rank]
+        if key == 'infos':
+            flags = self._flags[rank]
+            return {
+                'model_name': self.pool.decode(self._model_names[rank]),
+                'is_AF_model': bool(flags & _AF_MODEL),
+                'is_custom_model': bool(flags & _CUSTOM_MODEL),
+            }
+        if key == 'args':
+            return {
+                'input_file': self.pool.decode(self._input_files[rank]),
+                'model_dir': self.pool.decode(self._model_dirs[rank]),
+                'pack_number': self._pack_numbers[rank],
+                'space_group': self.pool.decode(self._space_groups[rank]),
+            }
+        raise KeyError(key)
+
+    def set_field(self, rank, key, value):
+        """Update a field of a job."""
+        if rank in self._overflow:
+            self._overflow[rank][key] = value
+        elif key == 'status':
+            self._statuses[rank] = self._status_pool.encode(value)
+        elif key == 'results':
+            self._results[rank] = value
+        elif key == 'infos' and tuple(value) == INFOS_KEYS:
+            self._set_infos(rank, value)
+        elif key == 'args' and tuple(value) == ARGS_KEYS \
+                and isinstance(value['pack_number'], int) \
+                and value['pack_number'] >= 0:
+            self._set_args(rank, value)
+        elif key in JOB_KEYS:
+            # Irregular value: keep the whole job as a dict.
+            job = self.get_job(rank)
+            job[key] = value
+            self._overflow[rank] = job
+        else:
+            raise KeyError(key)
+
+    def get_job(self, rank):
+        """Return a copy of a job, as a dict."""
+        return {key: self.get_field(rank, key) for key in JOB_KEYS}
+
+    def get_arguments(self, rank):
+        """Return the arguments of a job. No copy is needed."""
+        return self.get_field(rank, 'args')
+
+    def to_jobs(self):
+        """Return all the jobs, as a list of dicts."""
+        return [self.get_job(rank) for rank in range(len(self))]
+
+    @classmethod
+    def loads(cls, text):
+        """
+        Return the table of a tasks.json document.
+
+        The jobs are added to the table while the document is parsed, so the
+        dicts of all the jobs never exist at the same time.
+
+        """
+        table = cls()
+
+        def add_job(item):
+            if 'status' in item and 'args' in item:
+                table.append(item)
+                return None
+            return item
+
+        json.loads(text, object_hook=add_job)
+        return table
+
+    def dumps(self):
+        """Return the tasks.json document of the table."""
+        return '{"jobs": [%s]}' % ", ".join(
+            json.dumps(self.get_job(rank)) for rank in range(len(self)))
+
+    @classmethod
+    def load(cls, file_path):
+        """Return the table of a tasks.json file."""
+        LOG.debug("Load job table from %s.", file_path)
+        with open(file_path, 'r') as tasks_file:
+            return cls.loads(tasks_file.read())
+
+    def save(self, file_path):
+        """Write the table in a tasks.json file."""
+        LOG.debug("Save job table to %s.", file_path)
+        with open(file_path, 'w') as tasks_file:
+            tasks_file.write(self.dumps())
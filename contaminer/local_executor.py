@@ -0,0 +1,213 @@
+"""
+Run the tasks of a job on the local machine, without a scheduler.
+
+Used by `contaminer solve --local`. The tasks run in a pool of worker
+processes, in the order of tasks.json (most probable contaminants first).
+Each worker is pinned to its own CPUs, and the tools it runs are limited to
+threads_per_task threads. The status of the job is updated as the tasks
+end: a JobStore updates the row of each task, and tasks.json is rewritten
+at most every SAVE_INTERVAL seconds, and once all the tasks have ended.
+
+Classes
+-------
+LocalExecutor
+    Run the tasks of a prep directory in a local process pool.
+
+Functions
+---------
+get_available_memory
+    Return the memory available for new processes.
+
+"""
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+import logging
+import multiprocessing
+import os
+import time
+
+from contaminer import config
+from contaminer.args_manager import FINAL_STATUSES
+from contaminer.args_manager import TasksManager
+from contaminer.args_manager import get_tasks_path
+from contaminer.environment import get_tool_environment
+from contaminer.job_store import is_store_path
+from contaminer.runner import available_cpus
+
+LOG = logging.getLogger(__name__)
+
+# Variables limiting the number of threads of the tools.
+THREAD_VARIABLES = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+)
+# Minimum seconds between two writes of tasks.json, which is fully
+# rewritten each time.
+SAVE_INTERVAL = 5
+
+
+def get_available_memory():
+    """
+    Return the memory available for new processes.
+
+    Return
+    ------
+    integer
+        Available memory in bytes, or None if it cannot be read.
+
+    """
+    try:
+        with open("/proc/meminfo", 'r') as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _init_worker(cpu_sets, threads_per_task):
+    """
+    Pin the worker to a set of CPUs, and limit the threads of the tools.
+
+    The tools started by the worker inherit its affinity and environment.
+
+    """
+    cpus = cpu_sets.get()
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(threads_per_task)
+
+
+def _run_task(prep_dir, rank):
+    """Run a single task in a worker process."""
+    TasksManager().run(prep_dir, rank)
+
+
+class LocalExecutor():
+    """
+    Run the tasks of a prep directory in a local process pool.
+
+    Attributes
+    ----------
+    prep_dir: string
+        The directory generated during the prepare step.
+
+    max_workers: integer
+        Requested number of tasks running at the same time, or None to adapt
+        to the available CPUs and memory.
+
+    threads_per_task: integer
+        Number of CPUs and threads given to each task.
+
+    """
+
+    def __init__(self, prep_dir, max_workers=None, threads_per_task=None):
+        self.prep_dir = os.path.abspath(prep_dir)
+        self.max_workers = max_workers
+        self.threads_per_task = threads_per_task or config.THREADS_PER_TASK
+
+    def get_width(self, nb_tasks):
+        """
+        Return the number of tasks to run at the same time.
+
+        Without max_workers, the width is limited by the available CPUs and
+        by the memory (memory_per_task_mb for each task).
+
+        """
+        if self.max_workers:
+            width = self.max_workers
+        else:
+            width = available_cpus() // self.threads_per_task
+            memory = get_available_memory()
+            if memory is not None and config.MEMORY_PER_TASK_MB > 0:
+                width = min(width,
+                            memory // (config.MEMORY_PER_TASK_MB * 1024**2))
+        return max(1, min(width, nb_tasks))
+
+    def _get_cpu_sets(self, width):
+        """Return the CPUs of each worker, or None when CPUs are shared."""
+        try:
+            cpus = sorted(os.sched_getaffinity(0))
+        except AttributeError:  # Not available on this platform.
+            return [None] * width
+
+        if width * self.threads_per_task > len(cpus):
+            return [None] * width
+        return [
+            set(cpus[index * self.threads_per_task:
+                     (index + 1) * self.threads_per_task])
+            for index in range(width)
+        ]
+
+    def run(self):
+        """
+        Run all the tasks, and update the tasks file as they end.
+
+        Raises
+        ------
+        RuntimeError
+            If at least one task failed. The other tasks run anyway.
+
+        """
+        os.chdir(self.prep_dir)
+        tasks_path = get_tasks_path(".")
+        tasks_manager = TasksManager()
+        tasks_manager.load(tasks_path, compact=True)
+        ranks = [
+            rank for rank, job in enumerate(tasks_manager.jobs)
+            if job['status'] not in FINAL_STATUSES
+        ]
+        width = self.get_width(len(ranks))
+        LOG.info("Run %s tasks, %s at a time.", len(ranks), width)
+
+        # Load the tool environment once, before the workers start.
+        get_tool_environment()
+
+        cpu_sets = multiprocessing.Queue()
+        for cpus in self._get_cpu_sets(width):
+            cpu_sets.put(cpus)
+
+        failed = []
+        is_store = is_store_path(tasks_path)
+        last_save = time.monotonic()
+        try:
+            with ProcessPoolExecutor(
+                    width,
+                    initializer=_init_worker,
+                    initargs=(cpu_sets, self.threads_per_task)) as executor:
+                futures = {
+                    executor.submit(_run_task, self.prep_dir, rank): rank
+                    for rank in ranks
+                }
+                pending = set(futures)
+                while pending:
+                    done, pending = wait(pending,
+                                         return_when=FIRST_COMPLETED)
+                    for future in done:
+                        rank = futures[future]
+                        try:
+                            future.result()
+                        # pylint: disable=broad-except
+                        except Exception as err:
+                            LOG.error("Task %s failed: %s", rank, err)
+                            failed.append(rank)
+                        tasks_manager.update_job(rank)
+                        if is_store:
+                            tasks_manager.save_job(tasks_path, rank)
+
+                    if not is_store \
+                            and time.monotonic() - last_save >= SAVE_INTERVAL:
+                        tasks_manager.save(tasks_path)
+                        last_save = time.monotonic()
+        finally:
+            if not is_store:
+                tasks_manager.save(tasks_path)
+
+        if failed:
+            raise RuntimeError("%s of %s tasks failed: %s."
+                               % (len(failed), len(ranks), sorted(failed)))
@@ -0,0 +1,174 @@
+"""
+Generate the electron density maps of the solved tasks.
+
+Converting final.mtz into MAP files is slow, so it is not done when the
+results are compiled. Maps are generated on demand (contaminer show-maps),
+or right after morda_solve for tasks with a high enough percent.
+
+Maps are computed by sftools (Mtz2Map), or in-process with NumPy
+(contaminer.density.FftMtz2Map) when map_engine is "numpy" in the user
+configuration.
+
+The generated maps are cached next to final.mtz, with a stamp file holding
+the SHA-256 of the converted final.mtz. Maps are not generated again as long
+as final.mtz does not change.
+
+Functions
+---------
+make_maps
+    Return the maps for a final.mtz file, generating them if needed.
+
+make_maps_async
+    Same as make_maps, from a coroutine.
+
+make_job_maps
+    Generate the maps for all the solved jobs above a percent threshold.
+
+"""
+
+import asyncio
+import json
+import logging
+import os
+
+from contaminer import config
+from contaminer.analysis_cache import hash_file
+from contaminer.ccp4 import Mtz2Map
+from contaminer.density import FftMtz2Map
+from contaminer.runner import get_default_runner
+
+LOG = logging.getLogger(__name__)
+
+STAMP_SUFFIX = ".maps.json"
+
+
+def _get_map_converter(mtz_path):
+    """Return the converter of mtz_path for the configured map engine."""
+    if config.MAP_ENGINE == "sftools":
+        return Mtz2Map(mtz_path)
+    if config.MAP_ENGINE == "numpy":
+        return FftMtz2Map(mtz_path)
+    raise RuntimeError("Unknown map engine: %s. Use sftools or numpy."
+                       % config.MAP_ENGINE)
+
+
+def _get_stamp_path(mtz_path):
+    """Return the path to the stamp file for mtz_path."""
+    return os.path.splitext(mtz_path)[0] + STAMP_SUFFIX
+
+
+def _get_cached_maps(mtz_path, mtz_hash):
+    """
+    Return the cached maps for mtz_path.
+
+    Return
+    ------
+    2-tuple
+        Paths to the map and difference map files, or None if the cache is
+        missing or outdated.
+
+    """
+    try:
+        with open(_get_stamp_path(mtz_path), 'r') as stamp_file:
+            stamp = json.loads(stamp_file.read())
+    except (OSError, ValueError):
+        return None
+
+    map_files = tuple(stamp.get('files', ()))
+    if stamp.get('sha256') != mtz_hash:
+        LOG.debug("Maps for %s are outdated.", mtz_path)
+        return None
+    if not map_files or not all(os.path.isfile(path) for path in map_files):
+        return None
+    return map_files
+
+
+def _write_stamp(mtz_path, mtz_hash, map_files):
+    """Record that map_files have been generated from this final.mtz."""
+    stamp_path = _get_stamp_path(mtz_path)
+    temp_path = "%s.%s" % (stamp_path, os.getpid())
+    with open(temp_path, 'w') as stamp_file:
+        stamp_file.write(json.dumps({
+            'sha256': mtz_hash,
+            'files': list(map_files)
+        }))
+    os.replace(temp_path, stamp_path)
+
+
+async def make_maps_async(mtz_path, runner=None):
+    """
+    Return the maps for a final.mtz file, generating them if needed.
+
+    Parameters
+    ----------
+    mtz_path: string
+        Path to the MTZ file to convert.
+
+    runner: contaminer.runner.ToolRunner
+        The runner to use to start the conversion.
+
+    Return
+    ------
+    2-tuple
+        Paths to the map and difference map files.
+
+    """
+    loop = asyncio.get_running_loop()
+    mtz_hash = await loop.run_in_executor(None, hash_file, mtz_path)
+    map_files = _get_cached_maps(mtz_path, mtz_hash)
+    if map_files:
+        LOG.debug("Use cached maps for %s.", mtz_path)
+        return map_files
+
+    LOG.info("Generate maps for %s.", mtz_path)
+    map_converter = _get_map_converter(mtz_path)
+    await map_converter.run_async(runner)
+    map_files = map_converter.get_output_files()
+    _write_stamp(mtz_path, mtz_hash, map_files)
+    return map_files
+
+
+def make_maps(mtz_path, runner=None):
+    """Same as make_maps_async, but block until the maps are available."""
+    return asyncio.run(make_maps_async(mtz_path, runner))
+
+
+def make_job_maps(jobs, min_percent=0):
+    """
+    Generate the maps for the solved jobs, all at once.
+
+    Parameters
+    ----------
+    jobs: list(dict)
+        Jobs from a TasksManager, with compiled results.
+
+    min_percent: float
+        Only the jobs with at least this percent get maps.
+
+    Return
+    ------
+    list(tuple)
+        For each eligible job, in the order of the jobs, the job and the paths
+        to its map files.
+
+    """
+    eligible = [
+        job for job in jobs
+        if job['status'] == "complete"
+        and job['results']
+        and job['results'].get('available_final')
+        and job['results']['percent'] >= min_percent
+    ]
+
+    runner = get_default_runner()
+    outcomes = runner.run_many([
+        make_maps_async(
+            os.path.join(job['results']['final_dir'], "final.mtz"),
+            runner)
+        for job in eligible
+    ])
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            raise outcome
+
+    return list(zip(eligible, outcomes))
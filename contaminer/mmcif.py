@@ -0,0 +1,216 @@
+"""
+Read the crystal symmetry from mmCIF structure factor files.
+
+The file is read line by line, and reading stops as soon as the space group
+and the cell are known, so the reflections are usually never read. This
+replaces the conversion to MTZ which was only needed to get the space group.
+
+Classes
+-------
+CifSymmetry
+    Space group and cell of a CIF file.
+
+Functions
+---------
+read_symmetry
+    Return the symmetry of the first data block of a CIF file.
+
+"""
+
+import logging
+import re
+import shlex
+
+LOG = logging.getLogger(__name__)
+
+# Tags giving the space group name, by order of preference.
+SPACE_GROUP_TAGS = (
+    '_symmetry.space_group_name_h-m',
+    '_space_group.name_h-m_alt',
+    '_space_group.name_h-m_full',
+)
+SPACE_GROUP_NUMBER_TAGS = (
+    '_symmetry.int_tables_number',
+    '_space_group.it_number',
+)
+CELL_TAGS = (
+    '_cell.length_a',
+    '_cell.length_b',
+    '_cell.length_c',
+    '_cell.angle_alpha',
+    '_cell.angle_beta',
+    '_cell.angle_gamma',
+)
+_WANTED_TAGS = frozenset(
+    SPACE_GROUP_TAGS + SPACE_GROUP_NUMBER_TAGS + CELL_TAGS)
+
+# The reflections come after the symmetry in structure factor files.
+_REFLECTIONS_PREFIX = '_refln.'
+
+# Standard uncertainty at the end of a number, like 34.52(3)
+_SU_REGEX = re.compile(r'\(\d+\)$')
+
+
+class CifSymmetry():
+    """
+    Space group and cell of a CIF file.
+
+    Attributes
+    ----------
+    space_group: string
+        Space group name, space " " separated. None if not in the file.
+
+    space_group_number: integer
+        Space group number. None if not in the file.
+
+    cell: tuple(float)
+        a, b, c, alpha, beta, gamma. None if incomplete in the file.
+
+    """
+
+    def __init__(self, space_group, space_group_number, cell):
+        self.space_group = space_group
+        self.space_group_number = space_group_number
+        self.cell = cell
+
+    def __repr__(self):
+        return "CifSymmetry(%r, %r, %r)" % (
+            self.space_group, self.space_group_number, self.cell)
+
+
+def _parse_value(raw_value):
+    """Return the unquoted value, or None for unknown (?) and null (.)."""
+    tokens = shlex.split(raw_value)
+    if not tokens or tokens[0] in ('?', '.'):
+        return None
+    return tokens[0]
+
+
+def _parse_number(value):
+    """Return value as float, without standard uncertainty."""
+    if value is None:
+        return None
+    return float(_SU_REGEX.sub('', value))
+
+
+def _has_symmetry(items):
+    """Return True if items contain a space group name and a full cell."""
+    return (any(tag in items for tag in SPACE_GROUP_TAGS)
+            and all(tag in items for tag in CELL_TAGS))
+
+
+def _read_items(file_path):
+    """
+    Read the wanted key-value items of the first data block.
+
+    Return
+    ------
+    dict
+        Raw value for each wanted tag found in the file.
+
+    """
+    items = {}
+    pending_tag = None   # Tag whose value is on a following line.
+    text_field = None    # Lines of a ;-delimited value.
+    in_block = False
+
+    with open(file_path, 'r', errors='replace') as cif_file:
+        for line in cif_file:
+            # Value given as a text field.
+            if text_field is not None:
+                if line.startswith(';'):
+                    if pending_tag:
+                        items[pending_tag] = "'%s'" % " ".join(
+                            text_field).strip()
+                        pending_tag = None
+                    text_field = None
+                else:
+                    text_field.append(line.strip())
+                continue
+
+            stripped = line.strip()
+            if not stripped or stripped.startswith('#'):
+                continue
+
+            if pending_tag:
+                if line.startswith(';'):
+                    text_field = [line[1:].strip()]
+                else:
+                    items[pending_tag] = stripped
+                    pending_tag = None
+                continue
+
+            if line.startswith(';'):
+                text_field = []
+                continue
+
+            lowered = stripped.lower()
+            if lowered.startswith('data_'):
+                if in_block:  # Only read the first data block.
+                    break
+                in_block = True
+                continue
+
+            if stripped[0] != '_':
+                continue  # loop_ or data row.
+
+            tag, _, raw_value = stripped.partition(' ')
+            tag = tag.lower()
+            if tag.startswith(_REFLECTIONS_PREFIX) and any(
+                    tag in items for tag in SPACE_GROUP_TAGS):
+                break
+            if tag not in _WANTED_TAGS:
+                continue
+
+            raw_value = raw_value.strip()
+            if raw_value:
+                items[tag] = raw_value
+            else:
+                pending_tag = tag
+
+            if _has_symmetry(items):
+                break
+
+    return items
+
+
+def read_symmetry(file_path):
+    """
+    Return the symmetry of the first data block of a CIF file.
+
+    Parameters
+    ----------
+    file_path: string
+        Path to the mmCIF file.
+
+    Return
+    ------
+    CifSymmetry
+        The space group and cell given by the file.
+
+    """
+    items = _read_items(file_path)
+    LOG.debug("Symmetry items in %s: %s.", file_path, items)
+
+    space_group = None
+    for tag in SPACE_GROUP_TAGS:
+        value = _parse_value(items.get(tag, ''))
+        if value:
+            space_group = " ".join(value.split())
+            break
+
+    space_group_number = None
+    for tag in SPACE_GROUP_NUMBER_TAGS:
+        value = _parse_value(items.get(tag, ''))
+        if value:
+            space_group_number = int(value)
+            break
+
+    cell = tuple(
+        _parse_number(_parse_value(items.get(tag, '')))
+        for tag in CELL_TAGS
+    )
+    if None in cell:
+        cell = None
+
+    return CifSymmetry(space_group, space_group_number, cell)
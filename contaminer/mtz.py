@@ -0,0 +1,269 @@
+"""
+Read MTZ files without CCP4.
+
+The header is parsed in Python, and the reflection table is memory-mapped with
+NumPy, so reading the space group or a few columns of a large file is fast
+and does not copy the reflections in memory.
+
+Classes
+-------
+MtzFile
+    Header and reflections of an MTZ file.
+
+MtzColumn
+    Description of a column of an MTZ file.
+
+"""
+
+import logging
+import math
+import shlex
+
+import numpy
+
+LOG = logging.getLogger(__name__)
+
+# The reflections start at the 21st word of the file.
+DATA_OFFSET = 80
+RECORD_LENGTH = 80
+
+# Nibbles of the machine stamp for the number formats.
+_BIG_ENDIAN = 1
+_LITTLE_ENDIAN = 4
+
+
+class MtzColumn():
+    """
+    Description of a column of an MTZ file.
+
+    Attributes
+    ----------
+    label: string
+        Label of the column, like "FWT" or "PHWT".
+
+    type: string
+        MTZ column type, like "H" (index), "F" (amplitude), "P" (phase).
+
+    min_value: float
+        Minimum value in the column, as given by the header.
+
+    max_value: float
+        Maximum value in the column, as given by the header.
+
+    dataset_id: integer
+        ID of the dataset the column belongs to.
+
+    """
+
+    __slots__ = ('label', 'type', 'min_value', 'max_value', 'dataset_id')
+
+    def __init__(self, label, col_type, min_value, max_value, dataset_id):
+        self.label = label
+        self.type = col_type
+        self.min_value = min_value
+        self.max_value = max_value
+        self.dataset_id = dataset_id
+
+    def __repr__(self):
+        return "MtzColumn(%r, %r)" % (self.label, self.type)
+
+
+class MtzFile():
+    """
+    Header and reflections of an MTZ file.
+
+    The header is read when the object is created. The reflections are only
+    memory-mapped when the data attribute or a column is accessed.
+
+    Attributes
+    ----------
+    file_path: string
+        Path to the MTZ file.
+
+    title: string
+        Title of the file.
+
+    cell: tuple(float)
+        Global cell: a, b, c, alpha, beta, gamma.
+
+    space_group: string
+        Space group name, space " " separated, like "P 1 21 1".
+
+    space_group_number: integer
+        Space group number.
+
+    symmetry_operators: list(string)
+        Symmetry operators as written in the file, like "-X,Y+1/2,-Z".
+
+    columns: list(MtzColumn)
+        Columns of the reflection table, in file order.
+
+    nb_reflections: integer
+        Number of reflections.
+
+    resolution_range: tuple(float)
+        Lowest and highest resolution, in Angstroms.
+
+    missing_value: float
+        Value used for missing data (NaN by default).
+
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.title = ""
+        self.cell = None
+        self.space_group = None
+        self.space_group_number = None
+        self.symmetry_operators = []
+        self.columns = []
+        self.nb_reflections = 0
+        self.resolution_range = None
+        self.missing_value = float('nan')
+        self._byte_order = '<'
+        self._data = None
+
+        self._read_header()
+
+    def _read_header(self):
+        """Read and parse the header records of the file."""
+        with open(self.file_path, 'rb') as mtz_file:
+            start = mtz_file.read(20)
+            if len(start) < 20 or start[:4] != b'MTZ ':
+                raise ValueError("%s is not an MTZ file." % self.file_path)
+
+            # Real numbers format in the first nibble of the machine stamp.
+            real_format = start[8] >> 4
+            if real_format == _BIG_ENDIAN:
+                self._byte_order = '>'
+            elif real_format == _LITTLE_ENDIAN:
+                self._byte_order = '<'
+            else:
+                raise ValueError("Unsupported number format in %s."
+                                 % self.file_path)
+
+            integer = numpy.dtype(self._byte_order + 'i4')
+            header_word = int(numpy.frombuffer(start, integer, 1, 4)[0])
+            if header_word == -1:  # Large file: 64 bits location.
+                header_word = int(numpy.frombuffer(
+                    start, numpy.dtype(self._byte_order + 'i8'), 1, 12)[0])
+            self._header_offset = (header_word - 1) * 4
+
+            mtz_file.seek(self._header_offset)
+            while True:
+                record = mtz_file.read(RECORD_LENGTH)
+                if len(record) < RECORD_LENGTH:
+                    raise ValueError("Truncated header in %s."
+                                     % self.file_path)
+                record = record.decode('ASCII', 'replace').rstrip()
+                if record.startswith('END'):
+                    break
+                self._parse_record(record)
+
+        LOG.debug("Read header of %s: %s reflections, %s columns.",
+                  self.file_path, self.nb_reflections, len(self.columns))
+
+    def _parse_record(self, record):
+        """Parse a single header record."""
+        keyword, _, value = record.partition(' ')
+        value = value.strip()
+
+        if keyword == 'TITLE':
+            self.title = value
+        elif keyword == 'NCOL':
+            self.nb_reflections = int(value.split()[1])
+        elif keyword == 'CELL':
+            self.cell = tuple(float(item) for item in value.split()[:6])
+        elif keyword == 'SYMINF':
+            fields = shlex.split(value)
+            self.space_group_number = int(fields[3])
+            self.space_group = " ".join(fields[4].split())
+        elif keyword == 'SYMM':
+            self.symmetry_operators.append(value.replace(' ', ''))
+        elif keyword == 'RESO':
+            inv_d2 = [float(item) for item in value.split()[:2]]
+            self.resolution_range = tuple(
+                1 / math.sqrt(item) if item > 0 else float('inf')
+                for item in inv_d2
+            )
+        elif keyword == 'VALM':
+            if value != 'NAN':
+                self.missing_value = float(value)
+        elif keyword == 'COLUMN':
+            fields = value.split()
+            self.columns.append(MtzColumn(
+                fields[0],
+                fields[1],
+                float(fields[2]),
+                float(fields[3]),
+                int(fields[4]) if len(fields) > 4 else 0))
+
+    @property
+    def column_labels(self):
+        """Return the labels of the columns, in file order."""
+        return [column.label for column in self.columns]
+
+    @property
+    def data(self):
+        """
+        Return the reflection table, memory-mapped.
+
+        Return
+        ------
+        numpy.ndarray
+            Structured array with one float32 field per column label.
+
+        """
+        if self._data is None:
+            dtype = numpy.dtype([
+                (label, self._byte_order + 'f4')
+                for label in self.column_labels
+            ])
+            if self.nb_reflections == 0:
+                self._data = numpy.empty(0, dtype)
+            else:
+                self._data = numpy.memmap(
+                    self.file_path,
+                    dtype=dtype,
+                    mode='r',
+                    offset=DATA_OFFSET,
+                    shape=(self.nb_reflections,))
+        return self._data
+
+    def column(self, label):
+        """
+        Return a column of the reflection table.
+
+        The returned array is a view on the memory-mapped file.
+
+        Parameters
+        ----------
+        label: string
+            The label of the column.
+
+        Return
+        ------
+        numpy.ndarray
+            The values of the column, as float32.
+
+        """
+        if label not in self.column_labels:
+            raise KeyError("No column %s in %s." % (label, self.file_path))
+        return self.data[label]
+
+    def miller_indices(self):
+        """
+        Return the Miller indices of the reflections.
+
+        Return
+        ------
+        numpy.ndarray
+            Integer array of shape (nb_reflections, 3).
+
+        """
+        index_labels = [
+            column.label for column in self.columns if column.type == 'H'
+        ][:3]
+        return numpy.stack(
+            [self.data[label] for label in index_labels],
+            axis=1).astype(numpy.int32)
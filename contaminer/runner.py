@@ -0,0 +1,363 @@
+"""
+Run external tools, one at a time or many at once.
+
+All the wrappers in contaminer.ccp4 start their tool through a ToolRunner.
+The runner is based on asyncio, and limits the number of tools running at
+the same time.
+
+Classes
+-------
+ToolRunner
+    Start external tools with a bounded concurrency.
+
+ToolResult
+    Outcome of a successful tool call.
+
+ToolError
+    Raised when a tool returns a non-zero code.
+
+ToolNotFoundError
+    Raised when a tool cannot be executed.
+
+Functions
+---------
+available_cpus
+    Return the number of CPUs this process is allowed to use.
+
+get_default_runner
+    Return the runner shared by the whole process.
+
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import time
+import weakref
+
+from contaminer import config
+
+LOG = logging.getLogger(__name__)
+
+# Capture modes for stdout and stderr.
+CAPTURE_PIPE = "pipe"
+"""Keep the output in memory, and give it back in the ToolResult."""
+CAPTURE_DEVNULL = "devnull"
+"""Discard the output."""
+CAPTURE_INHERIT = "inherit"
+"""Let the tool write in the stdout and stderr of the current process."""
+
+_CAPTURE_MODES = {
+    CAPTURE_PIPE: subprocess.PIPE,
+    CAPTURE_DEVNULL: subprocess.DEVNULL,
+    CAPTURE_INHERIT: None,
+}
+
+
+def available_cpus():
+    """
+    Return the number of CPUs this process is allowed to use.
+
+    The CPU affinity is respected when the platform supports it, so a
+    scheduler allocation smaller than the node is not oversubscribed.
+
+    Return
+    ------
+    integer
+        The number of usable CPUs, at least 1.
+
+    """
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:  # Not available on this platform.
+        return os.cpu_count() or 1
+
+
+class ToolResult():
+    """
+    Outcome of a tool call.
+
+    Attributes
+    ----------
+    command: list(string)
+        The command which has been run.
+
+    returncode: integer
+        The return code of the tool.
+
+    stdout: string
+        The standard output. None if the output was not captured.
+
+    stderr: string
+        The standard error. None if the output was not captured.
+
+    duration: float
+        Wall time of the call, in seconds.
+
+    """
+
+    def __init__(self, command, returncode, stdout, stderr, duration):
+        self.command = command
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+
+
+class ToolError(RuntimeError):
+    """
+    Raised when a tool ends with a non-zero return code.
+
+    Attributes
+    ----------
+    tool: string
+        Name of the tool.
+
+    result: ToolResult
+        Details of the failed call. None if the tool could not be started.
+
+    """
+
+    def __init__(self, tool, result=None, message=None):
+        self.tool = tool
+        self.result = result
+        if message is None:
+            message = "Call to %s failed." % tool
+        super().__init__(message)
+
+    @property
+    def returncode(self):
+        """Return the code returned by the tool. None if it did not run."""
+        return self.result.returncode if self.result else None
+
+    def details(self):
+        """
+        Return a human readable report of the failed call.
+
+        Return
+        ------
+        string
+            The error message, followed by the output of the tool.
+
+        """
+        lines = [str(self)]
+        if self.result:
+            lines.append("Return code: %s" % self.result.returncode)
+            if self.result.stdout is not None:
+                lines.extend(["-" * 50, "Output: \n%s" % self.result.stdout])
+            if self.result.stderr is not None:
+                lines.extend(["-" * 50, "Error: \n%s" % self.result.stderr])
+            lines.append("-" * 50)
+        return "\n".join(lines)
+
+
+class ToolNotFoundError(ToolError):
+    """Raised when a tool cannot be found or executed."""
+
+    def __init__(self, tool):
+        super().__init__(tool, message="%s cannot be found." % tool)
+
+
+class ToolRunner():
+    """
+    Start external tools with a bounded concurrency.
+
+    Use run for a single blocking call, or run_async from a coroutine. Use
+    run_many to start several calls at once and wait for all of them.
+
+    Attributes
+    ----------
+    max_concurrent: integer
+        Maximum number of tools running at the same time with this runner.
+
+    """
+
+    def __init__(self, max_concurrent=None):
+        if max_concurrent is None:
+            max_concurrent = available_cpus()
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1.")
+        self.max_concurrent = max_concurrent
+        # asyncio.Semaphore is bound to an event loop, so keep one per loop.
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _get_semaphore(self):
+        """Return the semaphore for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphores[loop]
+
+    async def run_async(self, command, stdin=None, env=None, cwd=None,
+                        capture=CAPTURE_PIPE, check=True):
+        """
+        Run a tool and wait for its completion.
+
+        The tool runs in its own process group. If the coroutine is
+        cancelled, the whole group is terminated.
+
+        Parameters
+        ----------
+        command: list(string)
+            The tool to run, followed by its arguments.
+
+        stdin: string
+            Text given to the tool on its standard input.
+
+        env: dict
+            Environment for the tool. Defaults to the current environment.
+
+        cwd: string
+            Working directory of the tool.
+
+        capture: string
+            One of CAPTURE_PIPE, CAPTURE_DEVNULL or CAPTURE_INHERIT.
+
+        check: boolean
+            If True, raise ToolError if the tool returns a non-zero code.
+
+        Return
+        ------
+        ToolResult
+            The outcome of the call.
+
+        Raises
+        ------
+        ToolNotFoundError
+            If the tool cannot be executed.
+
+        ToolError
+            If check is True and the tool fails.
+
+        """
+        if capture not in _CAPTURE_MODES:
+            raise ValueError("Unknown capture mode: %s." % capture)
+        command = [str(item) for item in command]
+        tool = os.path.basename(command[0])
+        output = _CAPTURE_MODES[capture]
+
+        async with self._get_semaphore():
+            LOG.debug("Run %s.", command)
+            start = time.perf_counter()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *command,
+                    stdin=subprocess.PIPE if stdin is not None
+                    else subprocess.DEVNULL,
+                    stdout=output,
+                    stderr=output,
+                    env=env,
+                    cwd=cwd,
+                    start_new_session=True)
+            except (FileNotFoundError, PermissionError):
+                LOG.error("%s not found.", tool)
+                raise ToolNotFoundError(tool)
+
+            try:
+                stdout, stderr = await process.communicate(
+                    input=stdin.encode('UTF-8') if stdin is not None
+                    else None)
+            except asyncio.CancelledError:
+                # The tool may have started its own children.
+                LOG.info("Stop %s.", tool)
+                try:
+                    os.killpg(process.pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+                await process.wait()
+                raise
+            duration = time.perf_counter() - start
+
+        result = ToolResult(
+            command,
+            process.returncode,
+            stdout.decode('UTF-8') if stdout is not None else None,
+            stderr.decode('UTF-8') if stderr is not None else None,
+            duration)
+        LOG.debug("%s returned %s in %.3fs.", tool, result.returncode,
+                  duration)
+
+        if check and result.returncode != 0:
+            error = ToolError(tool, result)
+            LOG.error(error.details())
+            raise error
+
+        return result
+
+    async def call_async(self, function, *args):
+        """
+        Call a function in a thread, counted as a running tool.
+
+        Used for tools computed in-process, so that they share the
+        concurrency limit with the external tools.
+
+        Return
+        ------
+        object
+            The return value of the function.
+
+        """
+        loop = asyncio.get_running_loop()
+        async with self._get_semaphore():
+            return await loop.run_in_executor(None, function, *args)
+
+    def run(self, command, **kwargs):
+        """
+        Run a tool and block until its completion.
+
+        Take the same arguments as run_async.
+
+        Return
+        ------
+        ToolResult
+            The outcome of the call.
+
+        """
+        return asyncio.run(self.run_async(command, **kwargs))
+
+    def run_many(self, coroutines):
+        """
+        Run several coroutines concurrently, and block until all are done.
+
+        Parameters
+        ----------
+        coroutines: list(coroutine)
+            Typically calls to run_async, or to the run_async method of the
+            contaminer.ccp4 wrappers.
+
+        Return
+        ------
+        list
+            The return value or the raised exception for each coroutine, in
+            the same order.
+
+        """
+        async def gather():
+            return await asyncio.gather(*coroutines, return_exceptions=True)
+
+        if not coroutines:
+            return []
+        return asyncio.run(gather())
+
+
+_DEFAULT_RUNNER = None
+
+
+def get_default_runner():
+    """
+    Return the runner shared by the whole process.
+
+    The concurrency limit is read from the user configuration.
+
+    Return
+    ------
+    ToolRunner
+        The default runner.
+
+    """
+    global _DEFAULT_RUNNER  # pylint: disable=global-statement
+    if _DEFAULT_RUNNER is None:
+        _DEFAULT_RUNNER = ToolRunner(config.MAX_CONCURRENT_TOOLS)
+    return _DEFAULT_RUNNER
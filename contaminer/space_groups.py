@@ -0,0 +1,138 @@
+"""
+Provide the alternative space groups without running alt_sg_list.
+
+The alternative space groups of a space group only depend on the space group
+itself: they are the space groups of the same arithmetic class (same point
+group and lattice, differing only by screw axes and glide planes). A table
+for all 230 space groups is shipped in contaminer/data/space_groups.json.
+
+The orthorhombic P 2 2 2 class also contains the non-standard settings of
+P 2 2 21 and P 21 21 2 (P 21 2 2, P 2 21 2, P 2 21 21, P 21 2 21), since the
+axes of the data are fixed. Rhombohedral space groups are given in the
+hexagonal (H 3) and rhombohedral (R 3) settings. The other non-standard
+settings (like I 1 2 1 or P 1 1 21) are not in the table: TasksManager asks
+alt_sg_list for them.
+
+Functions
+---------
+normalize_space_group
+    Return the name of a space group as used in the table.
+
+get_alt_space_groups
+    Return the alternative space groups of a space group.
+
+get_space_group_names
+    Return all the space group names of the table.
+
+"""
+
+from functools import lru_cache
+from importlib import resources
+import json
+import logging
+
+from contaminer import data as contaminer_data
+
+LOG = logging.getLogger(__name__)
+
+
+def _get_key(name):
+    """Return the lookup key of a space group name."""
+    return name.replace(' ', '').upper()
+
+
+@lru_cache(maxsize=None)
+def _load_table():
+    """
+    Load the space group table.
+
+    Return
+    ------
+    dict
+        Entry of the table for each space group name.
+
+    dict
+        Space group name for each lookup key (names, aliases and numbers).
+
+    """
+    table = json.loads(resources.files(contaminer_data).joinpath(
+        "space_groups.json").read_text())['space_groups']
+
+    entries = {}
+    keys = {}
+    for entry in table:
+        entries[entry['name']] = entry
+        for name in [entry['name']] + entry['aliases']:
+            keys[_get_key(name)] = entry['name']
+        # The first entry for a number is the standard setting.
+        keys.setdefault(str(entry['number']), entry['name'])
+
+    return entries, keys
+
+
+@lru_cache(maxsize=None)
+def normalize_space_group(space_group):
+    """
+    Return the name of a space group as used in the table.
+
+    Parameters
+    ----------
+    space_group: string or integer
+        A space group name, like "P 21", "P21" or "P 1 21 1", or a number.
+
+    Return
+    ------
+    string
+        The space " " separated name, like "P 1 21 1".
+
+    Raises
+    ------
+    ValueError
+        If the space group is unknown.
+
+    """
+    _, keys = _load_table()
+    try:
+        return keys[_get_key(str(space_group))]
+    except KeyError:
+        raise ValueError("Unknown space group: %s." % space_group)
+
+
+@lru_cache(maxsize=None)
+def _get_alternatives(name):
+    """Return the alternatives of a normalized space group name."""
+    entries, _ = _load_table()
+    alternatives = [name]
+    alternatives.extend([
+        alternative
+        for alternative in entries[name]['alternatives']
+        if alternative != name
+    ])
+    return tuple(alternatives)
+
+
+def get_alt_space_groups(space_group):
+    """
+    Return the alternative space groups of a space group.
+
+    Parameters
+    ----------
+    space_group: string
+        The space group, in any form accepted by normalize_space_group.
+
+    Return
+    ------
+    list(string)
+        The space group itself, followed by its alternatives, space " "
+        separated.
+
+    """
+    alternatives = list(_get_alternatives(normalize_space_group(space_group)))
+    LOG.debug("Alternatives for %s: %s.", space_group, alternatives)
+    return alternatives
+
+
+def get_space_group_names():
+    """Return the names of all the space groups in the table."""
+    entries, _ = _load_table()
+    return list(entries)
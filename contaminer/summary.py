@@ -0,0 +1,157 @@
+"""
+Summarize the tasks of a job per contaminant.
+
+Used by `contaminer show-job --summary`. The tasks are read once into NumPy
+columns, grouped by contaminant, and sorted in a single lexicographic sort
+(contaminant, then percent and Q factor descending, then rank). The best
+task of each contaminant is then the first of its group, and the top tasks
+the following ones.
+
+Functions
+---------
+summarize_jobs
+    Return the summary of each contaminant of a job.
+
+"""
+
+import logging
+
+import numpy
+
+LOG = logging.getLogger(__name__)
+
+# Number of best tasks given for each contaminant.
+TOP_K = 3
+
+
+def _get_columns(jobs):
+    """
+    Read the columns needed by the summary in a single pass.
+
+    Return
+    ------
+    list(string)
+        The model names, in order of first appearance.
+
+    list(integer)
+        The rank of the first task of each model.
+
+    numpy.ndarray
+        For each job: the model code, the complete, failed and final flags,
+        the percent and the Q factor (-inf for jobs without results).
+
+    """
+    model_codes = {}
+    first_ranks = []
+    nb_jobs = len(jobs)
+    models = numpy.empty(nb_jobs, dtype=numpy.int64)
+    complete = numpy.zeros(nb_jobs, dtype=bool)
+    failed = numpy.zeros(nb_jobs, dtype=bool)
+    final = numpy.zeros(nb_jobs, dtype=bool)
+    percents = numpy.full(nb_jobs, -numpy.inf)
+    q_factors = numpy.full(nb_jobs, -numpy.inf)
+
+    for rank, job in enumerate(jobs):
+        model_name = job['infos']['model_name']
+        code = model_codes.get(model_name)
+        if code is None:
+            code = model_codes[model_name] = len(first_ranks)
+            first_ranks.append(rank)
+        models[rank] = code
+
+        status = job['status']
+        final[rank] = status in ("complete", "skipped", "failed")
+        failed[rank] = status == "failed"
+        if status == "complete":
+            complete[rank] = True
+            results = job['results']
+            percents[rank] = results['percent']
+            q_factors[rank] = results['q_factor']
+
+    return (list(model_codes), first_ranks,
+            models, complete, failed, final, percents, q_factors)
+
+
+def summarize_jobs(jobs, top_k=TOP_K):
+    """
+    Return the summary of each contaminant of a job.
+
+    The best task of a contaminant is its complete task with the highest
+    percent, then the highest Q factor, then the lowest rank.
+
+    Parameters
+    ----------
+    jobs: list(dict)
+        The jobs of a TasksManager.
+
+    top_k: integer
+        Number of best tasks to give for each contaminant.
+
+    Return
+    ------
+    list(dict)
+        For each contaminant, in the order of the jobs:
+        * infos: infos of the best task, or of the first task
+        * args_for_best, results: of the best task, or None
+        * status: "complete" if all the tasks are complete, "failed" if all
+        are done and some of them failed, "skipped" if all are complete or
+        skipped, "running" otherwise
+        * nb_tasks, complete_fraction: number of tasks, and fraction of
+        complete tasks
+        * top: args and results of the top_k best complete tasks
+
+    """
+    (model_names, first_ranks,
+     models, complete, failed, final, percents, q_factors) = _get_columns(jobs)
+    nb_models = len(model_names)
+    if not nb_models:
+        return []
+
+    nb_tasks = numpy.bincount(models, minlength=nb_models)
+    nb_complete = numpy.bincount(models, weights=complete,
+                                 minlength=nb_models)
+    nb_failed = numpy.bincount(models, weights=failed, minlength=nb_models)
+    nb_final = numpy.bincount(models, weights=final, minlength=nb_models)
+
+    # The last key is the primary one.
+    ranks = numpy.arange(len(models))
+    order = numpy.lexsort((ranks, -q_factors, -percents, models))
+    group_starts = numpy.searchsorted(models[order], numpy.arange(nb_models))
+    positions = numpy.arange(len(order)) - group_starts[models[order]]
+    top_ranks = order[(positions < top_k) & complete[order]]
+
+    summary = []
+    top_start = 0
+    for code, model_name in enumerate(model_names):
+        top_end = top_start
+        while top_end < len(top_ranks) and models[top_ranks[top_end]] == code:
+            top_end += 1
+        top = [jobs[int(rank)] for rank in top_ranks[top_start:top_end]]
+        top_start = top_end
+
+        if nb_complete[code] == nb_tasks[code]:
+            status = 'complete'
+        elif nb_final[code] == nb_tasks[code] and nb_failed[code]:
+            status = 'failed'
+        elif nb_final[code] == nb_tasks[code]:
+            status = 'skipped'
+        else:
+            status = 'running'
+
+        best = top[0] if top else None
+        summary.append({
+            'infos': (best or jobs[first_ranks[code]])['infos'],
+            'args_for_best': best['args'] if best else None,
+            'results': best['results'] if best else None,
+            'status': status,
+            'nb_tasks': int(nb_tasks[code]),
+            'complete_fraction': float(nb_complete[code] / nb_tasks[code]),
+            'top': [
+                {'args': job['args'], 'results': job['results']}
+                for job in top
+            ],
+        })
+
+    LOG.debug("Summarized %s jobs of %s contaminants.",
+              len(models), nb_models)
+    return summary
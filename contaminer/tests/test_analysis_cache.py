@@ -0,0 +1,78 @@
+"""Test contaminer.analysis_cache."""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from contaminer.analysis_cache import AnalysisCache
+from contaminer.analysis_cache import hash_file
+
+ANALYSIS = {
+    'space_group': "P 1 21 1",
+    'cell': [34.52, 45.1, 56.7, 90.0, 101.2, 90.0],
+    'alt_space_groups': ["P 1 21 1", "P 1 2 1"],
+}
+
+
+class AnalysisCacheTest(unittest.TestCase):
+    """Test AnalysisCache."""
+
+    def setUp(self):
+        """Create a temporary cache directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir, "analysis_cache")
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def _set_access(self, cache, file_hash, access_time):
+        entry_path = cache._get_entry_path(file_hash)
+        os.utime(entry_path, (access_time, access_time))
+
+    def test_hash_file(self):
+        """hash_file returns the SHA-256 of the content."""
+        file_path = os.path.join(self.temp_dir, "data.mtz")
+        with open(file_path, 'wb') as data_file:
+            data_file.write(b"MTZ " * 1000)
+        self.assertEqual(hash_file(file_path),
+                         hashlib.sha256(b"MTZ " * 1000).hexdigest())
+
+    def test_put_and_get(self):
+        """A stored analysis is returned, unknown hashes give None."""
+        cache = AnalysisCache(self.cache_dir, 1024 * 1024)
+        self.assertIsNone(cache.get("a" * 64))
+        cache.put("a" * 64, ANALYSIS)
+        self.assertEqual(cache.get("a" * 64), ANALYSIS)
+        self.assertIsNone(cache.get("b" * 64))
+
+    def test_corrupted_entry(self):
+        """A corrupted entry is a cache miss."""
+        cache = AnalysisCache(self.cache_dir, 1024 * 1024)
+        cache.put("a" * 64, ANALYSIS)
+        with open(cache._get_entry_path("a" * 64), 'w') as entry_file:
+            entry_file.write("{")
+        self.assertIsNone(cache.get("a" * 64))
+
+    def test_evict_least_recently_used(self):
+        """Entries over the size limit are evicted, oldest access first."""
+        cache = AnalysisCache(self.cache_dir, 1024 * 1024)
+        for index, file_hash in enumerate(["a" * 64, "b" * 64, "c" * 64]):
+            cache.put(file_hash, ANALYSIS)
+            self._set_access(cache, file_hash, 1000 + index)
+        # Reading "a" makes it the most recently used.
+        cache.get("a" * 64)
+
+        entry_size = os.path.getsize(cache._get_entry_path("a" * 64))
+        cache.max_size = 2 * entry_size
+        cache.evict()
+
+        self.assertIsNone(cache.get("b" * 64))
+        self.assertEqual(cache.get("a" * 64), ANALYSIS)
+        self.assertEqual(cache.get("c" * 64), ANALYSIS)
+
+
+if __name__ == "__main__":
+    unittest.main()
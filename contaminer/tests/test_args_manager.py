@@ -1,10 +1,14 @@
 """Test contaminer.args_manager."""
 
 import os
+import shutil
 import tempfile
 import unittest
+from unittest import mock
 
 from contaminer import args_manager
+from contaminer import config
+from contaminer.runner import ToolResult
 
 TEST_DIR = os.path.dirname(os.path.realpath(__file__))
 
@@ -56,5 +60,352 @@ class ArgumentsListManagerTest(unittest.TestCase):
             os.remove(temp_save_file)
 
 
+def _make_job(pack_number, space_group):
+    """Return a new job for the B4SL31 test model."""
+    return {
+        'infos': {
+            'model_name': 'B4SL31',
+            'is_AF_model': False,
+            'is_custom_model': False
+        },
+        'args': {
+            'input_file': '5jk4-sf.cif',
+            'model_dir': 'B4SL31/models',
+            'pack_number': pack_number,
+            'space_group': space_group
+        },
+        'results': None,
+        'status': 'new'
+    }
+
+
+class AnalyseTest(unittest.TestCase):
+    """Test the analysis of the input file."""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.input_file = os.path.join(self.work_dir, "input.mtz")
+        with open(self.input_file, 'w') as input_file:
+            input_file.write("MTZ")
+        patcher = mock.patch.object(args_manager.config,
+                                    'ANALYSIS_CACHE_DIR', self.work_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    @mock.patch.object(args_manager.AltSgList, 'run', autospec=True)
+    def test_table(self, run):
+        """Standard settings are found in the table."""
+        with mock.patch.object(args_manager.TasksManager, '_read_symmetry',
+                               return_value=("P 1 21 1", None)):
+            analysis = args_manager.TasksManager()._analyse(self.input_file)
+        self.assertEqual(analysis['alt_space_groups'],
+                         ["P 1 21 1", "P 1 2 1"])
+        run.assert_not_called()
+
+    @mock.patch.object(args_manager.AltSgList, 'run', autospec=True)
+    def test_non_standard_setting(self, run):
+        """Settings missing from the table are given by alt_sg_list."""
+        def set_output(alt_sg_task):
+            alt_sg_task.output = ' 5005  "I 1 2 1"\n'
+        run.side_effect = set_output
+
+        with mock.patch.object(args_manager.TasksManager, '_read_symmetry',
+                               return_value=("I 1 2 1", (1, 2, 3))):
+            analysis = args_manager.TasksManager()._analyse(self.input_file)
+        self.assertEqual(analysis, {
+            'space_group': "I 1 2 1",
+            'cell': [1, 2, 3],
+            'alt_space_groups': ["I 1 2 1"],
+        })
+        run.assert_called_once_with(mock.ANY)
+        self.assertEqual(run.call_args[0][0].space_group, "I 1 2 1")
+
+
+class CompileResultsTest(unittest.TestCase):
+    """Test TasksManager.compile_results."""
+
+    def setUp(self):
+        """Copy the results of the test data in a temporary directory."""
+        self.orig_dir = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        for res_dir in ["B4SL31_1_P-1-21-1", "B4SL31_1_P-1"]:
+            shutil.copytree(
+                os.path.join(TEST_DIR, "data", res_dir),
+                os.path.join(self.work_dir, res_dir))
+        os.chdir(self.work_dir)
+        self.min_jobs_per_worker = args_manager.MIN_JOBS_PER_WORKER
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        args_manager.MIN_JOBS_PER_WORKER = self.min_jobs_per_worker
+        os.chdir(self.orig_dir)
+        shutil.rmtree(self.work_dir)
+
+    def _get_manager(self, nb_repeats=1):
+        manager = args_manager.TasksManager()
+        for _ in range(nb_repeats):
+            manager.jobs.extend([
+                _make_job(1, "P 1 21 1"),
+                _make_job(1, "P 1"),
+                _make_job(2, "P 1"),
+            ])
+        return manager
+
+    def test_compile_results(self):
+        """Complete jobs get results, others are running."""
+        manager = self._get_manager()
+        manager.compile_results(max_workers=1)
+
+        self.assertEqual(
+            [job['status'] for job in manager.jobs],
+            ["complete", "complete", "running"])
+        self.assertEqual(manager.jobs[0]['results']['percent'], 99.0)
+        self.assertEqual(manager.jobs[1]['results']['percent'], 0.0)
+        self.assertIsNone(manager.jobs[2]['results'])
+        self.assertFalse(manager.complete)
+
+    def test_parallel_compile_results(self):
+        """Results compiled in a pool are the same as serial ones."""
+        args_manager.MIN_JOBS_PER_WORKER = 1
+        serial = self._get_manager(10)
+        serial.compile_results(max_workers=1)
+        parallel = self._get_manager(10)
+        parallel.compile_results(max_workers=3)
+
+        self.assertEqual(serial.jobs, parallel.jobs)
+
+    def test_incremental_compile_results(self):
+        """Only jobs with a modified result directory are read again."""
+        state_filepath = os.path.join(self.work_dir, "compile_state.json")
+        manager = self._get_manager()
+        manager.compile_results(max_workers=1, state_filepath=state_filepath)
+        self.assertTrue(os.path.isfile(state_filepath))
+        self.assertEqual(manager.changed_ranks, {0, 1, 2})
+        manager.changed_ranks = set()
+
+        with mock.patch.object(args_manager, '_compile_job',
+                               wraps=args_manager._compile_job) as compile_job:
+            # Nothing changed for the running job.
+            manager.compile_results(max_workers=1,
+                                    state_filepath=state_filepath)
+            self.assertEqual(compile_job.call_count, 0)
+
+            # The running job has now finished.
+            shutil.copytree("B4SL31_1_P-1", "B4SL31_2_P-1")
+            manager.compile_results(max_workers=1,
+                                    state_filepath=state_filepath)
+            self.assertEqual(compile_job.call_count, 1)
+
+        self.assertEqual(manager.changed_ranks, {2})
+        self.assertTrue(manager.complete)
+
+    def test_iter_compiled(self):
+        """Jobs are given as soon as their batch is compiled."""
+        manager = self._get_manager()
+        with mock.patch.object(args_manager, 'COMPILE_BATCH', 1), \
+                mock.patch.object(args_manager, '_compile_job',
+                                  wraps=args_manager._compile_job) \
+                as compile_job:
+            compiled = manager.iter_compiled(max_workers=1)
+            rank, job = next(compiled)
+            self.assertEqual(compile_job.call_count, 1)
+            self.assertEqual((rank, job['status']), (0, "complete"))
+            self.assertEqual([rank for rank, _ in compiled], [1, 2])
+
+    def test_stream_compiled(self):
+        """Jobs are read, compiled and saved one at a time."""
+        manager = self._get_manager(2)
+        tasks_path = os.path.join(self.work_dir, "tasks.json")
+        manager.save(tasks_path)
+        with mock.patch.object(args_manager, 'READ_BUFFER_SIZE', 7):
+            self.assertEqual(
+                list(args_manager.TasksManager.iter_jobs(tasks_path)),
+                list(enumerate(manager.jobs)))
+
+            with mock.patch.object(args_manager, '_compile_job',
+                                   wraps=args_manager._compile_job) \
+                    as compile_job:
+                compiled = args_manager.TasksManager.stream_compiled(
+                    tasks_path)
+                rank, job = next(compiled)
+                self.assertEqual(compile_job.call_count, 1)
+                self.assertEqual((rank, job['status']), (0, "complete"))
+                self.assertEqual(
+                    [job['status'] for _, job in compiled],
+                    ["complete", "running", "complete", "complete",
+                     "running"])
+
+        manager.compile_results(max_workers=1)
+        loader = args_manager.TasksManager()
+        loader.load(tasks_path)
+        self.assertEqual(loader.jobs, manager.jobs)
+
+    def test_skipped_jobs(self):
+        """Jobs without results are skipped once their model is identified."""
+        state_filepath = os.path.join(self.work_dir, "compile_state.json")
+        manager = self._get_manager()
+        manager.compile_results(max_workers=1, state_filepath=state_filepath)
+        self.assertFalse(manager.complete)
+
+        os.mkdir("stop")
+        with open(os.path.join("stop", "contaminant_B4SL31.json"), 'w'):
+            pass
+        manager.compile_results(max_workers=1, state_filepath=state_filepath)
+
+        self.assertEqual(
+            [job['status'] for job in manager.jobs],
+            ["complete", "complete", "skipped"])
+        self.assertTrue(manager.complete)
+        self.assertEqual(manager.nb_skipped, 1)
+
+
+class ResultSidecarTest(unittest.TestCase):
+    """Test the result sidecars written by TasksManager.run."""
+
+    def setUp(self):
+        """Copy the results of the test data in a temporary directory."""
+        self.orig_dir = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        shutil.copytree(
+            os.path.join(TEST_DIR, "data", "B4SL31_1_P-1-21-1"),
+            os.path.join(self.work_dir, "B4SL31_1_P-1-21-1"))
+        manager = args_manager.TasksManager()
+        manager.jobs = [_make_job(1, "P 1 21 1"), _make_job(2, "P 1")]
+        manager.save(os.path.join(self.work_dir, "tasks.json"))
+        os.chdir(self.work_dir)
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        os.chdir(self.orig_dir)
+        shutil.rmtree(self.work_dir)
+
+    @mock.patch.object(args_manager.config, 'ARGS_FILENAME', "tasks.json")
+    @mock.patch.object(args_manager.config, 'EARLY_STOP', "off")
+    @mock.patch.object(args_manager.MordaSolve, 'run')
+    def test_run(self, _):
+        """The results are parsed by the task, and read from the sidecar."""
+        args_manager.TasksManager().run(self.work_dir, 0)
+
+        sidecar = args_manager.read_result_sidecar("B4SL31_1_P-1-21-1")
+        self.assertEqual(sidecar['status'], "complete")
+        self.assertEqual(sidecar['exit_status'], 0)
+        self.assertEqual(sidecar['results']['percent'], 99.0)
+        self.assertGreaterEqual(sidecar['duration'], 0)
+
+        # The XML is not parsed again.
+        os.remove(os.path.join("B4SL31_1_P-1-21-1", "morda_solve.xml"))
+        status, results = args_manager._compile_job(
+            _make_job(1, "P 1 21 1")['args'])
+        self.assertEqual(status, "complete")
+        self.assertEqual(results, sidecar['results'])
+
+    @mock.patch.object(args_manager.config, 'ARGS_FILENAME', "tasks.json")
+    @mock.patch.object(args_manager.config, 'EARLY_STOP', "job")
+    @mock.patch.object(args_manager.config, 'EARLY_STOP_PERCENT', 90)
+    @mock.patch.object(args_manager.config, 'MAP_PERCENT_THRESHOLD', 90)
+    @mock.patch.object(args_manager.config, 'CANCEL_COMMAND', "scancel")
+    @mock.patch.object(args_manager.MordaSolve, 'run_async')
+    def test_hit_order(self, _):
+        """A hit stops the job before the maps, and cancels it last."""
+        open(os.path.join("B4SL31_1_P-1-21-1", "final.mtz"), 'w').close()
+        calls = []
+        with mock.patch("contaminer.maps.make_maps",
+                        side_effect=lambda _: calls.append(
+                            ("maps", os.path.exists("stop/job.json")))), \
+                mock.patch.object(args_manager.EarlyStop, 'cancel',
+                                  side_effect=lambda: calls.append("cancel")):
+            args_manager.TasksManager().run(self.work_dir, 0)
+        self.assertEqual(calls, [("maps", True), "cancel"])
+
+    @mock.patch.object(args_manager.config, 'ARGS_FILENAME', "tasks.json")
+    @mock.patch.object(args_manager.config, 'EARLY_STOP', "off")
+    @mock.patch.object(args_manager.MordaSolve, 'run')
+    def test_failed_run(self, run):
+        """A failed morda_solve leaves a failed sidecar, and is failed."""
+        run.side_effect = args_manager.ToolError(
+            "morda_solve", ToolResult(["morda_solve"], 3, "", "", 1.0))
+        with self.assertRaises(args_manager.ToolError):
+            args_manager.TasksManager().run(self.work_dir, 1)
+
+        sidecar = args_manager.read_result_sidecar("B4SL31_2_P-1")
+        self.assertEqual(sidecar['status'], "failed")
+        self.assertEqual(sidecar['exit_status'], 3)
+        self.assertIsNone(sidecar['results'])
+        status, results = args_manager._compile_job(
+            _make_job(2, "P 1")['args'])
+        self.assertEqual(status, "failed")
+        self.assertEqual(results['exit_status'], 3)
+        self.assertIn("morda_solve", results['error'])
+
+        # The failure is given by solve-status.
+        manager = args_manager.TasksManager()
+        manager.load("tasks.json")
+        manager.compile_results(max_workers=1)
+        self.assertEqual(manager.get_failed(), [(1, results)])
+        self.assertTrue(manager.complete)
+
+    @mock.patch.object(args_manager.config, 'EARLY_STOP', "off")
+    @mock.patch.object(args_manager.MordaSolve, 'run')
+    def test_failed_run_store(self, run):
+        """A failed task updates its row of the JobStore."""
+        manager = args_manager.TasksManager()
+        manager.load("tasks.json")
+        manager.save(config.JOB_STORE_FILENAME)
+        run.side_effect = args_manager.ToolError(
+            "morda_solve", ToolResult(["morda_solve"], 3, "", "", 1.0))
+        with self.assertRaises(args_manager.ToolError):
+            args_manager.TasksManager().run(self.work_dir, 1)
+
+        job = args_manager.TasksManager.load_job(config.JOB_STORE_FILENAME, 1)
+        self.assertEqual(job['status'], "failed")
+        self.assertEqual(job['results']['exit_status'], 3)
+
+
+def _fake_run(self, prep_dir, rank):
+    """Replace TasksManager.run by writing a file, and fail for rank 3."""
+    if rank == 3:
+        raise RuntimeError("morda_solve failed.")
+    with open(os.path.join(prep_dir, "rank_%s" % rank), 'w'):
+        pass
+
+
+class ChunkTest(unittest.TestCase):
+    """Test get_chunk_ranks and TasksManager.run_chunk."""
+
+    def test_chunk_ranks(self):
+        """Each rank is in a single chunk, for both layouts."""
+        self.assertEqual(args_manager.get_nb_chunks(10, 4), 3)
+        for layout in ["strided", "contiguous"]:
+            ranks = [
+                args_manager.get_chunk_ranks(10, chunk, 4, layout)
+                for chunk in range(3)
+            ]
+            self.assertEqual(sorted(sum(ranks, [])), list(range(10)))
+            self.assertTrue(all(len(chunk) <= 4 for chunk in ranks))
+
+        self.assertEqual(
+            args_manager.get_chunk_ranks(10, 1, 4, "contiguous"),
+            [4, 5, 6, 7])
+        self.assertEqual(
+            args_manager.get_chunk_ranks(10, 1, 4, "strided"),
+            [1, 4, 7])
+        with self.assertRaises(ValueError):
+            args_manager.get_chunk_ranks(10, 1, 4, "random")
+
+    @mock.patch.object(args_manager.TasksManager, 'run', _fake_run)
+    @mock.patch.object(args_manager, 'get_tool_environment')
+    def test_run_chunk(self, _):
+        """All the ranks run, and failures are reported at the end."""
+        with tempfile.TemporaryDirectory() as prep_dir:
+            manager = args_manager.TasksManager()
+            with self.assertRaises(RuntimeError):
+                manager.run_chunk(prep_dir, [1, 3, 5], max_workers=2)
+            self.assertEqual(sorted(os.listdir(prep_dir)),
+                             ["rank_1", "rank_5"])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -95,6 +95,8 @@ class MordaSolveTest(unittest.TestCase):
                 'q_factor': 0.907,
                 'percent': 99.0
             })
+        # Reading the results does not need any temporary directory.
+        self.assertIsNone(morda_solve._temp_dir)
 
     def test_get_no_solution(self):
         """get_results returns scores if morda_solve reports no result."""
@@ -1,5 +1,7 @@
 """Test the config module."""
 
+import contextlib
+import io
 import os
 import tempfile
 import shutil
@@ -40,3 +42,9 @@ class ConfigTest(unittest.TestCase):
         conf = config.UserConfig(config_path).load()
         self.assertDictEqual(dict(conf['PATH']),
                              {'ccp4': '/opt/ccp4', 'morda': '/opt/morda'})
+
+    def test_default_map_engine(self):
+        """Maps are computed by sftools unless the user config changes it."""
+        with contextlib.redirect_stdout(io.StringIO()):
+            settings = config._load_settings()
+        self.assertEqual(settings['MAP_ENGINE'], "sftools")
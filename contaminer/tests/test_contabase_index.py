@@ -0,0 +1,111 @@
+"""Test contaminer.contabase_index."""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from contaminer import args_manager
+from contaminer import config
+from contaminer import contabase_index
+
+
+def _write_nb_packs(contabase_dir, model_name, nb_packs):
+    """Write the nbpacks file of a prepared model."""
+    model_dir = os.path.join(contabase_dir, model_name)
+    os.makedirs(model_dir, exist_ok=True)
+    with open(os.path.join(model_dir, "nbpacks"), 'w') as pack_file:
+        pack_file.write("%s\n" % nb_packs)
+
+
+class ContaBaseIndexTest(unittest.TestCase):
+    """Test ContaBaseIndex and get_contabase_index."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.contabase_dir = self.temp_dir.name
+        self.index_path = os.path.join(self.contabase_dir,
+                                       config.CONTABASE_INDEX_FILENAME)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_build(self):
+        """The index has all the contaminants, with their models."""
+        _write_nb_packs(self.contabase_dir, "P0ACJ8", 4)
+        index = contabase_index.get_contabase_index(self.contabase_dir)
+        self.assertTrue(os.path.isfile(self.index_path))
+
+        entry = index.get("P0ACJ8")
+        self.assertEqual(entry['category_name'], "Proteins in E.coli")
+        self.assertEqual(entry['contaminant']['short_name'], "CRP_ECOLI")
+        self.assertEqual(entry['model_dir'], os.path.join(
+            self.contabase_dir, "P0ACJ8", "models"))
+        self.assertEqual(index.get_nb_packs("P0ACJ8"), 4)
+        self.assertEqual(index.get_contaminants()[0], entry['contaminant'])
+        self.assertFalse(index.is_complete())
+
+        with self.assertRaises(RuntimeError):
+            index.get("UNKNOWN")
+        with self.assertRaises(RuntimeError):
+            index.get_nb_packs("P61517")
+
+        # The saved index is the same.
+        loaded = contabase_index.ContaBaseIndex.load(self.index_path)
+        self.assertEqual(loaded.contaminants, index.contaminants)
+
+    def test_refresh(self):
+        """Models prepared after the index is built are found."""
+        index = contabase_index.get_contabase_index(self.contabase_dir)
+        for uniprot_id, entry in index.contaminants.items():
+            _write_nb_packs(self.contabase_dir, uniprot_id, 2)
+            if entry['alpha_fold']:
+                _write_nb_packs(self.contabase_dir, "AF_" + uniprot_id, 1)
+
+        with mock.patch.object(contabase_index.ContaBaseIndex, 'build') \
+                as build:
+            index = contabase_index.get_contabase_index(self.contabase_dir)
+        build.assert_not_called()
+        self.assertTrue(index.is_complete())
+
+        # A model prepared again is read after the index is removed.
+        _write_nb_packs(self.contabase_dir, "P0ACJ8", 5)
+        contabase_index.remove_contabase_index(self.contabase_dir)
+        index = contabase_index.get_contabase_index(self.contabase_dir)
+        self.assertEqual(index.get_nb_packs("P0ACJ8"), 5)
+
+    def test_rebuild(self):
+        """The index is rebuilt when contabase.yaml changes."""
+        contabase_index.get_contabase_index(self.contabase_dir)
+        with open(self.index_path, 'r') as index_file:
+            data = json.loads(index_file.read())
+        data['yaml_hash'] = "outdated"
+        data['contaminants'] = {}
+        with open(self.index_path, 'w') as index_file:
+            index_file.write(json.dumps(data))
+
+        index = contabase_index.get_contabase_index(self.contabase_dir)
+        self.assertIn("P0ACJ8", index.contaminants)
+
+    def test_generate_jobs(self):
+        """Jobs are generated from the index."""
+        _write_nb_packs(self.contabase_dir, "P0ACJ8", 3)
+        manager = args_manager.TasksManager()
+        with mock.patch.object(config, 'CONTABASE_DIR', self.contabase_dir), \
+                mock.patch.object(config, 'HIT_RATES_PATH', os.path.join(
+                    self.contabase_dir, "hit_rates.json")):
+            manager._generate_jobs("input.mtz", ["P0ACJ8"],
+                                   ["P 1 21 1", "P 1"])
+
+        self.assertEqual(len(manager.jobs), 6)
+        self.assertEqual(manager.jobs[-1]['args'], {
+            'input_file': "input.mtz",
+            'model_dir': os.path.join(self.contabase_dir, "P0ACJ8", "models"),
+            'pack_number': 3,
+            'space_group': "P 1"
+        })
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""Test contaminer.contabase_manifest."""
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from contaminer import config
+from contaminer import contabase_manifest
+from contaminer import contaminer
+from contaminer.contabase_index import get_contabase_index
+
+
+class ContaBaseManifestTest(unittest.TestCase):
+    """Test the manifest of a prepared ContaBase."""
+
+    def setUp(self):
+        """Prepare a fake ContaBase, with a pack file per model."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.contabase_dir = self.temp_dir.name
+        self.model_names = get_contabase_index(
+            self.contabase_dir).get_model_names()
+        for model_name in self.model_names:
+            pack_dir = os.path.join(self.contabase_dir, model_name, "models")
+            os.makedirs(pack_dir)
+            with open(os.path.join(pack_dir, "pack1.pdb"), 'w') as pack_file:
+                pack_file.write("ATOM %s\n" % model_name)
+            with open(os.path.join(self.contabase_dir, model_name, "nbpacks"),
+                      'w') as pack_file:
+                pack_file.write("1\n")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _prepare_all(self):
+        """Write the manifests, as the init-tasks do."""
+        for model_name in self.model_names:
+            contabase_manifest.write_model_manifest(
+                os.path.join(self.contabase_dir, model_name), 1)
+            contabase_manifest.gather_manifest(self.contabase_dir)
+
+    def test_gather(self):
+        """The manifest is written when the last model is prepared."""
+        for model_name in self.model_names[:-1]:
+            contabase_manifest.write_model_manifest(
+                os.path.join(self.contabase_dir, model_name), 1)
+        self.assertIsNone(
+            contabase_manifest.gather_manifest(self.contabase_dir))
+        self.assertFalse(
+            contabase_manifest.is_manifest_ready(self.contabase_dir))
+
+        self._prepare_all()
+        self.assertTrue(
+            contabase_manifest.is_manifest_ready(self.contabase_dir))
+        manifest = contabase_manifest.read_manifest(self.contabase_dir)
+        model_manifest = manifest['models'][self.model_names[0]]
+        self.assertEqual(model_manifest['nb_packs'], 1)
+        self.assertEqual(sorted(model_manifest['files']),
+                         [os.path.join("models", "pack1.pdb"), "nbpacks"])
+
+    def test_verify(self):
+        """Corrupted and missing files are reported by model."""
+        self._prepare_all()
+        self.assertEqual(
+            contabase_manifest.verify_contabase(self.contabase_dir, 4), {})
+
+        first, second = self.model_names[:2]
+        with open(os.path.join(self.contabase_dir, first, "models",
+                               "pack1.pdb"), 'w') as pack_file:
+            pack_file.write("ATOM %s\n" % second)
+        os.remove(os.path.join(self.contabase_dir, second, "nbpacks"))
+
+        self.assertEqual(
+            contabase_manifest.verify_contabase(self.contabase_dir, 4),
+            {
+                first: [os.path.join("models", "pack1.pdb")
+                        + ": checksum differs"],
+                second: ["nbpacks: missing"],
+            })
+
+    def test_init_status(self):
+        """init-status --verify lists the corrupted models."""
+        self._prepare_all()
+        os.remove(os.path.join(self.contabase_dir, self.model_names[0],
+                               "models", "pack1.pdb"))
+
+        output = io.StringIO()
+        with mock.patch.object(config, 'CONTABASE_DIR', self.contabase_dir), \
+                contextlib.redirect_stdout(output):
+            self.assertTrue(contaminer._is_contabase_ready())
+            contaminer.init_status()
+            contaminer.init_status(verify=True, max_workers=2)
+        self.assertEqual(output.getvalue().splitlines()[:3], [
+            "ContaBase is: Ready.",
+            "ContaBase is: Corrupted.",
+            "Model %s:" % self.model_names[0],
+        ])
+
+    def test_older_contabase(self):
+        """A ContaBase prepared without manifest gets one with --verify."""
+        output = io.StringIO()
+        with mock.patch.object(config, 'CONTABASE_DIR', self.contabase_dir), \
+                contextlib.redirect_stdout(output):
+            self.assertTrue(contaminer._is_contabase_ready())
+            contaminer.init_status(verify=True)
+        self.assertTrue(
+            contabase_manifest.is_manifest_ready(self.contabase_dir))
+        self.assertEqual(
+            contabase_manifest.verify_contabase(self.contabase_dir), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
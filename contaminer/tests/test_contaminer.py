@@ -0,0 +1,292 @@
+"""Test contaminer.contaminer."""
+
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from contaminer import args_manager
+from contaminer import config
+from contaminer import contaminer
+from contaminer.contabase_manifest import write_model_manifest
+from contaminer.contaminer import _get_model_source
+from contaminer.tests.test_args_manager import TEST_DIR
+from contaminer.tests.test_args_manager import _make_job
+from contaminer.work_queue import WorkQueue
+
+
+@mock.patch.object(config, 'ARGS_FILENAME', "tasks.json")
+class ShowJobTest(unittest.TestCase):
+    """Test show_job."""
+
+    def setUp(self):
+        """Copy the results of the test data in a temporary directory."""
+        self.orig_dir = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        for res_dir in ["B4SL31_1_P-1-21-1", "B4SL31_1_P-1"]:
+            shutil.copytree(
+                os.path.join(TEST_DIR, "data", res_dir),
+                os.path.join(self.work_dir, res_dir))
+        manager = args_manager.TasksManager()
+        manager.jobs = [
+            _make_job(1, "P 1 21 1"),
+            _make_job(1, "P 1"),
+            _make_job(2, "P 1"),
+        ]
+        manager.save(os.path.join(self.work_dir, "tasks.json"))
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        os.chdir(self.orig_dir)
+        shutil.rmtree(self.work_dir)
+
+    def _show_job(self, **kwargs):
+        """Return the output of show_job."""
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            contaminer.show_job(self.work_dir, **kwargs)
+        return output.getvalue()
+
+    def test_ndjson(self):
+        """One line per task, with the compiled results."""
+        lines = self._show_job(ndjson=True).splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['rank'] for record in records], [0, 1, 2])
+        self.assertEqual(
+            [record['status'] for record in records],
+            ["complete", "complete", "running"])
+        self.assertEqual(records[0]['results']['percent'], 99.0)
+
+        # The tasks file is updated as well.
+        manager = args_manager.TasksManager()
+        manager.load(os.path.join(self.work_dir, "tasks.json"))
+        self.assertEqual(manager.jobs[1]['status'], "complete")
+
+    def test_status_recovers_queue(self):
+        """solve-status puts the tasks of dead workers back in the queue."""
+        queue = WorkQueue(self.work_dir, claim_timeout=0)
+        queue.populate([2])
+        claim_path = queue.claim()
+
+        output = io.StringIO()
+        with mock.patch.object(config, 'CLAIM_TIMEOUT', 0), \
+                contextlib.redirect_stdout(output):
+            contaminer.solve_status(self.work_dir)
+        self.assertIn("1 tasks of dead workers are back in the queue",
+                      output.getvalue())
+        self.assertFalse(os.path.exists(claim_path))
+        self.assertEqual(queue.claim(), claim_path)
+
+    def test_migrate_store(self):
+        """Only the ended jobs run with --local are migrated."""
+        with self.assertRaises(RuntimeError):
+            contaminer.migrate_store(self.work_dir)
+
+        os.chdir(self.work_dir)
+        shutil.copytree("B4SL31_1_P-1", "B4SL31_2_P-1")
+        with open(config.JOB_SCRIPT, 'w'):
+            pass
+        with self.assertRaises(RuntimeError):
+            contaminer.migrate_store(self.work_dir)
+
+        os.remove(config.JOB_SCRIPT)
+        hit_rates_path = os.path.join(self.work_dir, "hit_rates.json")
+        with mock.patch.object(config, 'HIT_RATES_PATH', hit_rates_path), \
+                contextlib.redirect_stdout(io.StringIO()):
+            contaminer.migrate_store(self.work_dir)
+        self.assertTrue(os.path.isfile(config.JOB_STORE_FILENAME))
+
+    def test_ndjson_filters(self):
+        """Only the matching tasks are printed, with the given fields."""
+        output = self._show_job(
+            ndjson=True, min_percent=50,
+            fields=["rank", "results.percent", "args.space_group"])
+        self.assertEqual(
+            [json.loads(line) for line in output.splitlines()],
+            [{'rank': 0, 'results': {'percent': 99.0},
+              'args': {'space_group': "P 1 21 1"}}])
+
+        output = self._show_job(ndjson=True, statuses=["running"],
+                                models=["B4SL31"], fields=["rank"])
+        self.assertEqual(output, '{"rank": 2}\n')
+        self.assertEqual(
+            self._show_job(ndjson=True, models=["P0ACJ8"]), "")
+
+        with self.assertRaises(RuntimeError):
+            self._show_job(min_percent=50)
+
+
+def _make_contaminant(uniprot_id, alpha_fold=False, sequence=None):
+    """Return a contaminant, as in contabase.yaml."""
+    contaminant = {
+        'uniprot_id': uniprot_id,
+        'exact_model': True,
+        'alpha_fold': alpha_fold,
+    }
+    if sequence:
+        contaminant['sequence'] = sequence
+    return contaminant
+
+
+class PrepareJobScriptTest(unittest.TestCase):
+    """Test _create_prepare_job_script."""
+
+    def test_no_pattern_left(self):
+        """Every pattern of the SLURM template is replaced."""
+        with tempfile.TemporaryDirectory() as contabase_dir, \
+                mock.patch.object(config, 'CONTABASE_DIR', contabase_dir), \
+                mock.patch.object(config, 'CPUS_PER_TASK', 0), \
+                mock.patch.object(config, 'JOB_TEMPLATE_PATH', os.path.join(
+                    os.path.dirname(contaminer.__file__), "data",
+                    "job_template.sbatch")):
+            contaminer._create_prepare_job_script(4, "update-task")
+            with open(os.path.join(contabase_dir,
+                                   config.JOB_SCRIPT)) as job_script:
+                script_content = job_script.read()
+
+        self.assertIsNone(re.search("%[A-Z_]+%", script_content))
+        self.assertIn("#SBATCH --cpus-per-task=1\n", script_content)
+        self.assertIn("#SBATCH --array=0-3\n", script_content)
+        self.assertIn("contaminer update-task  $SLURM_ARRAY_TASK_ID",
+                      script_content)
+
+
+class UpdateTest(unittest.TestCase):
+    """Test update."""
+
+    def setUp(self):
+        """Prepare a ContaBase with 4 models, and change contabase.yaml."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.contabase_dir = self.temp_dir.name
+        patchers = [
+            mock.patch.object(config, 'CONTABASE_DIR', self.contabase_dir),
+            mock.patch.object(config, 'JOB_TEMPLATE_PATH', os.path.join(
+                os.path.dirname(contaminer.__file__), "data",
+                "job_template.sh")),
+            mock.patch.object(contaminer, 'Fetcher'),
+            mock.patch.object(contaminer, '_submit_prepare_job'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        models = contaminer._get_models([
+            _make_contaminant("P0ACJ8"),
+            _make_contaminant("P61517", sequence="MKDIDTLISN"),
+            _make_contaminant("P0A7A9"),
+        ])
+        for model in models:
+            self._prepare(model['model_name'], _get_model_source(model))
+        # Prepared by an older version, and being prepared.
+        self._prepare("P27302", None)
+        os.mkdir(os.path.join(self.contabase_dir, "P0AA25"))
+
+        self.contaminants = [
+            _make_contaminant("P0ACJ8", alpha_fold=True),
+            _make_contaminant("P61517", sequence="MKDIDTLISNNALW"),
+            _make_contaminant("P27302"),
+            _make_contaminant("P0AA25"),
+            _make_contaminant("P0A9K9"),
+        ]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _prepare(self, model_name, source):
+        """Write the files of a prepared model."""
+        model_dir = os.path.join(self.contabase_dir, model_name)
+        os.mkdir(model_dir)
+        for file_name in ["sequence.fasta", "nbpacks"]:
+            with open(os.path.join(model_dir, file_name), 'w') as model_file:
+                model_file.write("1\n")
+        if source is not None:
+            write_model_manifest(model_dir, 1, source)
+
+    def _update(self, dry_run=False):
+        """Return the output of update."""
+        output = io.StringIO()
+        with mock.patch.object(contaminer, '_get_all_contaminants',
+                               return_value=self.contaminants), \
+                contextlib.redirect_stdout(output):
+            contaminer.update(dry_run)
+        return output.getvalue()
+
+    def test_update(self):
+        """Only the new, incomplete and changed models are prepared."""
+        output = self._update(dry_run=True)
+        self.assertEqual(output.splitlines(), [
+            "New models: AF_P0ACJ8 P0A9K9",
+            "Incomplete models: P0AA25",
+            "Changed models: P61517",
+            "Removed models: P0A7A9",
+        ])
+        self.assertTrue(os.path.isdir(
+            os.path.join(self.contabase_dir, "P0A7A9")))
+
+        self.assertEqual(self._update(), output)
+        with open(os.path.join(self.contabase_dir,
+                               config.CONTABASE_UPDATE_FILENAME)) as update:
+            self.assertEqual(json.loads(update.read()),
+                             ["AF_P0ACJ8", "P61517", "P0AA25", "P0A9K9"])
+        with open(os.path.join(self.contabase_dir,
+                               config.JOB_SCRIPT)) as job_script:
+            self.assertIn("seq 0 3 | xargs -n 1 -P 12 -I {} contaminer "
+                          "update-task", job_script.read())
+        contaminer._submit_prepare_job.assert_called_once_with()
+
+        # The changed model is prepared again, the other ones are kept.
+        self.assertFalse(os.path.isfile(
+            os.path.join(self.contabase_dir, "P61517", "nbpacks")))
+        with open(os.path.join(self.contabase_dir, "P61517",
+                               "sequence.fasta")) as sequence_file:
+            self.assertEqual(sequence_file.read(), ">lcl|P61517MKDIDTLISNNALW")
+        for model_name in ["P0ACJ8", "P27302"]:
+            self.assertTrue(os.path.isfile(
+                os.path.join(self.contabase_dir, model_name, "nbpacks")))
+        self.assertTrue(os.path.isdir(os.path.join(
+            self.contabase_dir, config.CONTABASE_RETIRED_DIR, "P0A7A9")))
+        self.assertFalse(os.path.isdir(
+            os.path.join(self.contabase_dir, "P0A7A9")))
+
+        # Each update-task prepares a model of the update.
+        with mock.patch.object(contaminer, '_get_all_contaminants',
+                               return_value=self.contaminants), \
+                mock.patch.object(contaminer, '_prepare_model') as prepare:
+            contaminer.update_task(1)
+        self.assertEqual(prepare.call_args[0][0]['model_name'], "P61517")
+
+    def test_get_all_models(self):
+        """Only the prepared contaminants of the ContaBase are solved."""
+        self._update()
+        for file_name in [config.CONTABASE_INDEX_FILENAME,
+                          config.CONTABASE_UPDATE_FILENAME,
+                          config.CONTABASE_RETIRED_DIR, config.JOB_SCRIPT]:
+            self.assertIn(file_name, os.listdir(self.contabase_dir))
+        self.assertEqual(contaminer._get_all_models(), ["P0ACJ8", "P27302"])
+
+    def test_up_to_date(self):
+        """Nothing is submitted when all the models are prepared."""
+        for model in contaminer._get_models(self.contaminants):
+            model_dir = os.path.join(self.contabase_dir, model['model_name'])
+            shutil.rmtree(model_dir, ignore_errors=True)
+            self._prepare(model['model_name'], _get_model_source(model))
+        shutil.rmtree(os.path.join(self.contabase_dir, "P0A7A9"))
+
+        self.assertEqual(self._update(), "ContaBase is up to date.\n")
+        contaminer._submit_prepare_job.assert_not_called()
+
+    def test_no_contabase(self):
+        """The ContaBase must be initialized first."""
+        with mock.patch.object(config, 'CONTABASE_DIR',
+                               os.path.join(self.contabase_dir, "absent")):
+            with self.assertRaises(RuntimeError):
+                contaminer.update()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,264 @@
+"""Test contaminer.density."""
+
+from fractions import Fraction
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from contaminer.ccp4 import Mtz2Map
+from contaminer.density import FftMtz2Map
+from contaminer.density import _get_cell_volume
+from contaminer.density import _get_grid
+from contaminer.density import parse_symmetry_operator
+from contaminer.density import read_ccp4_map
+from contaminer.density import write_ccp4_map
+from contaminer.tests.test_mtz import write_mtz
+
+CELL = (30.0, 40.0, 50.0, 90.0, 95.0, 90.0)
+OPERATORS = ("X,Y,Z", "-X,Y+1/2,-Z")
+HEXAGONAL_CELL = (40.0, 40.0, 60.0, 90.0, 90.0, 120.0)
+HEXAGONAL_OPERATORS = ("X,Y,Z", "-Y,X-Y,Z+1/3", "-X+Y,-X,Z+2/3")
+ATOMS = [(0.1, 0.2, 0.3), (0.35, 0.05, 0.7)]
+MAX_INDEX = 4
+REFERENCE_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "data", "B4SL31_1_P-1-21-1")
+
+
+def _get_structure_factors(operators):
+    """
+    Return the structure factors of ATOMS with operators.
+
+    The reflections are all the hkl up to MAX_INDEX whose symmetry
+    equivalents are also up to MAX_INDEX.
+
+    """
+    positions = []
+    rotations = []
+    for rotation, translation in map(parse_symmetry_operator, operators):
+        rotations.append(rotation)
+        for atom in ATOMS:
+            positions.append(rotation @ atom + numpy.array(translation, float))
+
+    hkl = numpy.array([
+        index
+        for index in itertools.product(range(-MAX_INDEX, MAX_INDEX + 1),
+                                       repeat=3)
+        if index != (0, 0, 0)
+        and all(numpy.abs(numpy.array(index) @ rotation).max() <= MAX_INDEX
+                for rotation in rotations)
+    ])
+    phases = 2 * numpy.pi * (hkl @ numpy.array(positions).T)
+    return hkl, numpy.exp(1j * phases).sum(axis=1)
+
+
+def _get_unique(hkl, operators):
+    """Return a mask keeping one reflection per symmetry and Friedel orbit."""
+    rotations = [parse_symmetry_operator(operator)[0]
+                 for operator in operators]
+    kept = []
+    for index in hkl:
+        orbit = [tuple(sign * index @ rotation)
+                 for rotation in rotations for sign in (1, -1)]
+        kept.append(tuple(index) == max(orbit))
+    return numpy.array(kept)
+
+
+class ParseSymmetryOperatorTest(unittest.TestCase):
+    """Test parse_symmetry_operator."""
+
+    def test_screw_axis(self):
+        """Rotation and translation of a screw axis."""
+        rotation, translation = parse_symmetry_operator("-X,Y+1/2,-Z")
+        numpy.testing.assert_array_equal(
+            rotation, [[-1, 0, 0], [0, 1, 0], [0, 0, -1]])
+        self.assertEqual(translation, (0, Fraction(1, 2), 0))
+
+    def test_hexagonal(self):
+        """Mixed axes and negative translations are supported."""
+        rotation, translation = parse_symmetry_operator("-y, x-y, z-1/3")
+        numpy.testing.assert_array_equal(
+            rotation, [[0, -1, 0], [1, -1, 0], [0, 0, 1]])
+        self.assertEqual(translation, (0, 0, Fraction(2, 3)))
+
+    def test_invalid(self):
+        """Invalid operators raise a ValueError."""
+        with self.assertRaises(ValueError):
+            parse_symmetry_operator("X,Y")
+        with self.assertRaises(ValueError):
+            parse_symmetry_operator("X,Y,Z+A")
+
+
+class GetGridTest(unittest.TestCase):
+    """Test _get_grid."""
+
+    def test_grid(self):
+        """The grid samples the indices and matches the translations."""
+        operators = [parse_symmetry_operator(operator)
+                     for operator in ("X,Y,Z", "-Y,X-Y,Z+1/3")]
+        grid = _get_grid([10, 5, 7], operators)
+        self.assertEqual(grid[0], grid[1])
+        self.assertGreaterEqual(grid[0], 30)
+        self.assertEqual(grid[2] % 3, 0)
+        self.assertGreaterEqual(grid[2], 21)
+
+
+class FftMtz2MapTest(unittest.TestCase):
+    """Test FftMtz2Map."""
+
+    def setUp(self):
+        """Create a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.mtz_path = os.path.join(self.temp_dir, "final.mtz")
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def _write_mtz(self, cell, operators):
+        """Write a MTZ file with the reflections of the asymmetric unit."""
+        self.hkl, self.factors = _get_structure_factors(operators)
+        unique = _get_unique(self.hkl, operators)
+        data = numpy.column_stack([
+            self.hkl[unique],
+            numpy.abs(self.factors[unique]),
+            numpy.degrees(numpy.angle(self.factors[unique])),
+            numpy.abs(self.factors[unique]) / 2,
+            numpy.degrees(numpy.angle(self.factors[unique])),
+        ])
+        write_mtz(
+            self.mtz_path,
+            [('H', 'H'), ('K', 'H'), ('L', 'H'),
+             ('FWT', 'F'), ('PHWT', 'P'),
+             ('DELFWT', 'F'), ('PHDELWT', 'P')],
+            data,
+            cell=cell,
+            symmetry_operators=operators)
+
+    def _get_expected_density(self, shape, cell):
+        """Return the density by direct summation over all reflections."""
+        grid = numpy.stack(numpy.meshgrid(
+            *[numpy.arange(size) / size for size in shape],
+            indexing='ij'), axis=-1)
+        phases = numpy.exp(-2j * numpy.pi * (grid @ self.hkl.T))
+        return (phases @ self.factors).real / _get_cell_volume(cell)
+
+    def _check_maps(self, cell):
+        """Maps match the density computed from the expanded reflections."""
+        converter = FftMtz2Map(self.mtz_path)
+        converter.run()
+
+        map_file, diff_file = converter.get_output_files()
+        self.assertEqual(map_file, os.path.join(self.temp_dir, "final.map"))
+        self.assertEqual(diff_file,
+                         os.path.join(self.temp_dir, "final_diff.map"))
+
+        density, read_cell = read_ccp4_map(map_file)
+        numpy.testing.assert_allclose(read_cell, cell, rtol=1e-6)
+        expected = self._get_expected_density(density.shape, cell)
+        numpy.testing.assert_allclose(
+            density, expected, atol=1e-5 * numpy.abs(expected).max())
+
+        diff_density, _ = read_ccp4_map(diff_file)
+        numpy.testing.assert_allclose(
+            diff_density, expected / 2, atol=1e-5 * numpy.abs(expected).max())
+
+    def test_monoclinic(self):
+        """Maps are computed from the asymmetric unit in P 1 21 1."""
+        self._write_mtz(CELL, OPERATORS)
+        self._check_maps(CELL)
+
+    def test_hexagonal(self):
+        """Maps are computed from the asymmetric unit in P 31."""
+        self._write_mtz(HEXAGONAL_CELL, HEXAGONAL_OPERATORS)
+        self._check_maps(HEXAGONAL_CELL)
+
+    def test_missing_columns(self):
+        """A MTZ file without map coefficients raises a RuntimeError."""
+        write_mtz(self.mtz_path, [('H', 'H'), ('K', 'H'), ('L', 'H')],
+                  [[1, 0, 0]])
+        with self.assertRaises(RuntimeError):
+            FftMtz2Map(self.mtz_path).run()
+
+
+def _get_coefficients(density, max_indices):
+    """Return the Fourier coefficients of a map up to max_indices."""
+    coefficients = numpy.fft.fftn(density) / density.size
+    ranges = [numpy.arange(-index, index + 1) for index in max_indices]
+    return coefficients[numpy.ix_(*ranges)]
+
+
+@unittest.skipUnless(
+    os.path.isfile(os.path.join(REFERENCE_DIR, "final.mtz"))
+    and shutil.which("sftools"),
+    "needs sftools and final.mtz in %s" % REFERENCE_DIR)
+class SftoolsRegressionTest(unittest.TestCase):
+    """Compare the maps of FftMtz2Map and of sftools."""
+
+    def setUp(self):
+        """Copy the reference final.mtz in a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.mtz_paths = []
+        for engine in ["numpy", "sftools"]:
+            os.mkdir(os.path.join(self.temp_dir, engine))
+            mtz_path = os.path.join(self.temp_dir, engine, "final.mtz")
+            shutil.copy(os.path.join(REFERENCE_DIR, "final.mtz"), mtz_path)
+            self.mtz_paths.append(mtz_path)
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_same_maps(self):
+        """Both engines give the same maps of the reference final.mtz."""
+        numpy_converter = FftMtz2Map(self.mtz_paths[0])
+        numpy_converter.run()
+        sftools_converter = Mtz2Map(self.mtz_paths[1])
+        sftools_converter.run()
+
+        for numpy_file, sftools_file in zip(
+                numpy_converter.get_output_files(),
+                sftools_converter.get_output_files()):
+            numpy_map, numpy_cell = read_ccp4_map(numpy_file)
+            sftools_map, sftools_cell = read_ccp4_map(sftools_file)
+            numpy.testing.assert_allclose(numpy_cell, sftools_cell,
+                                          rtol=1e-4)
+            # The grids may differ: compare the coefficients sampled by both.
+            max_indices = [
+                (min(numpy_size, sftools_size) - 1) // 2
+                for numpy_size, sftools_size in zip(numpy_map.shape,
+                                                    sftools_map.shape)]
+            numpy_coefficients = _get_coefficients(numpy_map, max_indices)
+            sftools_coefficients = _get_coefficients(
+                sftools_map, max_indices)
+            correlation = abs(numpy.vdot(
+                numpy_coefficients, sftools_coefficients)) / (
+                    numpy.linalg.norm(numpy_coefficients)
+                    * numpy.linalg.norm(sftools_coefficients))
+            self.assertGreater(correlation, 0.99)
+            self.assertAlmostEqual(
+                numpy.linalg.norm(numpy_coefficients)
+                / numpy.linalg.norm(sftools_coefficients), 1, delta=0.01)
+
+
+class CCP4MapTest(unittest.TestCase):
+    """Test write_ccp4_map and read_ccp4_map."""
+
+    def test_write_and_read(self):
+        """A written map is read back unchanged."""
+        density = numpy.random.RandomState(0).normal(size=(4, 6, 10))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            map_path = os.path.join(temp_dir, "test.map")
+            write_ccp4_map(map_path, density, CELL, 4, OPERATORS, "test")
+            self.assertEqual(os.path.getsize(map_path),
+                             1024 + 80 * 2 + density.size * 4)
+            read_density, cell = read_ccp4_map(map_path)
+        numpy.testing.assert_allclose(read_density, density, rtol=1e-6)
+        numpy.testing.assert_allclose(cell, CELL, rtol=1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()
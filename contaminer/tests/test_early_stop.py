@@ -0,0 +1,123 @@
+"""Test contaminer.early_stop."""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from contaminer import early_stop
+from contaminer.early_stop import EarlyStop
+from contaminer.runner import get_default_runner
+
+
+class SleepTool():
+    """Tool running sleep, standing for morda_solve."""
+
+    def __init__(self, duration):
+        self.duration = duration
+
+    async def run_async(self, runner):
+        """Run sleep."""
+        if runner is None:
+            runner = get_default_runner()
+        await runner.run_async(["sleep", str(self.duration)])
+
+
+class EarlyStopTest(unittest.TestCase):
+    """Test EarlyStop."""
+
+    def setUp(self):
+        """Create a temporary prep directory."""
+        self.prep_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.prep_dir)
+
+    def test_unknown_scope(self):
+        """An unknown scope raises a ValueError."""
+        with self.assertRaises(ValueError):
+            EarlyStop(self.prep_dir, "task")
+
+    def test_off(self):
+        """Without scope, hits do not stop anything."""
+        stop = EarlyStop(self.prep_dir)
+        self.assertFalse(stop.record_hit("P0ACJ8", 3, 100.0))
+        self.assertFalse(stop.is_stopped("P0ACJ8"))
+
+    def test_contaminant_scope(self):
+        """A hit stops only the tasks of the same contaminant."""
+        stop = EarlyStop(self.prep_dir, "contaminant", 90)
+        self.assertFalse(stop.record_hit("P0ACJ8", 3, 89.0))
+        self.assertFalse(stop.is_stopped("P0ACJ8"))
+
+        self.assertTrue(stop.record_hit("P0ACJ8", 4, 95.0))
+        self.assertTrue(stop.is_stopped("P0ACJ8"))
+        self.assertFalse(stop.is_stopped("P0A9K9"))
+        # Only the first hit is recorded.
+        self.assertFalse(stop.record_hit("P0ACJ8", 5, 99.0))
+
+    def test_custom_model(self):
+        """Custom model names are valid marker file names."""
+        stop = EarlyStop(self.prep_dir, "contaminant", 90)
+        model_name = os.path.join("custom", "model")
+        self.assertTrue(stop.record_hit(model_name, 0, 95.0))
+        self.assertTrue(stop.is_stopped(model_name))
+        self.assertEqual(
+            os.listdir(os.path.join(self.prep_dir, "stop")),
+            ["contaminant_custom_model.json"])
+
+    def test_job_scope(self):
+        """A hit stops all the tasks, and runs the cancel command."""
+        stop = EarlyStop(
+            self.prep_dir, "job", 90,
+            "sh -c 'echo %PREP_NAME% > %PREP_DIR%/cancelled'")
+        self.assertTrue(stop.record_hit("P0ACJ8", 4, 95.0))
+        self.assertTrue(stop.is_stopped("P0A9K9"))
+
+        with open(os.path.join(self.prep_dir, "cancelled")) as cancelled:
+            self.assertEqual(cancelled.read().strip(),
+                             os.path.basename(self.prep_dir))
+
+    def test_delayed_cancel(self):
+        """The cancel command can be run after the marker is written."""
+        stop = EarlyStop(
+            self.prep_dir, "job", 90,
+            "sh -c 'echo %PREP_NAME% > %PREP_DIR%/cancelled'")
+        cancelled_path = os.path.join(self.prep_dir, "cancelled")
+        self.assertTrue(stop.record_hit("P0ACJ8", 4, 95.0, cancel=False))
+        self.assertTrue(stop.is_stopped("P0A9K9"))
+        self.assertFalse(os.path.exists(cancelled_path))
+
+        stop.cancel()
+        self.assertTrue(os.path.exists(cancelled_path))
+
+    @mock.patch.object(early_stop, 'POLL_INTERVAL', 0.05)
+    def test_stop_running_tool(self):
+        """A running tool is stopped when a marker appears."""
+        stop = EarlyStop(self.prep_dir, "contaminant", 90)
+        hit = EarlyStop(self.prep_dir, "contaminant", 90)
+
+        async def run_and_hit():
+            asyncio.get_running_loop().call_later(
+                0.2, hit.record_hit, "P0ACJ8", 1, 99.0)
+            return await stop.run_async(SleepTool(10), "P0ACJ8")
+
+        start = time.perf_counter()
+        self.assertFalse(asyncio.run(run_and_hit()))
+        self.assertLess(time.perf_counter() - start, 5)
+
+    @mock.patch.object(early_stop, 'POLL_INTERVAL', 0.05)
+    def test_run_to_end(self):
+        """A tool of another contaminant runs until its end."""
+        EarlyStop(self.prep_dir, "contaminant").record_hit(
+            "P0A9K9", 1, 99.0)
+        stop = EarlyStop(self.prep_dir, "contaminant")
+        self.assertTrue(stop.run(SleepTool(0.2), "P0ACJ8"))
+
+
+if __name__ == "__main__":
+    unittest.main()
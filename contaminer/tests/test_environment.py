@@ -0,0 +1,108 @@
+"""Test contaminer.environment."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from contaminer.environment import ToolEnvironment
+from contaminer.environment import _get_extension
+
+
+class ToolEnvironmentTest(unittest.TestCase):
+    """Test ToolEnvironment."""
+
+    def setUp(self):
+        """Write two setup scripts in a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.ccp4_script = os.path.join(self.temp_dir, "ccp4.setup-sh")
+        self.morda_script = os.path.join(self.temp_dir, "morda_env_sh")
+        with open(self.ccp4_script, 'w') as script:
+            script.write("export CM_TEST_CCP4=/opt/ccp4\n")
+            script.write("export PATH=/opt/ccp4/bin:$PATH\n")
+        with open(self.morda_script, 'w') as script:
+            script.write("echo 'Welcome to MoRDa'\n")
+            script.write("export CM_TEST_MORDA=$CM_TEST_CCP4/morda\n")
+        self.cache_path = os.path.join(self.temp_dir, "env_cache.json")
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def _get_environment(self):
+        return ToolEnvironment(
+            [self.ccp4_script, self.morda_script],
+            self.cache_path)
+
+    def test_source_scripts(self):
+        """Variables set by the scripts are in the environment."""
+        environ = self._get_environment().get_environ()
+        self.assertEqual(environ['CM_TEST_CCP4'], "/opt/ccp4")
+        self.assertEqual(environ['CM_TEST_MORDA'], "/opt/ccp4/morda")
+        self.assertEqual(environ['PATH'],
+                         "/opt/ccp4/bin:" + os.environ['PATH'])
+        self.assertTrue(os.path.isfile(self.cache_path))
+
+    def test_extended_variables(self):
+        """Variables extended by the scripts keep the current value."""
+        self._get_environment().load()
+
+        # Another shell, or another node, using the same cache.
+        with mock.patch.dict(os.environ, {'PATH': "/usr/local/bin:/bin"}):
+            environ = self._get_environment().get_environ()
+            self.assertEqual(environ['PATH'],
+                             "/opt/ccp4/bin:/usr/local/bin:/bin")
+        with open(self.cache_path, 'r') as cache_file:
+            self.assertNotIn('PATH', json.loads(cache_file.read())['set'])
+
+    def test_get_extension(self):
+        """Only whole entries at the start or end are an extension."""
+        self.assertEqual(_get_extension("/bin", "/opt/ccp4/bin:/bin"),
+                         ["/opt/ccp4/bin:", ""])
+        self.assertEqual(_get_extension("/bin:/usr/bin", "/bin:/usr/bin:/opt"),
+                         ["", ":/opt"])
+        # Fragments of other entries, or entries in the middle.
+        self.assertIsNone(_get_extension("/bin", "/opt/ccp4/bin:/usr/lib"))
+        self.assertIsNone(_get_extension("/bin", "/opt:/bin:/usr/lib"))
+        self.assertIsNone(_get_extension("/bin", "/bin"))
+
+    def test_use_cache(self):
+        """A valid cache is used instead of sourcing the scripts."""
+        self._get_environment().load()
+
+        # Tamper the cache to check it is used as is.
+        with open(self.cache_path, 'r') as cache_file:
+            cache = json.loads(cache_file.read())
+        cache['set']['CM_TEST_CCP4'] = "/from/cache"
+        with open(self.cache_path, 'w') as cache_file:
+            cache_file.write(json.dumps(cache))
+
+        environment = self._get_environment()
+        environ = environment.get_environ()
+        self.assertEqual(environ['CM_TEST_CCP4'], "/from/cache")
+        self.assertIsNotNone(environment.source_time)
+
+    def test_invalidate_cache(self):
+        """Modifying a setup script invalidates the cache."""
+        self._get_environment().load()
+
+        with open(self.ccp4_script, 'w') as script:
+            script.write("export CM_TEST_CCP4=/opt/ccp4-8\n")
+        stat = os.stat(self.ccp4_script)
+        os.utime(self.ccp4_script,
+                 ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        environ = self._get_environment().get_environ()
+        self.assertEqual(environ['CM_TEST_CCP4'], "/opt/ccp4-8")
+
+    def test_missing_script(self):
+        """A missing setup script raises a RuntimeError."""
+        os.remove(self.morda_script)
+        with self.assertRaises(RuntimeError):
+            self._get_environment().load()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+"""Test contaminer.fetcher, against a local HTTP server."""
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import os
+import tempfile
+import threading
+import unittest
+
+from contaminer.fetcher import Fetcher
+
+FILES = {
+    "/uniprot/P0ACJ8.fasta": b">sp|P0ACJ8|CRP_ECOLI\nMVLGKPQTDPTLEWFLSHCH\n",
+    "/uniprot/P61517.fasta": b">sp|P61517|CAN_ECOLI\nMKDIDTLISNNALWSKMLVE\n",
+    "/files/AF-P0ACJ8-F1-model_v2.pdb": b"ATOM      1  N   MET A   1\n",
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serve FILES, and fail as configured by the server."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        """Answer a GET request."""
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.clients.add(self.client_address)
+            nb_failures = server.failures.get(self.path, 0)
+            if nb_failures:
+                server.failures[self.path] = nb_failures - 1
+
+        if self.path == "/redirect":
+            self._answer(302, b"", {'Location': "/uniprot/P0ACJ8.fasta"})
+        elif nb_failures:
+            self._answer(503, b"Unavailable")
+        elif self.path in FILES:
+            self._answer(200, FILES[self.path])
+        else:
+            self._answer(404, b"Not found")
+
+    def _answer(self, status, content, headers=None):
+        """Send a response, keeping the connection open."""
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        """Do not log the requests on stderr."""
+
+
+class FetcherTest(unittest.TestCase):
+    """Test Fetcher."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.clients = set()
+        self.server.failures = {}
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.base_url = "http://127.0.0.1:%s" % self.server.server_port
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.mirror_dir = os.path.join(self.temp_dir.name, "mirror")
+        self.dest_dir = os.path.join(self.temp_dir.name, "dest")
+        os.mkdir(self.dest_dir)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def _get_downloads(self, paths):
+        """Return the downloads of paths of the server."""
+        return [(self.base_url + path,
+                 os.path.join(self.dest_dir, os.path.basename(path)))
+                for path in paths]
+
+    def _read(self, file_name):
+        with open(os.path.join(self.dest_dir, file_name), 'rb') as read_file:
+            return read_file.read()
+
+    def test_fetch_all(self):
+        """Files are downloaded once, then copied from the mirror."""
+        downloads = self._get_downloads(FILES)
+        fetcher = Fetcher(self.mirror_dir, max_workers=1, retries=0)
+        fetcher.fetch_all(downloads)
+        for path, content in FILES.items():
+            self.assertEqual(self._read(os.path.basename(path)), content)
+        self.assertEqual(len(self.server.requests), 3)
+        # A single connection is kept alive for all the downloads.
+        self.assertEqual(len(self.server.clients), 1)
+
+        # A second init does not use the network.
+        for _, destination in downloads:
+            os.remove(destination)
+        Fetcher(self.mirror_dir, max_workers=4, retries=0).fetch_all(
+            downloads)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self._read("P61517.fasta"),
+                         FILES["/uniprot/P61517.fasta"])
+
+    def test_corrupted_mirror(self):
+        """A mirror file with a wrong checksum is downloaded again."""
+        downloads = self._get_downloads(["/uniprot/P0ACJ8.fasta"])
+        fetcher = Fetcher(self.mirror_dir, retries=0)
+        fetcher.fetch_all(downloads)
+        mirror_path = fetcher.get_mirror_path(downloads[0][0])
+        with open(mirror_path, 'wb') as mirror_file:
+            mirror_file.write(b"corrupted")
+
+        fetcher.fetch_all(downloads)
+        self.assertEqual(len(self.server.requests), 2)
+        with open(mirror_path, 'rb') as mirror_file:
+            self.assertEqual(mirror_file.read(),
+                             FILES["/uniprot/P0ACJ8.fasta"])
+
+    def test_retries(self):
+        """Server errors are retried, other errors are not."""
+        self.server.failures["/uniprot/P0ACJ8.fasta"] = 2
+        downloads = self._get_downloads(
+            ["/uniprot/P0ACJ8.fasta", "/uniprot/UNKNOWN.fasta"])
+        fetcher = Fetcher("", retries=2, backoff=0)
+        with self.assertRaises(RuntimeError) as context:
+            fetcher.fetch_all(downloads)
+        self.assertIn("UNKNOWN.fasta: HTTP 404", str(context.exception))
+
+        # The other download succeeded after 2 failures.
+        self.assertEqual(self._read("P0ACJ8.fasta"),
+                         FILES["/uniprot/P0ACJ8.fasta"])
+        self.assertEqual(self.server.requests.count("/uniprot/P0ACJ8.fasta"),
+                         3)
+        self.assertEqual(
+            self.server.requests.count("/uniprot/UNKNOWN.fasta"), 1)
+
+        self.server.failures["/uniprot/P61517.fasta"] = 2
+        with self.assertRaises(RuntimeError):
+            Fetcher("", retries=1, backoff=0).fetch_all(
+                self._get_downloads(["/uniprot/P61517.fasta"]))
+
+    def test_redirect(self):
+        """Redirections are followed."""
+        destination = os.path.join(self.dest_dir, "redirected.fasta")
+        Fetcher("", retries=0).fetch(self.base_url + "/redirect",
+                                       destination)
+        self.assertEqual(self._read("redirected.fasta"),
+                         FILES["/uniprot/P0ACJ8.fasta"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""Test contaminer.hit_rates."""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import tempfile
+import unittest
+
+from contaminer.hit_rates import HitRates
+from contaminer.hit_rates import get_static_prior
+from contaminer.hit_rates import record_job
+from contaminer.hit_rates import sort_jobs
+
+CONTAMINANTS = [
+    {'uniprot_id': 'P0A9K9', 'exact_model': False, 'reference': None},
+    {'uniprot_id': 'P0ACJ8', 'exact_model': True,
+     'reference': [{'pubmed_id': '26660914'}, {'pubmed_id': '16814929'}]},
+    {'uniprot_id': 'P61517', 'exact_model': True,
+     'reference': {'pubmed_id': '26660914'}},
+]
+
+
+def _make_job(model_name, pack_number, percent=None, custom=False):
+    """Return a job, complete if percent is given."""
+    return {
+        'infos': {
+            'model_name': model_name,
+            'is_AF_model': False,
+            'is_custom_model': custom
+        },
+        'args': {'pack_number': pack_number},
+        'results': {'percent': percent} if percent is not None else None,
+        'status': 'complete' if percent is not None else 'skipped'
+    }
+
+
+def _record(save_filepath, index):
+    """Record a job with a hit for P0ACJ8, in a separate process."""
+    return record_job(save_filepath, "job_%s" % index,
+                      [_make_job('P0ACJ8', 1, 98.0)], 90)
+
+
+class HitRatesTest(unittest.TestCase):
+    """Test HitRates and sort_jobs."""
+
+    def test_static_prior(self):
+        """Publications and exact models increase the prior."""
+        priors = [get_static_prior(contaminant)
+                  for contaminant in CONTAMINANTS]
+        self.assertLess(priors[0], priors[2])
+        self.assertLess(priors[2], priors[1])
+        self.assertLess(priors[1], 1)
+
+    def test_record(self):
+        """A complete job is counted once per contaminant, and only once."""
+        hit_rates = HitRates()
+        jobs = [
+            _make_job('P0ACJ8', 1, 12.0),
+            _make_job('P0ACJ8', 2, 98.0),
+            _make_job('P61517', 1, 5.0),
+            _make_job('P0A9K9', 1),
+            _make_job('custom', 1, 99.0, custom=True),
+        ]
+        self.assertTrue(hit_rates.record("job_1", jobs, 90))
+        self.assertFalse(hit_rates.record("job_1", jobs, 90))
+
+        self.assertEqual(hit_rates.counts, {
+            'P0ACJ8': {'hits': 1, 'trials': 1},
+            'P61517': {'hits': 0, 'trials': 1},
+        })
+
+    def test_save_and_load(self):
+        """Saving and loading give the same table."""
+        hit_rates = HitRates()
+        hit_rates.record("job_1", [_make_job('P0ACJ8', 1, 98.0)], 90)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            save_filepath = os.path.join(temp_dir, "hit_rates.json")
+            hit_rates.save(save_filepath)
+            loaded = HitRates()
+            loaded.load(save_filepath)
+        self.assertEqual(loaded.counts, hit_rates.counts)
+        self.assertEqual(loaded.prep_dirs, hit_rates.prep_dirs)
+
+    def test_concurrent_record(self):
+        """Jobs ending at the same time are all recorded, once."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            save_filepath = os.path.join(temp_dir, "hit_rates.json")
+            with ProcessPoolExecutor(4) as executor:
+                recorded = list(executor.map(
+                    _record, [save_filepath] * 20, range(20)))
+            self.assertTrue(all(recorded))
+            self.assertFalse(_record(save_filepath, 0))
+
+            hit_rates = HitRates()
+            hit_rates.load(save_filepath)
+        self.assertEqual(hit_rates.counts,
+                         {'P0ACJ8': {'hits': 20, 'trials': 20}})
+        self.assertEqual(len(hit_rates.prep_dirs), 20)
+
+    def test_sort_jobs(self):
+        """Custom models first, then the most probable contaminants."""
+        jobs = [
+            _make_job('P0A9K9', 1),
+            _make_job('P0A9K9', 2),
+            _make_job('P0ACJ8', 1),
+            _make_job('P61517', 1),
+            _make_job('custom', 1, custom=True),
+        ]
+        hit_rates = HitRates()
+
+        # Without history, the static priors decide.
+        ordered = sort_jobs(jobs, CONTAMINANTS, hit_rates)
+        self.assertEqual(
+            [(job['infos']['model_name'], job['args']['pack_number'])
+             for job in ordered],
+            [('custom', 1), ('P0ACJ8', 1), ('P61517', 1),
+             ('P0A9K9', 1), ('P0A9K9', 2)])
+
+        # P0A9K9 has been found in most previous jobs.
+        for index in range(5):
+            hit_rates.record("job_%s" % index, [
+                _make_job('P0A9K9', 1, 95.0),
+                _make_job('P0ACJ8', 1, 3.0),
+            ], 90)
+        ordered = sort_jobs(jobs, CONTAMINANTS, hit_rates)
+        self.assertEqual(
+            [job['infos']['model_name'] for job in ordered],
+            ['custom', 'P0A9K9', 'P0A9K9', 'P61517', 'P0ACJ8'])
+
+
+if __name__ == "__main__":
+    unittest.main()
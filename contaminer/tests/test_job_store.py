@@ -0,0 +1,165 @@
+"""Test contaminer.job_store."""
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from contaminer import args_manager
+from contaminer import config
+from contaminer import job_store
+from contaminer.summary import summarize_jobs
+
+
+def _make_job(model_name, status="new", percent=None, q_factor=0.5):
+    """Return a job, with results if percent is given."""
+    return {
+        'infos': {
+            'model_name': model_name,
+            'is_AF_model': False,
+            'is_custom_model': False
+        },
+        'args': {
+            'input_file': 'input.mtz',
+            'model_dir': model_name + '/models',
+            'pack_number': 1,
+            'space_group': 'P 1'
+        },
+        'results': None if percent is None else {
+            'percent': percent,
+            'q_factor': q_factor
+        },
+        'status': status
+    }
+
+
+def _update(store_path, rank):
+    """Mark a job complete from another process."""
+    with job_store.JobStore(store_path) as store:
+        store.update_job(rank, "complete",
+                         {'percent': float(rank), 'q_factor': 0.1})
+
+
+class JobStoreTest(unittest.TestCase):
+    """Test JobStore."""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.store_path = os.path.join(self.work_dir, "tasks.sqlite")
+        self.jobs = [
+            _make_job("A", "complete", 10.0),
+            _make_job("A", "complete", 95.0, 0.3),
+            _make_job("A", "complete", 95.0, 0.7),
+            _make_job("B", "skipped"),
+            _make_job("B", "complete", 0.0),
+            _make_job("C", "running"),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_save_and_load(self):
+        """A TasksManager saved in a store loads the same jobs."""
+        saver = args_manager.TasksManager()
+        saver.jobs = self.jobs
+        saver.save(self.store_path)
+        loader = args_manager.TasksManager()
+        loader.load(self.store_path)
+        self.assertEqual(loader.jobs, self.jobs)
+
+        self.assertEqual(
+            args_manager.TasksManager.load_job(self.store_path, 3),
+            self.jobs[3])
+        self.assertEqual(
+            list(args_manager.TasksManager.iter_jobs(self.store_path)),
+            list(enumerate(self.jobs)))
+
+        # Saving fewer jobs removes the extra rows.
+        saver.jobs = self.jobs[:2]
+        saver.save(self.store_path)
+        loader.load(self.store_path)
+        self.assertEqual(loader.jobs, self.jobs[:2])
+
+    def test_queries(self):
+        """Status counts and summary are computed in SQL."""
+        failed = _make_job("D", "failed")
+        failed['results'] = {'exit_status': 3, 'error': "morda_solve failed"}
+        self.jobs.append(failed)
+        with job_store.JobStore(self.store_path) as store:
+            store.write_jobs(self.jobs)
+            self.assertEqual(
+                store.count_by_status(),
+                {'complete': 4, 'skipped': 1, 'running': 1, 'failed': 1})
+            self.assertEqual(store.read_jobs_with_status("failed"),
+                             [(6, failed)])
+
+            summary = store.get_summary()
+            self.assertEqual(
+                [task['status'] for task in summary],
+                ['complete', 'skipped', 'running', 'failed'])
+            self.assertEqual(summary[0]['results'],
+                             {'percent': 95.0, 'q_factor': 0.7})
+            self.assertEqual(summary[1]['results']['percent'], 0.0)
+            self.assertIsNone(summary[2]['args_for_best'])
+            self.assertEqual(summary, summarize_jobs(self.jobs))
+            self.assertEqual(json.loads(store.export_json()),
+                             {'jobs': self.jobs})
+
+    def test_concurrent_updates(self):
+        """Tasks update their own rows from several processes."""
+        jobs = [_make_job("A") for _ in range(40)]
+        with job_store.JobStore(self.store_path) as store:
+            store.write_jobs(jobs)
+        with ProcessPoolExecutor(4) as executor:
+            list(executor.map(_update, [self.store_path] * 40, range(40)))
+
+        with job_store.JobStore(self.store_path) as store:
+            self.assertEqual(store.count_by_status(), {'complete': 40})
+            self.assertEqual(store.read_job(7)['results']['percent'], 7.0)
+
+    def test_save_changed(self):
+        """Only the changed rows are written, and complete rows are kept."""
+        jobs = self.jobs + [_make_job("D")]
+        with job_store.JobStore(self.store_path) as store:
+            store.write_jobs(jobs)
+        manager = args_manager.TasksManager()
+        manager.load(self.store_path)
+        # The task of rank 5 ends after the jobs are loaded.
+        _update(self.store_path, 5)
+
+        manager.jobs[3]['status'] = "new"
+        manager.jobs[5]['status'] = "skipped"
+        manager.jobs[6]['status'] = "skipped"
+        manager.changed_ranks.update([5, 6])
+        manager.save_changed(self.store_path)
+        self.assertEqual(manager.changed_ranks, set())
+
+        with job_store.JobStore(self.store_path) as store:
+            self.assertEqual(store.read_job(3)['status'], "skipped")
+            self.assertEqual(store.read_job(5)['status'], "complete")
+            self.assertEqual(store.read_job(5)['results']['percent'], 5.0)
+            self.assertEqual(store.read_job(6)['status'], "skipped")
+
+    def test_migrate(self):
+        """Migrated prep directories use the store instead of tasks.json."""
+        json_path = os.path.join(self.work_dir, config.ARGS_FILENAME)
+        manager = args_manager.TasksManager()
+        manager.jobs = self.jobs
+        manager.save(json_path)
+        self.assertEqual(args_manager.get_tasks_path(self.work_dir),
+                         json_path)
+
+        self.assertEqual(job_store.migrate_prep_dir(self.work_dir),
+                         self.store_path)
+        self.assertEqual(args_manager.get_tasks_path(self.work_dir),
+                         self.store_path)
+        manager.load(self.store_path)
+        self.assertEqual(manager.jobs, self.jobs)
+        with self.assertRaises(RuntimeError):
+            job_store.migrate_prep_dir(self.work_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
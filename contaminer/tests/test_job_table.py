@@ -0,0 +1,117 @@
+"""Test contaminer.job_table."""
+
+import json
+import os
+import tempfile
+import unittest
+
+from contaminer import args_manager
+from contaminer import job_table
+
+
+def _make_jobs():
+    """Return a few jobs, with results for the first one."""
+    jobs = []
+    for model_name, is_af_model in [("P0ACJ8", False), ("P0ACJ8", True),
+                                    ("P0A9K9", False)]:
+        for space_group in ["P 1 21 1", "P 1"]:
+            jobs.append({
+                'infos': {
+                    'model_name': model_name,
+                    'is_AF_model': is_af_model,
+                    'is_custom_model': False
+                },
+                'args': {
+                    'input_file': 'input.mtz',
+                    'model_dir': '/contabase/%s/models' % model_name,
+                    'pack_number': 1,
+                    'space_group': space_group
+                },
+                'results': None,
+                'status': 'new'
+            })
+    jobs[0]['results'] = {'percent': 99.0, 'q_factor': 0.8}
+    jobs[0]['status'] = 'complete'
+    return jobs
+
+
+class JobTableTest(unittest.TestCase):
+    """Test JobTable and JobView."""
+
+    def test_round_trip(self):
+        """Jobs are the same after a trip in the table, or in JSON."""
+        jobs = _make_jobs()
+        table = job_table.JobTable.from_jobs(jobs)
+        self.assertEqual(len(table), 6)
+        self.assertEqual(table.to_jobs(), jobs)
+        self.assertEqual(table, jobs)
+
+        text = json.dumps({'jobs': jobs})
+        self.assertEqual(table.dumps(), text)
+        self.assertEqual(job_table.JobTable.loads(text).to_jobs(), jobs)
+
+        # Strings are interned once.
+        self.assertEqual(len(table.pool), 7)
+
+    def test_view(self):
+        """Views are read and updated like the job dicts."""
+        table = job_table.JobTable.from_jobs(_make_jobs())
+        job = table[-1]
+        self.assertEqual(job['args']['space_group'], "P 1")
+        self.assertEqual(job['infos']['model_name'], "P0A9K9")
+        self.assertIsNone(job['results'])
+
+        job['status'], job['results'] = "complete", {'percent': 0.0}
+        self.assertEqual(table[5]['status'], "complete")
+        self.assertEqual(table.get_job(5)['results'], {'percent': 0.0})
+        with self.assertRaises(KeyError):
+            job['unknown'] = 1
+        with self.assertRaises(IndexError):
+            table[6]
+
+        # Views have no __dict__.
+        with self.assertRaises(AttributeError):
+            job.other = 1
+
+        # Arguments are a fresh dict.
+        table.get_arguments(0)['space_group'] = "P 1"
+        self.assertEqual(table[0]['args']['space_group'], "P 1 21 1")
+
+    def test_irregular_jobs(self):
+        """Jobs with other keys are kept as they are."""
+        jobs = _make_jobs()
+        jobs[1]['args']['extra'] = True
+        jobs[2]['args']['pack_number'] = "2"
+        table = job_table.JobTable.from_jobs(jobs)
+        self.assertEqual(table.to_jobs(), jobs)
+
+        table[3]['args'] = {'input_file': 'other.mtz'}
+        self.assertEqual(table[3]['args'], {'input_file': 'other.mtz'})
+        self.assertEqual(table[3]['status'], "new")
+
+    def test_tasks_manager(self):
+        """A compact TasksManager saves the same tasks file."""
+        with tempfile.TemporaryDirectory() as work_dir:
+            tasks_path = os.path.join(work_dir, "tasks.json")
+            manager = args_manager.TasksManager()
+            manager.jobs = _make_jobs()
+            manager.save(tasks_path)
+            with open(tasks_path, 'r') as tasks_file:
+                expected = tasks_file.read()
+
+            compact = args_manager.TasksManager()
+            compact.load(tasks_path, compact=True)
+            self.assertIsInstance(compact.jobs, job_table.JobTable)
+            self.assertEqual(compact.get_arguments(2),
+                             manager.get_arguments(2))
+            self.assertEqual(
+                args_manager.TasksManager.load_job(tasks_path, 0),
+                manager.jobs[0])
+
+            compact.save(tasks_path)
+            with open(tasks_path, 'r') as tasks_file:
+                self.assertEqual(tasks_file.read(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+"""Test contaminer.local_executor."""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from contaminer import args_manager
+from contaminer import local_executor
+
+
+def _fake_run(self, prep_dir, rank):
+    """Replace TasksManager.run by writing a file, and fail for rank 3."""
+    if rank == 3:
+        raise RuntimeError("morda_solve failed.")
+    with open(os.path.join(prep_dir, "rank_%s" % rank), 'w') as rank_file:
+        rank_file.write(os.environ.get("OMP_NUM_THREADS", ""))
+
+
+def _fake_compile_job(args):
+    """Replace _compile_job by reading the file of _fake_run."""
+    if os.path.exists("rank_%s" % args['rank']):
+        return "complete", {'percent': 0.0}
+    return "running", None
+
+
+class LocalExecutorTest(unittest.TestCase):
+    """Test LocalExecutor."""
+
+    def setUp(self):
+        self.initial_dir = os.getcwd()
+        self.prep_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        os.chdir(self.initial_dir)
+        for file_name in os.listdir(self.prep_dir):
+            os.remove(os.path.join(self.prep_dir, file_name))
+        os.rmdir(self.prep_dir)
+
+    def _write_tasks(self, statuses):
+        jobs = [
+            {
+                'args': {'rank': rank},
+                'infos': {'model_name': "M%s" % rank},
+                'status': status,
+                'results': None,
+            }
+            for rank, status in enumerate(statuses)
+        ]
+        with open(os.path.join(self.prep_dir, "tasks.json"), 'w') as tasks:
+            tasks.write(json.dumps({'jobs': jobs}))
+
+    def _read_statuses(self):
+        with open(os.path.join(self.prep_dir, "tasks.json"), 'r') as tasks:
+            return [job['status'] for job in json.loads(tasks.read())['jobs']]
+
+    @mock.patch.object(local_executor, 'get_available_memory')
+    @mock.patch.object(local_executor, 'available_cpus')
+    def test_get_width(self, available_cpus, get_available_memory):
+        """The width is limited by the CPUs, the memory and the tasks."""
+        available_cpus.return_value = 8
+        get_available_memory.return_value = 3 * 1024**3
+        with mock.patch.object(local_executor.config,
+                               'MEMORY_PER_TASK_MB', 512):
+            executor = local_executor.LocalExecutor(self.prep_dir,
+                                                    threads_per_task=2)
+            self.assertEqual(executor.get_width(100), 4)
+            self.assertEqual(executor.get_width(3), 3)
+
+        with mock.patch.object(local_executor.config,
+                               'MEMORY_PER_TASK_MB', 1024):
+            self.assertEqual(executor.get_width(100), 3)
+
+        get_available_memory.return_value = 0
+        self.assertEqual(executor.get_width(100), 1)
+
+        executor = local_executor.LocalExecutor(self.prep_dir, 16)
+        self.assertEqual(executor.get_width(100), 16)
+
+    def test_cpu_sets(self):
+        """Each worker gets its own CPUs, unless there are not enough."""
+        executor = local_executor.LocalExecutor(self.prep_dir,
+                                                threads_per_task=1)
+        nb_cpus = len(os.sched_getaffinity(0))
+        cpu_sets = executor._get_cpu_sets(nb_cpus)
+        self.assertEqual(len(cpu_sets), nb_cpus)
+        self.assertEqual(set.union(*cpu_sets), os.sched_getaffinity(0))
+        self.assertEqual(executor._get_cpu_sets(nb_cpus + 1),
+                         [None] * (nb_cpus + 1))
+
+    @mock.patch.object(args_manager.TasksManager, 'run', _fake_run)
+    @mock.patch.object(args_manager, '_compile_job', _fake_compile_job)
+    @mock.patch.object(local_executor, 'get_tool_environment')
+    @mock.patch.object(local_executor.config, 'ARGS_FILENAME', "tasks.json")
+    def test_run(self, _):
+        """Tasks run once, and the status is updated as they end."""
+        self._write_tasks(["new", "complete", "new", "new", "running"])
+        executor = local_executor.LocalExecutor(self.prep_dir, 2,
+                                                threads_per_task=1)
+        with self.assertRaises(RuntimeError):
+            executor.run()
+
+        self.assertEqual(
+            sorted(os.listdir(self.prep_dir)),
+            ["rank_0", "rank_2", "rank_4", "tasks.json"])
+        self.assertEqual(
+            self._read_statuses(),
+            ["complete", "complete", "complete", "running", "complete"])
+        with open(os.path.join(self.prep_dir, "rank_0"), 'r') as rank_file:
+            self.assertEqual(rank_file.read(), "1")
+
+    @mock.patch.object(args_manager.TasksManager, 'run', _fake_run)
+    @mock.patch.object(args_manager, '_compile_job', _fake_compile_job)
+    @mock.patch.object(local_executor, 'get_tool_environment')
+    @mock.patch.object(local_executor, 'SAVE_INTERVAL', 3600)
+    @mock.patch.object(local_executor.config, 'ARGS_FILENAME', "tasks.json")
+    def test_throttled_save(self, _):
+        """tasks.json is not rewritten after each task."""
+        self._write_tasks(["new", "new", "new"])
+        executor = local_executor.LocalExecutor(self.prep_dir, 2,
+                                                threads_per_task=1)
+        saves = []
+        save = args_manager.TasksManager.save
+
+        def counting_save(manager, save_filepath):
+            saves.append(save_filepath)
+            save(manager, save_filepath)
+
+        with mock.patch.object(args_manager.TasksManager, 'save',
+                               counting_save):
+            executor.run()
+        self.assertEqual(len(saves), 1)
+        self.assertEqual(self._read_statuses(), ["complete"] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+"""Test contaminer.maps."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from contaminer import maps
+
+
+class FakeMtz2Map():
+    """Replace Mtz2Map by writing empty map files."""
+
+    nb_runs = 0
+
+    def __init__(self, input_file):
+        self.input_file = input_file
+        filename = os.path.splitext(input_file)[0]
+        self.output_files = (filename + '.map', filename + '_diff.map')
+
+    async def run_async(self, runner=None):
+        """Write the map files."""
+        FakeMtz2Map.nb_runs += 1
+        for output_file in self.output_files:
+            with open(output_file, 'w') as map_file:
+                map_file.write("map")
+
+    def get_output_files(self):
+        """Return the map files."""
+        return self.output_files
+
+
+@mock.patch.object(maps, 'Mtz2Map', FakeMtz2Map)
+@mock.patch.object(maps.config, 'MAP_ENGINE', "sftools")
+class MakeMapsTest(unittest.TestCase):
+    """Test make_maps and make_job_maps."""
+
+    def setUp(self):
+        """Write a final.mtz file in a temporary directory."""
+        FakeMtz2Map.nb_runs = 0
+        self.temp_dir = tempfile.mkdtemp()
+        self.mtz_path = os.path.join(self.temp_dir, "final.mtz")
+        with open(self.mtz_path, 'wb') as mtz_file:
+            mtz_file.write(b"MTZ content")
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_cached_maps(self):
+        """Maps are generated once for an unchanged final.mtz."""
+        first = maps.make_maps(self.mtz_path)
+        second = maps.make_maps(self.mtz_path)
+        self.assertEqual(first, second)
+        self.assertEqual(FakeMtz2Map.nb_runs, 1)
+
+    def test_changed_mtz(self):
+        """Maps are generated again if final.mtz changes."""
+        maps.make_maps(self.mtz_path)
+        with open(self.mtz_path, 'wb') as mtz_file:
+            mtz_file.write(b"New MTZ content")
+        maps.make_maps(self.mtz_path)
+        self.assertEqual(FakeMtz2Map.nb_runs, 2)
+
+    def test_removed_map(self):
+        """Maps are generated again if a map file is missing."""
+        map_file, _ = maps.make_maps(self.mtz_path)
+        os.remove(map_file)
+        maps.make_maps(self.mtz_path)
+        self.assertEqual(FakeMtz2Map.nb_runs, 2)
+
+    def test_make_job_maps(self):
+        """Only complete jobs above the threshold get maps."""
+        jobs = [
+            {
+                'status': 'complete',
+                'results': {
+                    'percent': percent,
+                    'available_final': True,
+                    'final_dir': self.temp_dir
+                }
+            }
+            for percent in [99.0, 12.0]
+        ]
+        jobs.append({'status': 'running', 'results': None})
+
+        job_maps = maps.make_job_maps(jobs, min_percent=90)
+        self.assertEqual(len(job_maps), 1)
+        self.assertIs(job_maps[0][0], jobs[0])
+        self.assertTrue(os.path.isfile(job_maps[0][1][0]))
+
+
+class MapEngineTest(unittest.TestCase):
+    """Test the choice of the map engine."""
+
+    def test_numpy_engine(self):
+        """The numpy engine computes the maps in-process."""
+        with mock.patch.object(maps.config, 'MAP_ENGINE', "numpy"):
+            converter = maps._get_map_converter("final.mtz")
+        self.assertIsInstance(converter, maps.FftMtz2Map)
+        self.assertEqual(converter.get_output_files(),
+                         ("final.map", "final_diff.map"))
+
+    def test_unknown_engine(self):
+        """An unknown engine raises a RuntimeError."""
+        with mock.patch.object(maps.config, 'MAP_ENGINE', "coot"):
+            with self.assertRaises(RuntimeError):
+                maps._get_map_converter("final.mtz")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Test contaminer.mmcif."""
+
+import os
+import tempfile
+import unittest
+
+from contaminer.mmcif import read_symmetry
+
+SF_CIF = """data_r5jk4sf
+#
+_cell.entry_id      5jk4
+_cell.length_a      34.520(3)
+_cell.length_b      45.100
+_cell.length_c      56.700
+_cell.angle_alpha   90.000
+_cell.angle_beta    101.20
+_cell.angle_gamma   90.000
+#
+_symmetry.entry_id               5jk4
+_symmetry.space_group_name_H-M
+'P 1 21 1'
+_symmetry.Int_Tables_number      4
+#
+loop_
+_refln.crystal_id
+_refln.wavelength_id
+_refln.scale_group_code
+_refln.index_h
+_refln.index_k
+_refln.index_l
+_refln.F_meas_au
+1 1 1 -12 0 1 120.5
+1 1 1 -12 0 2 98.1
+#
+data_r5jk4Asf
+_symmetry.space_group_name_H-M   'P 21 21 21'
+"""
+
+
+class ReadSymmetryTest(unittest.TestCase):
+    """Test read_symmetry."""
+
+    def setUp(self):
+        """Create a temporary CIF file."""
+        handle, self.cif_path = tempfile.mkstemp(suffix=".cif")
+        os.close(handle)
+
+    def tearDown(self):
+        """Remove the temporary file."""
+        os.remove(self.cif_path)
+
+    def _write(self, content):
+        with open(self.cif_path, 'w') as cif_file:
+            cif_file.write(content)
+
+    def test_structure_factors(self):
+        """Space group and cell are read from the first data block."""
+        self._write(SF_CIF)
+        symmetry = read_symmetry(self.cif_path)
+        self.assertEqual(symmetry.space_group, "P 1 21 1")
+        self.assertEqual(symmetry.cell,
+                         (34.52, 45.1, 56.7, 90.0, 101.2, 90.0))
+
+    def test_space_group_category(self):
+        """The _space_group category and text fields are supported."""
+        self._write("\n".join([
+            "data_test",
+            "_cell.length_a 10",
+            "_cell.length_b 20",
+            "_cell.length_c 30",
+            "_cell.angle_alpha 90",
+            "_cell.angle_beta 90",
+            "_cell.angle_gamma 90",
+            "_space_group.IT_number 19",
+            "_space_group.name_H-M_alt",
+            ";",
+            "P 21  21 21",
+            ";",
+        ]))
+        symmetry = read_symmetry(self.cif_path)
+        self.assertEqual(symmetry.space_group, "P 21 21 21")
+        self.assertEqual(symmetry.space_group_number, 19)
+
+    def test_missing_symmetry(self):
+        """Missing values are None."""
+        self._write("data_test\n_symmetry.space_group_name_H-M ?\n")
+        symmetry = read_symmetry(self.cif_path)
+        self.assertIsNone(symmetry.space_group)
+        self.assertIsNone(symmetry.cell)
+
+
+if __name__ == "__main__":
+    unittest.main()
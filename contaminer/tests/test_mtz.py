@@ -0,0 +1,146 @@
+"""Test contaminer.mtz."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from contaminer.mtz import MtzFile
+
+
+def write_mtz(file_path, columns, data, cell=(30.0, 40.0, 50.0, 90, 95, 90),
+              space_group="P 1 21 1", space_group_number=4,
+              symmetry_operators=("X,Y,Z", "-X,Y+1/2,-Z"),
+              byte_order='<'):
+    """
+    Write a minimal MTZ file.
+
+    Parameters
+    ----------
+    columns: list(tuple)
+        (label, type) for each column.
+
+    data: numpy.ndarray
+        Reflections, of shape (nb_reflections, nb_columns).
+
+    """
+    data = numpy.asarray(data, dtype=byte_order + 'f4')
+    nb_reflections, nb_columns = data.shape
+    header_word = 21 + data.size + 1
+
+    hkl = data[:, :3]
+    inv_d2 = _inv_d2(hkl, cell) if nb_reflections else numpy.zeros(1)
+
+    records = [
+        "VERS MTZ:V1.1",
+        "TITLE Test file",
+        "NCOL %8d %12d %8d" % (nb_columns, nb_reflections, 0),
+        "CELL %10.4f%10.4f%10.4f%10.4f%10.4f%10.4f" % tuple(cell),
+        "SORT    1   2   3   0   0",
+        "SYMINF %3d %2d P %5d %22s PG2" % (
+            len(symmetry_operators), len(symmetry_operators),
+            space_group_number, "'%s'" % space_group),
+    ]
+    records.extend(["SYMM %s" % symop for symop in symmetry_operators])
+    records.append("RESO %-20f%-20f" % (inv_d2.min(), inv_d2.max()))
+    records.append("VALM NAN")
+    for index, (label, col_type) in enumerate(columns):
+        records.append("COLUMN %-30s %1s %17.4f %17.4f %4d" % (
+            label, col_type, data[:, index].min(), data[:, index].max(), 1))
+    records.extend(["NDIF        1", "END", "MTZENDOFHEADERS"])
+
+    with open(file_path, 'wb') as mtz_file:
+        mtz_file.write(b'MTZ ')
+        mtz_file.write(numpy.array([header_word], byte_order + 'i4')
+                       .tobytes())
+        stamp = 0x44 if byte_order == '<' else 0x11
+        mtz_file.write(bytes([stamp, stamp, 0, 0]))
+        mtz_file.write(b'\0' * (80 - 12))
+        mtz_file.write(data.tobytes())
+        mtz_file.write(b'\0' * 4)
+        for record in records:
+            mtz_file.write(record.ljust(80).encode('ASCII'))
+
+
+def _inv_d2(hkl, cell):
+    """Return 1/d^2 for a monoclinic (beta only) cell."""
+    a, b, c, _, beta, _ = cell
+    beta = numpy.radians(beta)
+    h, k, l = hkl[:, 0], hkl[:, 1], hkl[:, 2]
+    return (h**2 / a**2 + l**2 / c**2
+            - 2 * h * l * numpy.cos(beta) / (a * c)) \
+        / numpy.sin(beta)**2 + k**2 / b**2
+
+
+COLUMNS = [('H', 'H'), ('K', 'H'), ('L', 'H'), ('FWT', 'F'), ('PHWT', 'P')]
+DATA = [
+    [1, 0, 0, 10.0, 0.0],
+    [0, 2, 0, 20.0, 90.0],
+    [1, 1, 3, 30.0, 180.0],
+    [4, 0, -2, 40.0, 270.0],
+]
+
+
+class MtzFileTest(unittest.TestCase):
+    """Test MtzFile."""
+
+    def setUp(self):
+        """Write a test MTZ file."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.mtz_path = os.path.join(self.temp_dir, "test.mtz")
+        write_mtz(self.mtz_path, COLUMNS, DATA)
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_header(self):
+        """The header is properly parsed."""
+        mtz_file = MtzFile(self.mtz_path)
+        self.assertEqual(mtz_file.space_group, "P 1 21 1")
+        self.assertEqual(mtz_file.space_group_number, 4)
+        self.assertEqual(mtz_file.cell, (30.0, 40.0, 50.0, 90.0, 95.0, 90.0))
+        self.assertEqual(mtz_file.symmetry_operators,
+                         ["X,Y,Z", "-X,Y+1/2,-Z"])
+        self.assertEqual(mtz_file.column_labels,
+                         ['H', 'K', 'L', 'FWT', 'PHWT'])
+        self.assertEqual(mtz_file.columns[3].type, 'F')
+        self.assertEqual(mtz_file.nb_reflections, 4)
+        low, high = mtz_file.resolution_range
+        self.assertGreater(low, high)
+
+    def test_columns(self):
+        """Columns are memory-mapped views on the file."""
+        mtz_file = MtzFile(self.mtz_path)
+        amplitudes = mtz_file.column('FWT')
+        numpy.testing.assert_array_equal(amplitudes, [10, 20, 30, 40])
+        self.assertIsInstance(mtz_file.data, numpy.memmap)
+        self.assertFalse(amplitudes.flags.owndata)
+        numpy.testing.assert_array_equal(
+            mtz_file.miller_indices(),
+            [[1, 0, 0], [0, 2, 0], [1, 1, 3], [4, 0, -2]])
+
+    def test_big_endian(self):
+        """Big endian files are read as well."""
+        write_mtz(self.mtz_path, COLUMNS, DATA, byte_order='>')
+        mtz_file = MtzFile(self.mtz_path)
+        numpy.testing.assert_array_equal(mtz_file.column('PHWT'),
+                                         [0, 90, 180, 270])
+
+    def test_missing_column(self):
+        """Asking for a missing column raises a KeyError."""
+        with self.assertRaises(KeyError):
+            MtzFile(self.mtz_path).column('DELFWT')
+
+    def test_not_mtz(self):
+        """A file which is not an MTZ raises a ValueError."""
+        with open(self.mtz_path, 'wb') as mtz_file:
+            mtz_file.write(b"data_5jk4\n" * 10)
+        with self.assertRaises(ValueError):
+            MtzFile(self.mtz_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
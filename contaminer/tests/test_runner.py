@@ -0,0 +1,83 @@
+"""Test contaminer.runner."""
+
+import time
+import unittest
+
+from contaminer.runner import CAPTURE_DEVNULL
+from contaminer.runner import ToolError
+from contaminer.runner import ToolNotFoundError
+from contaminer.runner import ToolRunner
+
+
+class ToolRunnerTest(unittest.TestCase):
+    """Test ToolRunner."""
+
+    def test_run_capture(self):
+        """Output of the tool is captured."""
+        result = ToolRunner().run(["cat"], stdin="hello\n")
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout, "hello\n")
+        self.assertEqual(result.stderr, "")
+
+    def test_run_devnull(self):
+        """Output of the tool is discarded."""
+        result = ToolRunner().run(["echo", "hello"], capture=CAPTURE_DEVNULL)
+        self.assertIsNone(result.stdout)
+        self.assertIsNone(result.stderr)
+
+    def test_failure(self):
+        """A non-zero return code raises a ToolError."""
+        with self.assertRaises(ToolError) as context:
+            ToolRunner().run(["sh", "-c", "echo oops >&2; exit 3"])
+        self.assertEqual(context.exception.returncode, 3)
+        self.assertIn("oops", context.exception.details())
+
+    def test_no_check(self):
+        """A non-zero return code is accepted if check is False."""
+        result = ToolRunner().run(["false"], check=False)
+        self.assertEqual(result.returncode, 1)
+
+    def test_not_found(self):
+        """A missing tool raises a ToolNotFoundError."""
+        with self.assertRaises(ToolNotFoundError):
+            ToolRunner().run(["contaminer-no-such-tool"])
+
+    def test_run_many(self):
+        """Results are returned in order, with exceptions in place."""
+        runner = ToolRunner(2)
+        outcomes = runner.run_many([
+            runner.run_async(["echo", "1"]),
+            runner.run_async(["false"]),
+            runner.run_async(["echo", "3"]),
+        ])
+        self.assertEqual(outcomes[0].stdout, "1\n")
+        self.assertIsInstance(outcomes[1], ToolError)
+        self.assertEqual(outcomes[2].stdout, "3\n")
+
+    def test_bounded_concurrency(self):
+        """No more than max_concurrent tools run at the same time."""
+        runner = ToolRunner(2)
+        start = time.perf_counter()
+        runner.run_many([
+            runner.run_async(["sleep", "0.2"])
+            for _ in range(4)
+        ])
+        duration = time.perf_counter() - start
+        self.assertGreaterEqual(duration, 0.4)
+
+    def test_call_async(self):
+        """Functions share the concurrency limit with the tools."""
+        runner = ToolRunner(1)
+        start = time.perf_counter()
+        outcomes = runner.run_many([
+            runner.call_async(time.sleep, 0.2),
+            runner.run_async(["sleep", "0.2"]),
+            runner.call_async(divmod, 7, 2),
+        ])
+        duration = time.perf_counter() - start
+        self.assertEqual(outcomes[2], (3, 1))
+        self.assertGreaterEqual(duration, 0.4)
+
+
+if __name__ == "__main__":
+    unittest.main()
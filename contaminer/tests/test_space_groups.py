@@ -0,0 +1,68 @@
+"""Test contaminer.space_groups."""
+
+import re
+import unittest
+
+from contaminer import space_groups
+
+
+def _is_symmorphic(name):
+    """Return True if the space group has no screw axis nor glide plane."""
+    return all(
+        re.fullmatch(r'-?\d|m|\d/m', symbol)
+        for symbol in name.split()[1:]
+    )
+
+
+class SpaceGroupsTest(unittest.TestCase):
+    """Test the space group table and its lookups."""
+
+    def test_all_space_groups(self):
+        """All 230 space groups are in the table."""
+        numbers = set()
+        for name in space_groups.get_space_group_names():
+            entry = space_groups._load_table()[0][name]
+            numbers.add(entry['number'])
+        self.assertEqual(numbers, set(range(1, 231)))
+
+    def test_alternatives_are_classes(self):
+        """Alternatives are symmetric, with a single symmorphic group."""
+        for name in space_groups.get_space_group_names():
+            alternatives = space_groups.get_alt_space_groups(name)
+            self.assertEqual(alternatives[0], name)
+            self.assertEqual(
+                len([item for item in alternatives if _is_symmorphic(item)]),
+                1,
+                name)
+            for alternative in alternatives:
+                self.assertEqual(
+                    set(space_groups.get_alt_space_groups(alternative)),
+                    set(alternatives))
+
+    def test_get_alt_space_groups(self):
+        """Return expected alternate space groups."""
+        self.assertListEqual(
+            space_groups.get_alt_space_groups("P 1 21 1"),
+            ['P 1 21 1', 'P 1 2 1'])
+        self.assertEqual(
+            len(space_groups.get_alt_space_groups("P 21 21 21")), 8)
+        self.assertListEqual(
+            space_groups.get_alt_space_groups("P 31 2 1"),
+            ['P 31 2 1', 'P 3 2 1', 'P 32 2 1'])
+
+    def test_normalize_space_group(self):
+        """Short names, names without spaces and numbers are accepted."""
+        for space_group in ["P 21", "P21", "p 1 21 1", 4, "4"]:
+            self.assertEqual(
+                space_groups.normalize_space_group(space_group),
+                "P 1 21 1")
+        self.assertEqual(space_groups.normalize_space_group("R 3:H"), "H 3")
+
+    def test_unknown_space_group(self):
+        """An unknown space group raises a ValueError."""
+        with self.assertRaises(ValueError):
+            space_groups.get_alt_space_groups("P 7")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Test contaminer.summary."""
+
+import random
+import unittest
+
+from contaminer.summary import summarize_jobs
+
+
+def _make_job(model_name, status, percent=None, q_factor=None, rank=0):
+    """Return a job, with results if it is complete."""
+    return {
+        'infos': {'model_name': model_name, 'is_AF_model': False,
+                  'is_custom_model': False},
+        'args': {'rank': rank},
+        'results': {'percent': percent, 'q_factor': q_factor}
+        if status == "complete" else None,
+        'status': status
+    }
+
+
+def _get_best_task(tasks):
+    """Pairwise selection of the best task, as show-job used to do."""
+    best_task = None
+    for task in tasks:
+        if task['status'] != 'complete':
+            continue
+        if best_task is None:
+            best_task = task
+            continue
+        results = task['results']
+        best_results = best_task['results']
+        if results['percent'] > best_results['percent']:
+            best_task = task
+        elif results['percent'] == best_results['percent'] \
+                and results['q_factor'] > best_results['q_factor']:
+            best_task = task
+    return best_task
+
+
+class SummarizeJobsTest(unittest.TestCase):
+    """Test summarize_jobs."""
+
+    def test_summary(self):
+        """Status, best task and aggregates of each contaminant."""
+        jobs = [
+            _make_job("B", "complete", 10.0, 0.5, 0),
+            _make_job("A", "new", rank=1),
+            _make_job("B", "complete", 95.0, 0.3, 2),
+            _make_job("B", "complete", 95.0, 0.7, 3),
+            _make_job("A", "skipped", rank=4),
+            _make_job("C", "complete", 0.0, 0.0, 5),
+            _make_job("C", "skipped", rank=6),
+            _make_job("B", "complete", 95.0, 0.7, 7),
+            _make_job("D", "failed", rank=8),
+            _make_job("D", "complete", 50.0, 0.1, 9),
+        ]
+        summary = summarize_jobs(jobs, top_k=3)
+
+        self.assertEqual(
+            [task['infos']['model_name'] for task in summary],
+            ["B", "A", "C", "D"])
+        self.assertEqual(
+            [task['status'] for task in summary],
+            ["complete", "running", "skipped", "failed"])
+        self.assertEqual(
+            [task['args_for_best'] for task in summary],
+            [{'rank': 3}, None, {'rank': 5}, {'rank': 9}])
+        self.assertEqual(
+            [[top['args']['rank'] for top in task['top']]
+             for task in summary],
+            [[3, 7, 2], [], [5], [9]])
+        self.assertEqual(
+            [(task['nb_tasks'], task['complete_fraction'])
+             for task in summary],
+            [(4, 1.0), (2, 0.0), (2, 0.5), (2, 0.5)])
+        self.assertEqual(summarize_jobs([]), [])
+
+    def test_same_as_pairwise(self):
+        """The best tasks are the ones of the pairwise comparison."""
+        rand = random.Random(0)
+        jobs = [
+            _make_job("M%s" % rand.randrange(20),
+                      rand.choice(["complete", "complete", "new"]),
+                      float(rand.randrange(5)), float(rand.randrange(3)),
+                      rank)
+            for rank in range(500)
+        ]
+        for task in summarize_jobs(jobs):
+            model_jobs = [job for job in jobs if job['infos']['model_name']
+                          == task['infos']['model_name']]
+            best_task = _get_best_task(model_jobs)
+            self.assertEqual(task['args_for_best'],
+                             best_task['args'] if best_task else None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Test contaminer.work_queue."""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from contaminer import work_queue
+
+
+def _claim_all(prep_dir):
+    """Claim tasks until the queue is empty, and return their ranks."""
+    queue = work_queue.WorkQueue(prep_dir, claim_timeout=60)
+    ranks = []
+    claim_path = queue.claim()
+    while claim_path is not None:
+        ranks.append(queue.get_rank(claim_path))
+        queue.release(claim_path)
+        claim_path = queue.claim()
+    return ranks
+
+
+class WorkQueueTest(unittest.TestCase):
+    """Test WorkQueue."""
+
+    def setUp(self):
+        self.prep_dir = tempfile.mkdtemp()
+        self.queue = work_queue.WorkQueue(self.prep_dir, claim_timeout=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.prep_dir)
+
+    def _list(self, state):
+        return sorted(os.listdir(os.path.join(self.prep_dir, "queue", state)))
+
+    def test_claim_order(self):
+        """Tasks are claimed in the order of their ranks, only once."""
+        self.queue.populate([2, 0, 11])
+        claim_path = self.queue.claim()
+        self.assertEqual(self.queue.get_rank(claim_path), 0)
+        self.queue.release(claim_path)
+
+        self.queue.populate(range(12))
+        self.assertEqual(len(self._list("todo")), 11)
+        self.assertEqual(_claim_all(self.prep_dir), list(range(1, 12)))
+        self.assertIsNone(self.queue.claim())
+
+    def test_concurrent_claims(self):
+        """Workers claiming at the same time never get the same task."""
+        self.queue.populate(range(200))
+        with ProcessPoolExecutor(4) as executor:
+            ranks = list(executor.map(_claim_all, [self.prep_dir] * 4))
+        self.assertEqual(sorted(sum(ranks, [])), list(range(200)))
+        self.assertEqual(len(self._list("done")), 200)
+
+    def test_recover(self):
+        """Claims of dead or silent workers go back to the queue."""
+        self.queue.populate(range(3))
+        claimed_dir = os.path.join(self.prep_dir, "queue", "claimed")
+        todo_dir = os.path.join(self.prep_dir, "queue", "todo")
+
+        # Dead worker on this host.
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0)
+        os.waitpid(pid, 0)
+        os.rename(os.path.join(todo_dir, "000000"),
+                  os.path.join(claimed_dir, "000000@%s@%s"
+                               % (self.queue.host, pid)))
+        # Silent worker on another host.
+        silent_path = os.path.join(claimed_dir, "000001@other-host@1")
+        os.rename(os.path.join(todo_dir, "000001"), silent_path)
+        # Live worker.
+        live_path = self.queue.claim()
+
+        self.assertEqual(self.queue.recover(), 1)
+        self.assertEqual(self._list("todo"), ["000000"])
+
+        # The live worker touches its claim, the silent one does not.
+        self.queue.claim_timeout = 0.2
+        time.sleep(0.3)
+        os.utime(live_path)
+        self.assertEqual(self.queue.recover(), 1)
+        self.assertEqual(self._list("todo"), ["000000", "000001"])
+        self.assertTrue(os.path.exists(live_path))
+
+    def test_work(self):
+        """All tasks run, failed ones are kept apart."""
+        self.queue.populate(range(5))
+        ran = []
+
+        def run_task(rank):
+            ran.append(rank)
+            if rank == 3:
+                raise RuntimeError("morda_solve failed.")
+
+        self.assertEqual(self.queue.work(run_task), (5, 1))
+        self.assertEqual(ran, list(range(5)))
+        self.assertEqual(self._list("done"),
+                         ["000000", "000001", "000002", "000004"])
+        self.assertEqual(self._list("failed"), ["000003"])
+        self.assertEqual(self._list("claimed"), [])
+
+    def test_work_recovers(self):
+        """Workers run the stale claims, and do not wait for live ones."""
+        self.queue.populate(range(3))
+        claimed_dir = os.path.join(self.prep_dir, "queue", "claimed")
+        todo_dir = os.path.join(self.prep_dir, "queue", "todo")
+
+        # Dead worker on this host, live worker on another host.
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0)
+        os.waitpid(pid, 0)
+        os.rename(os.path.join(todo_dir, "000001"),
+                  os.path.join(claimed_dir, "000001@%s@%s"
+                               % (self.queue.host, pid)))
+        os.rename(os.path.join(todo_dir, "000002"),
+                  os.path.join(claimed_dir, "000002@other-host@2"))
+        ran = []
+
+        start = time.time()
+        self.assertEqual(self.queue.work(ran.append), (2, 0))
+        self.assertLess(time.time() - start, self.queue.claim_timeout / 4)
+        self.assertEqual(ran, [0, 1])
+        self.assertEqual(self._list("done"), ["000000", "000001"])
+        self.assertEqual(self._list("claimed"), ["000002@other-host@2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
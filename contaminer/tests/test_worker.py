@@ -0,0 +1,92 @@
+"""Test contaminer.worker."""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import contaminer
+from contaminer import worker
+
+# Import time of contaminer.worker, in milliseconds. Importing Biopython or
+# NumPy alone is above this budget on a usual node.
+STARTUP_BUDGET_MS = 250
+# Modules which must not be imported to run the tasks.
+HEAVY_MODULES = ("argh", "Bio", "numpy", "sqlite3", "yaml")
+# Only needed to generate the jobs.
+SOLVE_MODULES = ("analysis_cache", "contabase_index", "hit_rates", "mmcif",
+                 "space_groups")
+
+
+def _run_python(arguments, home_dir):
+    """Run Python in a new process, and return its stdout and stderr."""
+    # The tests may run from another directory, with contaminer not installed.
+    root_dir = os.path.dirname(os.path.dirname(contaminer.__file__))
+    python_path = root_dir
+    if os.environ.get('PYTHONPATH'):
+        python_path += os.pathsep + os.environ['PYTHONPATH']
+    process = subprocess.run(
+        [sys.executable] + arguments,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+        universal_newlines=True,
+        env=dict(os.environ, HOME=home_dir, PYTHONPATH=python_path))
+    return process.stdout, process.stderr
+
+
+class WorkerTest(unittest.TestCase):
+    """Test the worker entry point."""
+
+    def setUp(self):
+        self.home_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.home_dir.cleanup()
+
+    def test_no_heavy_import(self):
+        """The worker imports no heavy module, and does not read config."""
+        stdout, _ = _run_python(
+            ["-c", "import sys; import contaminer.worker; "
+             "from contaminer import config; "
+             "print('CONFIG' in vars(config)); "
+             "print(' '.join(sorted(sys.modules)))"],
+            self.home_dir.name)
+        config_loaded, modules = stdout.splitlines()
+        self.assertEqual(config_loaded, "False")
+        self.assertFalse(os.path.exists(
+            os.path.join(self.home_dir.name, ".contaminer")))
+
+        packages = set(name.split(".")[0] for name in modules.split())
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, packages)
+        for module in SOLVE_MODULES:
+            self.assertNotIn("contaminer." + module, modules.split())
+
+    def test_startup_budget(self):
+        """The worker imports within the startup budget."""
+        timings = []
+        for _ in range(3):
+            _, stderr = _run_python(
+                ["-X", "importtime", "-c", "import contaminer.worker"],
+                self.home_dir.name)
+            for line in stderr.splitlines():
+                fields = line.split("|")
+                if fields[-1].strip() == "contaminer.worker":
+                    timings.append(int(fields[1]) / 1000)
+        self.assertLess(min(timings), STARTUP_BUDGET_MS)
+
+    @mock.patch.object(worker, 'solve_task')
+    @mock.patch.object(worker, 'solve_chunk')
+    def test_main(self, solve_chunk, solve_task):
+        """Commands are parsed as by the contaminer script."""
+        worker.main(["solve-task", "prep", "3"])
+        solve_task.assert_called_once_with("prep", 3)
+
+        worker.main(["solve-chunk", "-s", "8", "-l", "contiguous", "prep",
+                     "2"])
+        solve_chunk.assert_called_once_with("prep", 2, 8, "contiguous")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,250 @@
+"""
+Share the tasks of a job between long-lived workers.
+
+With static ranks, each element of the scheduler array runs the task of its
+rank, so the tasks cannot be rebalanced between nodes. In queue mode
+(queue_workers in the configuration), a few workers are submitted instead,
+and each of them claims the next task until the queue is empty.
+
+The queue is a directory of the prep directory, on the shared filesystem:
+
+    queue/todo/<rank>                   tasks to run
+    queue/claimed/<rank>@<host>@<pid>   tasks running in a worker
+    queue/done/<rank>                   tasks ended successfully
+    queue/failed/<rank>                 tasks ended with an error
+
+A task is claimed by renaming its file from todo to claimed, which is atomic:
+when two workers try to claim the same task, only one rename succeeds. While
+the task runs, the worker touches its claim periodically. A claim is stale
+when its worker is known to be dead (same host, no such process), or when it
+has not been touched for claim_timeout seconds. Stale claims are put back in
+todo by the workers before each claim, and by solve-status. Workers exit as
+soon as todo is empty, rather than holding their allocation until the
+longest task ends: the task of a worker dying after the last worker exited
+is put back in todo by solve-status, and run by a new solve-worker.
+
+Classes
+-------
+WorkQueue
+    Claim the tasks of a prep directory, one at a time.
+
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+
+from contaminer import config
+
+LOG = logging.getLogger(__name__)
+
+QUEUE_DIR = "queue"
+TODO = "todo"
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+# Separator of the fields in the name of a claim.
+CLAIM_SEPARATOR = "@"
+
+
+def _is_alive(pid):
+    """Return True if a process with this pid runs on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # Exists, but belongs to another user.
+        return True
+    return True
+
+
+class WorkQueue():
+    """
+    Claim the tasks of a prep directory, one at a time.
+
+    Attributes
+    ----------
+    prep_dir: string
+        The directory generated during the prepare step.
+
+    claim_timeout: float
+        Seconds after which a claim which has not been touched is stale.
+
+    """
+
+    def __init__(self, prep_dir, claim_timeout=None):
+        self.prep_dir = os.path.abspath(prep_dir)
+        if claim_timeout is None:
+            claim_timeout = config.CLAIM_TIMEOUT
+        self.claim_timeout = claim_timeout
+        self.host = socket.gethostname()
+
+    def _get_dir(self, state):
+        """Return the directory of the tasks in state."""
+        return os.path.join(self.prep_dir, QUEUE_DIR, state)
+
+    @staticmethod
+    def _get_task_name(rank):
+        """Return the file name of a task. Sorted names keep ranks order."""
+        return "%06d" % rank
+
+    def populate(self, ranks):
+        """
+        Add tasks to the queue.
+
+        Tasks already in the queue, whatever their state, are not added again.
+
+        Parameters
+        ----------
+        ranks: list(integer)
+            The ranks of the tasks to add.
+
+        """
+        for state in (TODO, CLAIMED, DONE, FAILED):
+            os.makedirs(self._get_dir(state), exist_ok=True)
+
+        known = set()
+        for state in (TODO, CLAIMED, DONE, FAILED):
+            known.update(name.split(CLAIM_SEPARATOR)[0]
+                         for name in os.listdir(self._get_dir(state)))
+        for rank in ranks:
+            task_name = self._get_task_name(rank)
+            if task_name not in known:
+                with open(os.path.join(self._get_dir(TODO), task_name), 'w'):
+                    pass
+        LOG.debug("Queue populated with %s tasks.", len(ranks))
+
+    def claim(self):
+        """
+        Claim the next task of the queue.
+
+        Return
+        ------
+        string
+            The path to the claim, or None if the queue is empty.
+
+        """
+        todo_dir = self._get_dir(TODO)
+        claim_suffix = CLAIM_SEPARATOR.join(["", self.host, str(os.getpid())])
+        for task_name in sorted(os.listdir(todo_dir)):
+            claim_path = os.path.join(self._get_dir(CLAIMED),
+                                      task_name + claim_suffix)
+            try:
+                os.rename(os.path.join(todo_dir, task_name), claim_path)
+            except FileNotFoundError:  # Claimed by another worker.
+                continue
+            os.utime(claim_path)
+            LOG.debug("Claimed task %s.", task_name)
+            return claim_path
+        return None
+
+    @staticmethod
+    def get_rank(claim_path):
+        """Return the rank of the task of a claim."""
+        return int(os.path.basename(claim_path).split(CLAIM_SEPARATOR)[0])
+
+    def release(self, claim_path, success=True):
+        """Move a claimed task to done, or to failed."""
+        task_name = os.path.basename(claim_path).split(CLAIM_SEPARATOR)[0]
+        destination = self._get_dir(DONE if success else FAILED)
+        try:
+            os.rename(claim_path, os.path.join(destination, task_name))
+        except FileNotFoundError:
+            # Considered stale and put back in the queue meanwhile.
+            LOG.warning("Claim of task %s lost.", task_name)
+
+    def _is_stale(self, claim_path):
+        """Return True if the worker of a claim is dead or silent."""
+        _, host, pid = os.path.basename(claim_path).split(CLAIM_SEPARATOR)
+        if host == self.host and not _is_alive(int(pid)):
+            return True
+        stat = os.stat(claim_path)
+        # rename and utime both update ctime, unlike mtime for rename.
+        last_seen = max(stat.st_mtime, stat.st_ctime)
+        return time.time() - last_seen > self.claim_timeout
+
+    def recover(self):
+        """
+        Put the stale claims back in the queue.
+
+        Return
+        ------
+        integer
+            The number of recovered tasks.
+
+        """
+        claimed_dir = self._get_dir(CLAIMED)
+        nb_recovered = 0
+        for claim_name in os.listdir(claimed_dir):
+            claim_path = os.path.join(claimed_dir, claim_name)
+            try:
+                if not self._is_stale(claim_path):
+                    continue
+                task_name = claim_name.split(CLAIM_SEPARATOR)[0]
+                os.rename(claim_path,
+                          os.path.join(self._get_dir(TODO), task_name))
+            except FileNotFoundError:  # Released or recovered meanwhile.
+                continue
+            LOG.warning("Recovered stale claim %s.", claim_name)
+            nb_recovered += 1
+        return nb_recovered
+
+    def _heartbeat(self, claim_path, stop):
+        """Touch a claim until stop is set."""
+        while not stop.wait(self.claim_timeout / 4):
+            try:
+                os.utime(claim_path)
+            except FileNotFoundError:
+                return
+
+    def work(self, run_task):
+        """
+        Run tasks until no task is left to run.
+
+        The stale claims are recovered before each claim, so the tasks of
+        dead workers are run again while the queue is not empty. The worker
+        does not wait for the tasks claimed by the other workers.
+
+        Parameters
+        ----------
+        run_task: callable
+            Called with the rank of each claimed task. The task fails if it
+            raises an Exception.
+
+        Return
+        ------
+        tuple(integer, integer)
+            The number of tasks run, and the number of failed tasks.
+
+        """
+        nb_run = 0
+        nb_failed = 0
+        while True:
+            self.recover()
+            claim_path = self.claim()
+            if claim_path is None:
+                break
+
+            rank = self.get_rank(claim_path)
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat,
+                                         args=(claim_path, stop),
+                                         daemon=True)
+            heartbeat.start()
+            try:
+                run_task(rank)
+                success = True
+            except Exception as err:  # pylint: disable=broad-except
+                LOG.error("Task %s failed: %s", rank, err)
+                success = False
+            finally:
+                stop.set()
+                heartbeat.join()
+            self.release(claim_path, success)
+            nb_run += 1
+            nb_failed += int(not success)
+
+        LOG.info("Queue done: %s tasks run, %s failed.", nb_run, nb_failed)
+        return nb_run, nb_failed
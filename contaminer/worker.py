@@ -0,0 +1,178 @@
+"""
+Run the solving tasks, with a fast startup.
+
+A job starts a new process for each element of the scheduler array, so the
+startup time of `contaminer solve-task` is paid thousands of times. The
+contaminer script runs the commands of this module before importing argh and
+the other commands, and this module only imports what the tasks need:
+Biopython, NumPy, SQLite, YAML and the job generation helpers are imported by
+the functions needing them, and the user config file is read on the first
+access to a setting (see contaminer.config).
+
+The module can also be run directly:
+    python -m contaminer.worker solve-task <prep_dir> <rank>
+
+Functions
+---------
+solve_task
+    Run the morda_solve process of a rank.
+
+solve_chunk
+    Run the morda_solve processes of a chunk of ranks.
+
+solve_worker
+    Run the tasks of the queue of a prep directory until it is empty.
+
+main
+    Parse the command line and run a worker command.
+
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from contaminer import config
+from contaminer.args_manager import CHUNK_CONTIGUOUS
+from contaminer.args_manager import CHUNK_STRIDED
+from contaminer.args_manager import TasksManager
+from contaminer.args_manager import get_chunk_ranks
+from contaminer.args_manager import get_tasks_path
+from contaminer.work_queue import WorkQueue
+
+LOG = logging.getLogger(__name__)
+
+# Commands of the contaminer script run by this module.
+COMMANDS = ("solve-task", "solve-chunk", "solve-worker")
+
+
+def solve_task(prep_dir, rank):
+    """
+    Run the morda_solve processes for the given arguments file.
+
+    Parameters
+    ----------
+    prep_dir: string
+        Path to the directory generated during the prepare step.
+
+    rank: integer
+        Rank of the process to run.
+
+    """
+    task_manager = TasksManager()
+    task_manager.run(prep_dir, rank)
+
+
+def solve_worker(prep_dir, worker):
+    """
+    Run the tasks of the queue of prep_dir until it is empty.
+
+    Parameters
+    ----------
+    prep_dir: string
+        Path to the directory generated during the prepare step.
+
+    worker: integer
+        Index of the worker in the scheduler array, only used in the logs.
+
+    """
+    prep_dir = os.path.abspath(prep_dir)
+    task_manager = TasksManager()
+
+    LOG.info("Worker %s starts on %s.", worker, prep_dir)
+    _, nb_failed = WorkQueue(prep_dir).work(
+        lambda rank: task_manager.run(prep_dir, rank))
+    if nb_failed:
+        raise RuntimeError("%s tasks failed in worker %s."
+                           % (nb_failed, worker))
+
+
+def solve_chunk(prep_dir, chunk, chunk_size, layout=CHUNK_STRIDED):
+    """
+    Run the morda_solve processes of a chunk of ranks.
+
+    The ranks run in a pool of local processes, sized to the CPUs available
+    to this process (or cpus_per_task if set).
+
+    Parameters
+    ----------
+    prep_dir: string
+        Path to the directory generated during the prepare step.
+
+    chunk: integer
+        Index of the chunk to run.
+
+    chunk_size: integer
+        Number of ranks per chunk.
+
+    layout: string
+        Layout of the ranks in the chunks, "strided" or "contiguous".
+
+    """
+    prep_dir = os.path.abspath(prep_dir)
+    task_manager = TasksManager()
+    task_manager.load(get_tasks_path(prep_dir))
+    ranks = get_chunk_ranks(task_manager.nb_jobs, chunk, chunk_size, layout)
+    task_manager.run_chunk(
+        prep_dir,
+        ranks,
+        config.CPUS_PER_TASK or None)
+
+
+def _get_parser():
+    """Return the parser of the worker commands."""
+    parser = argparse.ArgumentParser(prog="contaminer")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    task_parser = commands.add_parser(
+        "solve-task", help="Run the solving task.")
+    task_parser.add_argument(
+        'prep_dir', help="Directory created by contaminer solve.")
+    task_parser.add_argument(
+        'rank', type=int, help="Rank of the process to run.")
+
+    chunk_parser = commands.add_parser(
+        "solve-chunk", help="Run the solving tasks of a chunk in parallel.")
+    chunk_parser.add_argument(
+        'prep_dir', help="Directory created by contaminer solve.")
+    chunk_parser.add_argument(
+        'chunk', type=int, help="Index of the chunk to run.")
+    chunk_parser.add_argument(
+        '-s', '--chunk-size', type=int, required=True,
+        help="Number of tasks per chunk.")
+    chunk_parser.add_argument(
+        '-l', '--layout', choices=[CHUNK_STRIDED, CHUNK_CONTIGUOUS],
+        default=CHUNK_STRIDED, help="Layout of the tasks in the chunks.")
+
+    worker_parser = commands.add_parser(
+        "solve-worker",
+        help="Run the solving tasks of the queue until it is empty.")
+    worker_parser.add_argument(
+        'prep_dir', help="Directory created by contaminer solve.")
+    worker_parser.add_argument(
+        'worker', type=int, help="Index of the worker.")
+    return parser
+
+
+def main(argv=None):
+    """
+    Parse the command line and run a worker command.
+
+    Parameters
+    ----------
+    argv: list(string)
+        The command and its arguments. Default is sys.argv[1:].
+
+    """
+    args = _get_parser().parse_args(argv)
+    if args.command == "solve-task":
+        solve_task(args.prep_dir, args.rank)
+    elif args.command == "solve-chunk":
+        solve_chunk(args.prep_dir, args.chunk, args.chunk_size, args.layout)
+    else:
+        solve_worker(args.prep_dir, args.worker)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
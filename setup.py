@@ -18,6 +18,7 @@ setup(name='contaminer',
       package_data={
           "contaminer.data": [
               "contabase.yaml",
+              "space_groups.json",
               "job_template.sh",
               "job_template.sbatch"
           ]